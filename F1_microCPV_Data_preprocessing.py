@@ -0,0 +1,22 @@
+# Fichero de Preprocesado de Datos.
+
+from cpvdata import (read_insolight_preseries, read_geonica,
+                     join_insolight_geonica, write_measurements)
+
+# Las medidas de Insolight se registran en CET y las meteorológicas en UTC.
+insolight = read_insolight_preseries(
+        'C:\\Users\\Marcos\\Desktop\\datos modelado\\Insolight Preseries outdoor monitoring - IES rooftop - UPM.txt',
+        tz=1)
+
+geonica = read_geonica(
+        'C:\\Users\\Marcos\\Desktop\\datos modelado\\geonica2018.txt',
+        tz='UTC')
+
+# Se unen los archivos de datos funcionales y meteorológicos.
+complete_measurements = join_insolight_geonica(insolight, geonica,
+                                               tolerance='0s')
+
+# Se exportan los datos unidos.
+write_measurements(complete_measurements,
+                   'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_data.txt',
+                   'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_datestr.txt')
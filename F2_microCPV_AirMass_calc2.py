@@ -2,47 +2,29 @@
 
 import numpy as np
 import pvlib
-import datetime
 
-data = np.loadtxt(
-        'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_data_may.txt', 
-        delimiter = ',')
-
-datetimestring = np.genfromtxt(
-        'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_datestr_may.txt', 
-        dtype='str', delimiter = '\n')
+from cpvdata import MeasurementTable, read_datestr
 
-datetimeobject = []
-for i in range(len(datetimestring)):
-    datetimeobject.append(datetime.datetime.strptime(datetimestring[i], 
-                                                     '%d-%b-%Y %H:%M:%S'))
-    
+data = MeasurementTable.from_file(
+        'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_data_may.txt', 
+        schema='insolight_may')
 
 panel_location = pvlib.location.Location(latitude=40.453,longitude=-3.727, 
                                          tz=1, altitude=658)
 
+# Fechas sin zona horaria, que pvlib toma como UTC
+datetimeobject = read_datestr(
+        'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_datestr_may.txt')
+
 Airmass = panel_location.get_airmass(times=datetimeobject)
 
 Solar_pos = panel_location.get_solarposition(times=datetimeobject, 
                                              pressure=None, 
-                                             temperature=data[:,6])
-
-airmass_array = np.array(Airmass['airmass_relative'])
-zenith_array = np.array(Solar_pos['zenith'])
-azimuth_array = np.array(Solar_pos['azimuth'])
-
-relative_airmass = np.zeros((len(airmass_array),1))
-zenith_array_aux = np.zeros((len(zenith_array),1))
-azimuth_array_aux = np.zeros((len(azimuth_array),1))
-
-for i in range(len(airmass_array)):
-    relative_airmass[i,0] = airmass_array[i]
-    zenith_array_aux[i,0] = zenith_array[i]
-    azimuth_array_aux[i,0] = azimuth_array[i]
+                                             temperature=data['temp_air'])
 
-data = np.append(data, relative_airmass, 1)
-data = np.append(data, zenith_array_aux, 1)
-data = np.append(data, azimuth_array_aux, 1)
+data['airmass'] = Airmass['airmass_relative']
+data['zenith'] = Solar_pos['zenith']
+data['azimuth'] = Solar_pos['azimuth']
 
 np.savetxt(fname='C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_data_complete_may.txt', 
-           X=data, delimiter=',', fmt='%.10f')
+           X=data.values, delimiter=',', fmt='%.10f')
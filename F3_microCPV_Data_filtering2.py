@@ -0,0 +1,18 @@
+# Fichero de Filtrado de Datos.
+
+from cpvdata import MeasurementTable, filter_measurements, write_measurements
+
+data = MeasurementTable.from_file(
+        'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_data_complete_may.txt', 
+        schema='insolight_may')
+
+# Filtrado de Datos: SMR, DNI, velocidad del viento, Masa de Aire, Isc y 
+# azimut (ver FILTER_PRESETS).
+filtered_data, rejections = filter_measurements(data, 'insolight_may')
+
+for rule, count in rejections.items():
+    print('{}: {} medidas rechazadas'.format(rule, count))
+
+# Se exportan los datos filtrados completos.
+write_measurements(filtered_data, 
+                   'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_data_filtered_complete_may.txt')
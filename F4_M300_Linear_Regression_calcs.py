@@ -1,23 +1,24 @@
-# Carga y Procesado de Datos sin influencia de la Temperatura Ambiente
+# Carga de los Datos filtrados junto a la Masa de Aire
 
-nontemp_data = np.loadtxt('C:\\Users\\Marcos\\Desktop\\datos modelado\\nontemp_measurements.txt', 
-                          delimiter = ',')
+from cpvdata import MeasurementTable, STRATUM_PRESETS, get_stratum_mask
 
-nontemp_IscDNI = nontemp_data[:, 25]
-nontemp_airmass = nontemp_data[:, 33]
+data = MeasurementTable.from_file(
+        'C:\\Users\\Marcos\\Desktop\\datos modelado\\m300_data_filtered_complete.txt', 
+        schema='m300')
 
-import statistics as stats
+# Procesado de Datos sin influencia de la Temperatura Ambiente
 
-IscDNI_medians = []
-Airmass_aux = []
-for i in np.arange(1,2.8,0.1):
-    array_aux1 = []
-    for j in range(len(nontemp_IscDNI)):
-        if nontemp_airmass[j] > i-0.05 and nontemp_airmass[j] < i+0.05:
-            array_aux1.append(nontemp_IscDNI[j])
-    if len(array_aux1) > 0:
-        IscDNI_medians.append(stats.median(array_aux1))
-        Airmass_aux.append(i)
+nontemp_mask, _ = get_stratum_mask(data, 
+                                   STRATUM_PRESETS['m300']['nontemp'])
+nontemp_data = data.select(nontemp_mask)
+
+nontemp_IscDNI = nontemp_data['i_sc_dni']
+nontemp_airmass = nontemp_data['airmass']
+
+Airmass_aux, IscDNI_medians = calc_binned_stat(nontemp_airmass, 
+                                                nontemp_IscDNI, 
+                                                bin_width=0.1, start=1, 
+                                                stop=2.8)
 
 m_low, n_low, m_high, n_high, thld = calc_uf_lines(Airmass_aux, IscDNI_medians)
 
@@ -35,21 +36,22 @@ plt.title('Análisis de Isc/DNI en función de la Masa de Aire')
 plt.savefig("grafica1.png", dpi=300)
 
 IscDNI_ast = 3.346/1000
-uf_am = get_simple_util_factor(airmass_array, thld, m_low/IscDNI_ast, 
+uf_am = get_simple_util_factor(data['airmass'], thld, m_low/IscDNI_ast, 
                                m_high/IscDNI_ast)
 
-# Carga y Procesado de Datos sin influencia de la Masa de Aire
+# Procesado de Datos sin influencia de la Masa de Aire
 
-nonairmass_data = np.loadtxt('C:\\Users\\Marcos\\Desktop\\datos modelado\\nonairmass_measurements.txt', 
-                             delimiter = ',')
+nonairmass_mask, _ = get_stratum_mask(data, 
+                                      STRATUM_PRESETS['m300']['nonairmass'])
+nonairmass_data = data.select(nonairmass_mask)
 
-nonairmass_IscDNI = nonairmass_data[:, 25]
-nonairmass_temp = nonairmass_data[:, 10]
+nonairmass_IscDNI = nonairmass_data['i_sc_dni']
+nonairmass_temp = nonairmass_data['temp_air']
 m_low, n_low, m_high, n_high, thld = calc_uf_lines(nonairmass_temp, 
                                                    nonairmass_IscDNI,
                                                    'temp_air')
 
-AmbientTemp = data[:,10]
+AmbientTemp = data['temp_air']
 
 uf_at = get_simple_util_factor(AmbientTemp, thld, m_low/IscDNI_ast, 
                                m_high/IscDNI_ast)
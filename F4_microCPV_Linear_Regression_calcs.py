@@ -1,27 +1,22 @@
 # Carga y Procesado de Datos sin influencia de la Temperatura Ambiente
 
-filt_data = np.loadtxt(
-        'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_data_filtered_complete.txt', 
-        delimiter = ',')
+from cpvdata import MeasurementTable, STRATUM_PRESETS, get_stratum_mask
 
-nontemp_data = np.loadtxt('C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_nontemp_measurements.txt', 
-                          delimiter = ',')
+filt_data = MeasurementTable.from_file(
+        'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_data_filtered_complete.txt', 
+        schema='insolight')
 
-nontemp_IscDNI = np.divide(nontemp_data[:,5],nontemp_data[:,14])
-nontemp_airmass = nontemp_data[:, 24]
+nontemp_mask, _ = get_stratum_mask(filt_data, 
+                                   STRATUM_PRESETS['insolight']['nontemp'])
+nontemp_data = filt_data.select(nontemp_mask)
 
-import statistics as stats
+nontemp_IscDNI = np.divide(nontemp_data['i_sc'],nontemp_data['dni'])
+nontemp_airmass = nontemp_data['airmass']
 
-IscDNI_medians = []
-Airmass_aux = []
-for i in np.arange(2,5.0,0.1):
-    array_aux1 = []
-    for j in range(len(nontemp_IscDNI)):
-        if nontemp_airmass[j] > i-0.05 and nontemp_airmass[j] < i+0.05:
-            array_aux1.append(nontemp_IscDNI[j])
-    if len(array_aux1) > 0:
-        IscDNI_medians.append(stats.median(array_aux1))
-        Airmass_aux.append(i)
+Airmass_aux, IscDNI_medians = calc_binned_stat(nontemp_airmass, 
+                                                nontemp_IscDNI, 
+                                                bin_width=0.1, start=2, 
+                                                stop=5.0)
 
 m_low, n_low, m_high, n_high, thld = calc_uf_lines(Airmass_aux, IscDNI_medians, 
                                                    limit=4.0)
@@ -39,24 +34,25 @@ plt.ylabel('Isc/DNI (A/(W/m2))')
 plt.title('Análisis de Isc/DNI en función de la Masa de Aire')
 plt.savefig("grafica1.png", dpi=300)
 
-Airmass_filt = filt_data[:, 24]
+Airmass_filt = filt_data['airmass']
 
 IscDNI_ast = 0.96/1000
 uf_am = get_simple_util_factor(Airmass_filt, thld, m_low/IscDNI_ast, 
                                m_high/IscDNI_ast)
 
-# Carga y Procesado de Datos sin influencia de la Masa de Aire
+# Procesado de Datos sin influencia de la Masa de Aire
 
-nonairmass_data = np.loadtxt('C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_nonairmass_measurements.txt', 
-                             delimiter = ',')
+nonairmass_mask, _ = get_stratum_mask(filt_data, 
+                                      STRATUM_PRESETS['insolight']['nonairmass'])
+nonairmass_data = filt_data.select(nonairmass_mask)
 
-nonairmass_IscDNI = np.divide(nonairmass_data[:,5],nonairmass_data[:,14])
-nonairmass_temp = nonairmass_data[:, 8]
+nonairmass_IscDNI = np.divide(nonairmass_data['i_sc'],nonairmass_data['dni'])
+nonairmass_temp = nonairmass_data['temp_air']
 m_low, n_low, m_high, n_high, thld = calc_uf_lines(nonairmass_temp, 
                                                    nonairmass_IscDNI,
                                                    'temp_air')
 
-AmbientTemp = filt_data[:,8]
+AmbientTemp = filt_data['temp_air']
 
 uf_at = get_simple_util_factor(AmbientTemp, thld, m_low/IscDNI_ast, 
                                m_high/IscDNI_ast)
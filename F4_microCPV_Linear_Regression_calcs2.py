@@ -1,12 +1,15 @@
 # Carga y Procesado de Datos
 
-filt_data = np.loadtxt('C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_data_filtered_complete_may.txt', 
-                          delimiter = ',')
+from cpvdata import MeasurementTable
 
-IscDII = np.divide(filt_data[:,12],filt_data[:,9])
-Pmp = filt_data[:, 15]
-zenith = filt_data[:, 18]
-azimuth = filt_data[:, 19]
+filt_data = MeasurementTable.from_file(
+        'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_data_filtered_complete_may.txt', 
+        schema='insolight_may')
+
+IscDII = np.divide(filt_data['i_sc'],filt_data['dii'])
+Pmp = filt_data['p_mp']
+zenith = filt_data['zenith']
+azimuth = filt_data['azimuth']
 
 
 # Se calcula el AOI y su UF
@@ -13,13 +13,13 @@ csys = CPVSystem(module=None, module_parameters=module_params,
                  racking_model='freestanding',
                  losses_parameters=None, name=None)
 
-GNI = data[:, 17]
-AmbientTemp = data[:, 10]
-WindSpeed = data[:, 8]
+GNI = data['gni']
+AmbientTemp = data['temp_air']
+WindSpeed = data['wind_speed']
 
 celltemp = csys.pvsyst_celltemp(GNI, AmbientTemp, WindSpeed)
 
-DNI = data[:, 16]
+DNI = data['dni']
 
 (photocurrent, saturation_current, resistance_series,
          resistance_shunt, nNsVth) = (csys.calcparams_pvsyst(DNI, celltemp))
@@ -33,31 +33,19 @@ csys.dc = csys.singlediode(photocurrent, saturation_current, resistance_series,
 
 # Obtención de los Pesos para los Factores de Utilización
 
-real_power = data[:, 4]
+real_power = data['p_mp']
 estimation = csys.dc['p_mp']
 
-weight_am_final = 1.0
-rmsd = 10000
-
-for weight_am in np.arange(0,1,0.05):
-    weight_at = 1.0 - weight_am
-    
-    modeled_power = estimation * (np.multiply(weight_am, uf_am) + 
-                                  np.multiply(weight_at, uf_at))
-    rmsd_temp = math.sqrt(mean_squared_error(real_power, modeled_power))
-    
-    if rmsd_temp < rmsd:
-        weight_am_final = weight_am
-        rmsd = rmsd_temp
-
+(weight_am_final, weight_at_final), rmsd = calc_uf_weights(real_power, 
+                                                           estimation, 
+                                                           [uf_am, uf_at])
 
 modeled_power_final = estimation * (np.multiply(weight_am_final, uf_am) + 
-                                    np.multiply(1.0-weight_am_final, uf_at))
-rmsd = math.sqrt(mean_squared_error(real_power, modeled_power_final))
+                                    np.multiply(weight_at_final, uf_at))
 
 
-AirMass = data[:,33]
-real_voltage = data[:, 0]
+AirMass = data['airmass']
+real_voltage = data['v_oc']
 estimation_volt = csys.dc['v_oc']
 residuals_volt = estimation_volt - real_voltage
 
@@ -73,7 +61,7 @@ plt.ylabel('Voc estimada por PVSyst - Voc medida')
 plt.title('Residuos de Voc sin UF en función de la Temperatura Ambiente')
 plt.savefig("grafica3.png", dpi=300)
 
-real_current = data[:, 1]
+real_current = data['i_sc']
 estimation_curr = csys.dc['i_sc']
 
 residuals_curr = estimation_curr - real_current
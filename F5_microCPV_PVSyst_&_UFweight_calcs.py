@@ -13,13 +13,13 @@ csys = CPVSystem(module=None, module_parameters=module_params,
                  racking_model='freestanding',
                  losses_parameters=None, name=None)
 
-GNI = filt_data[:, 10]
-AmbientTemp = filt_data[:, 8]
-WindSpeed = filt_data[:, 11]
+GNI = filt_data['gni']
+AmbientTemp = filt_data['temp_air']
+WindSpeed = filt_data['wind_speed']
 
 celltemp = csys.pvsyst_celltemp(GNI, AmbientTemp, WindSpeed)
 
-DNI = filt_data[:, 14]
+DNI = filt_data['dni']
 
 (photocurrent, saturation_current, resistance_series,
          resistance_shunt, nNsVth) = (csys.calcparams_pvsyst(DNI, celltemp))
@@ -33,31 +33,19 @@ csys.dc = csys.singlediode(photocurrent, saturation_current, resistance_series,
 
 # Obtención de los Pesos para los Factores de Utilización
 
-real_power = filt_data[:, 2]
+real_power = filt_data['p_mp']
 estimation = csys.dc['p_mp']
 
-weight_am_final = 1.0
-rmsd = 10000
-
-for weight_am in np.arange(0,1,0.05):
-    weight_at = 1.0 - weight_am
-    
-    modeled_power = estimation * (np.multiply(weight_am, uf_am) + 
-                                  np.multiply(weight_at, uf_at))
-    rmsd_temp = math.sqrt(mean_squared_error(real_power, modeled_power))
-    
-    if rmsd_temp < rmsd:
-        weight_am_final = weight_am
-        rmsd = rmsd_temp
-
+(weight_am_final, weight_at_final), rmsd = calc_uf_weights(real_power, 
+                                                           estimation, 
+                                                           [uf_am, uf_at])
 
 modeled_power_final = estimation * (np.multiply(weight_am_final, uf_am) + 
-                                    np.multiply(1.0-weight_am_final, uf_at))
-rmsd = math.sqrt(mean_squared_error(real_power, modeled_power_final))
+                                    np.multiply(weight_at_final, uf_at))
 
 
-AirMass = filt_data[:,24]
-real_voltage = filt_data[:, 6]
+AirMass = filt_data['airmass']
+real_voltage = filt_data['v_oc']
 estimation_volt = csys.dc['v_oc']
 residuals_volt = estimation_volt - real_voltage
 
@@ -73,7 +61,7 @@ plt.ylabel('Voc estimada por PVSyst - Voc medida')
 plt.title('Residuos de Voc sin UF en función de la Temperatura Ambiente')
 plt.savefig("grafica3.png", dpi=300)
 
-real_current = filt_data[:, 1]
+real_current = filt_data['i_sc']
 estimation_curr = csys.dc['i_sc']
 
 residuals_curr = estimation_curr - real_current
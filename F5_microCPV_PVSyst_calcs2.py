@@ -1,16 +1,20 @@
 # Fichero de aplicación del modelo PVSyst
 
-filt_data = np.loadtxt(
+import numpy as np
+
+from cpvdata import MeasurementTable
+
+filt_data = MeasurementTable.from_file(
         'C:\\Users\\Marcos\\Desktop\\datos modelado\\insolight_data_filtered_complete_may.txt', 
-        delimiter = ',')
+        schema='insolight_may')
 
-GII = filt_data[:, 10]
-AmbientTemp = filt_data[:, 6]
-WindSpeed = filt_data[:, 7]
-Airmass = filt_data[:, 17]
+GII = filt_data['gii']
+AmbientTemp = filt_data['temp_air']
+WindSpeed = filt_data['wind_speed']
+Airmass = filt_data['airmass']
 
-zenith = filt_data[:, 18]
-azimuth = filt_data[:, 19]
+zenith = filt_data['zenith']
+azimuth = filt_data['azimuth']
 aoi = scsys.get_aoi(solar_zenith=zenith, solar_azimuth=azimuth)
 
 IscDNI_ast = 0.96/1000
@@ -28,28 +32,17 @@ at_mhigh = 0
 weight_am = 0.25
 weight_at = 0.75
 
-# Obtención de los Factores de Utilización para AM, AT y AOI:
-uf_am = get_simple_util_factor(Airmass, am_thld, am_mlow/IscDNI_ast, 
-                               am_mhigh/IscDNI_ast)
-uf_at = get_simple_util_factor(AmbientTemp, at_thld, at_mlow/IscDNI_ast, 
-                               at_mhigh/IscDNI_ast)
-    
-uf_am_at = np.multiply(weight_am, uf_am) + np.multiply(weight_at, uf_at)
-
-uf_aoi = get_simple_util_factor(aoi, aoi_thld, aoi_mlow/IscDNI_ast, 
-                                aoi_mhigh/IscDNI_ast)
-# Se normaliza UF(AOI):
-uf_aoi_ast = get_simple_util_factor(0, aoi_thld, aoi_mlow/IscDNI_ast, 
-                                    aoi_mhigh/IscDNI_ast)
-
-uf_aoi_norm = np.divide(uf_aoi, uf_aoi_ast)
-
-UF_global = np.multiply(uf_am_at, uf_aoi)
+# Obtención del Factor de Utilización global para AM, AT y AOI:
+UF_global = scsys.get_static_utilization_factor(
+        Airmass, am_thld, am_mlow/IscDNI_ast, am_mhigh/IscDNI_ast, weight_am,
+        AmbientTemp, at_thld, at_mlow/IscDNI_ast, at_mhigh/IscDNI_ast, 
+        weight_at, aoi, aoi_thld, aoi_mlow/IscDNI_ast, aoi_mhigh/IscDNI_ast,
+        normalize_aoi=False)
 
 # Aplicación del modelo PVSyst:
 celltemp = scsys.pvsyst_celltemp(GII, AmbientTemp, WindSpeed)
 
-DII = filt_data[:, 9]
+DII = filt_data['dii']
 
 (photocurrent, saturation_current, resistance_series,
          resistance_shunt, nNsVth) = (scsys.calcparams_pvsyst(DII, celltemp))
@@ -62,13 +55,13 @@ scsys.dc = scsys.singlediode(photocurrent, saturation_current, resistance_series
 
 # Obtención de la Potencia estimada corregida:
 
-real_power = filt_data[:, 15]
+real_power = filt_data['p_mp']
 estimation = scsys.dc['p_mp']
 
 corrected_estimated_power = estimation * UF_global
-rmsd = math.sqrt(mean_squared_error(real_power, corrected_estimated_power))
+rmsd = np.sqrt(np.mean(np.square(corrected_estimated_power - real_power)))
 
-real_current = filt_data[:, 12]
+real_current = filt_data['i_sc']
 estimation_curr = scsys.dc['i_sc']
 residuals_curr = estimation_curr - real_current
 
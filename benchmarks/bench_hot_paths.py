@@ -0,0 +1,442 @@
+"""
+Benchmarks of the hot functions of cpvsystem on the shipped Data Files and on
+synthetic series of 10^6 and 10^7 rows.
+
+Run with asv, or directly with ``python benchmarks/bench_hot_paths.py`` to
+print the time, throughput and peak memory of every case. Results can be
+saved to a JSON file and compared with another run or with another commit,
+which is checked out in a temporary git worktree and benchmarked there::
+
+    python benchmarks/bench_hot_paths.py --output head.json
+    python benchmarks/bench_hot_paths.py --datasets m300 1e6 --compare HEAD~1
+    python benchmarks/bench_hot_paths.py --compare base.json
+
+Cases slower by more than the threshold (10 % by default) are reported as
+regressions and make the script exit with status 1.
+
+The code under test is imported from ``CPV_BENCH_ROOT`` when set, and from
+the parent directory of the benchmarks otherwise. The Data Files are always
+read from the current tree, so that every commit is timed on the same data.
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(HERE), 'Data Files')
+ROOT = os.environ.get('CPV_BENCH_ROOT', os.path.dirname(HERE))
+sys.path.insert(0, ROOT)
+
+import cpvsystem  # noqa: E402
+
+# Shipped measurements first, then synthetic series by number of rows.
+DATASETS = ('insolight_may', 'm300', '1e6', '1e7')
+
+# Module parameters of the M300 module in the F5 scripts.
+M300_PARAMS = {'gamma_ref' : 5.389, 'mu_gamma' : 0.002, 'I_L_ref' : 3.058,
+               'I_o_ref' : 0.00000000045, 'R_sh_ref' : 18194,
+               'R_sh_0': 73000, 'R_sh_exp' : 5.50, 'R_s' : 0.01,
+               'alpha_sc' : 0.00, 'EgRef' : 3.91, 'irrad_ref' : 1000,
+               'temp_ref' : 25, 'cells_in_series' : 42, 'eta_m' : 0.29,
+               'alpha_absorption' : 0.9}
+
+# Columns of insolight_data_filtered_complete_may.txt, see
+# cpvdata.INSOLIGHT_MAY_COLUMNS and cpvdata.DERIVED_COLUMNS.
+_INSOLIGHT_MAY = {'dni': 1, 'temp_air': 6, 'wind_speed': 7, 'gii': 10,
+                  'i_sc': 12, 'airmass': 17, 'zenith': 18, 'azimuth': 19}
+
+# Columns of m300_data_filtered.txt, see cpvdata.M300_COLUMNS.
+_M300 = {'wind_speed': 8, 'temp_air': 10, 'dni': 16, 'gni': 17,
+         'i_sc_dni': 25}
+
+# Location of the M300 tracker in F2_M300_AirMass_calc.py.
+_M300_LOCATION = {'latitude': 45.641603, 'longitude': 5.875387,
+                  'altitude': 234}
+
+# Larger inputs are skipped, so that the whole suite fits in a few GB.
+_MAX_ROWS = {'singlediode': 10**6, 'calc_two_regression_lines': 10**6}
+
+_datasets = {}
+
+
+def load_dataset(name):
+    """
+    Inputs of the benchmarks as arrays of equal length.
+
+    Parameters
+    ----------
+    name : string
+        'insolight_may' or 'm300' for the shipped measurements, or the number
+        of rows of a synthetic series, e.g. '1e6'.
+
+    Returns
+    -------
+    data : dict of numpy.ndarray
+        airmass, temp_air, wind_speed, dni, poa_global, zenith, azimuth and
+        i_sc_dni.
+    """
+    if name not in _datasets:
+        # asv runs each benchmark in a new process, so only one dataset is
+        # kept at a time.
+        _datasets.clear()
+        if name == 'insolight_may':
+            _datasets[name] = _load_insolight_may()
+        elif name == 'm300':
+            _datasets[name] = _load_m300()
+        else:
+            _datasets[name] = synthetic_dataset(int(float(name)))
+    return _datasets[name]
+
+
+def synthetic_dataset(n, seed=0):
+    """
+    Sunny measurements with two UF regression lines crossing at airmass 2.
+    """
+    rng = np.random.RandomState(seed)
+    zenith = rng.uniform(5, 75, n)
+    airmass = 1 / np.cos(np.radians(zenith))
+    dni = rng.uniform(600, 1000, n)
+    i_sc_dni = np.where(airmass <= 2, 3.3e-3 + 1e-5 * (airmass - 2),
+                        3.3e-3 - 8e-5 * (airmass - 2))
+    return {'airmass': airmass,
+            'temp_air': rng.uniform(0, 40, n),
+            'wind_speed': rng.uniform(0, 5, n),
+            'dni': dni,
+            'poa_global': dni * rng.uniform(1.05, 1.15, n),
+            'zenith': zenith,
+            'azimuth': rng.uniform(60, 300, n),
+            'i_sc_dni': i_sc_dni + rng.normal(0, 2e-5, n)}
+
+
+def _load_insolight_may():
+    data = np.loadtxt(os.path.join(
+            DATA_DIR, 'insolight_data_filtered_complete_may.txt'),
+            delimiter=',')
+    columns = {key: np.ascontiguousarray(data[:, i])
+               for key, i in _INSOLIGHT_MAY.items()}
+    columns['poa_global'] = columns.pop('gii')
+    columns['i_sc_dni'] = columns.pop('i_sc') / columns['dni']
+    return columns
+
+
+def _load_m300():
+    import pandas as pd
+    from pvlib.location import Location
+
+    data = np.loadtxt(os.path.join(DATA_DIR, 'm300_data_filtered.txt'),
+                      delimiter=',')
+    columns = {key: np.ascontiguousarray(data[:, i])
+               for key, i in _M300.items()}
+    columns['poa_global'] = columns.pop('gni')
+
+    # The solar position is calculated as in F2_M300_AirMass_calc.py.
+    location = Location(tz=1, **_M300_LOCATION)
+    with open(os.path.join(DATA_DIR, 'm300_datetime.txt')) as f:
+        times = pd.to_datetime([line.strip() for line in f],
+                               format='%d-%b-%Y %H:%M:%S')
+    times = times.tz_localize(location.pytz)
+    solar_position = location.get_solarposition(times)
+    columns['zenith'] = solar_position['apparent_zenith'].values
+    columns['azimuth'] = solar_position['azimuth'].values
+    columns['airmass'] = location.get_airmass(
+            times, solar_position)['airmass_relative'].values
+    return columns
+
+
+def _simple_util_factor(data):
+    airmass = data['airmass']
+    return lambda: cpvsystem.get_simple_util_factor(airmass, 2.1, 0.0039,
+                                                    -0.0303)
+
+
+def _utilization_factor(data):
+    system = cpvsystem.CPVSystem()
+    airmass, temp_air, dni = data['airmass'], data['temp_air'], data['dni']
+    return lambda: system.get_utilization_factor(
+            airmass, 2.1, 0.0039, -0.0303, 0.4,
+            temp_air, 50, 0.0047, 0, 0.4,
+            dni, 800, 0.0001, -0.0002, 0.2)
+
+
+def _two_regression_lines(data):
+    x, y = data['airmass'], data['i_sc_dni']
+    return lambda: cpvsystem.calc_two_regression_lines(x, y, None)
+
+
+def _two_regression_lines_limit(data):
+    x, y = data['airmass'], data['i_sc_dni']
+    return lambda: cpvsystem.calc_two_regression_lines(x, y, 2.0)
+
+
+def _regression_line(data):
+    x, y = data['airmass'], data['i_sc_dni']
+    return lambda: cpvsystem.calc_regression_line(x, y)
+
+
+def _pvsyst_celltemp(data):
+    system = cpvsystem.CPVSystem(module_parameters=M300_PARAMS,
+                                 racking_model='freestanding')
+    poa_global, temp_air = data['poa_global'], data['temp_air']
+    wind_speed = data['wind_speed']
+    return lambda: system.pvsyst_celltemp(poa_global, temp_air, wind_speed)
+
+
+def _calcparams_pvsyst(data):
+    system = cpvsystem.CPVSystem(module_parameters=M300_PARAMS,
+                                 racking_model='freestanding')
+    dni = data['dni']
+    celltemp = system.pvsyst_celltemp(data['poa_global'], data['temp_air'],
+                                      data['wind_speed'])
+    return lambda: system.calcparams_pvsyst(dni, celltemp)
+
+
+def _singlediode(data, **kwargs):
+    system = cpvsystem.CPVSystem(module_parameters=M300_PARAMS,
+                                 racking_model='freestanding')
+    celltemp = system.pvsyst_celltemp(data['poa_global'], data['temp_air'],
+                                      data['wind_speed'])
+    diode_params = system.calcparams_pvsyst(data['dni'], celltemp)
+    return lambda: system.singlediode(*diode_params, **kwargs)
+
+
+def _singlediode_fast(data):
+    return _singlediode(data, method='fast')
+
+
+def _aoi(data):
+    system = cpvsystem.StaticCPVSystem(surface_tilt=30, surface_azimuth=180)
+    zenith, azimuth = data['zenith'], data['azimuth']
+    return lambda: system.get_aoi(zenith, azimuth)
+
+
+# Every case returns the call to time for the inputs of a dataset.
+CASES = OrderedDict([
+        ('get_simple_util_factor', _simple_util_factor),
+        ('get_utilization_factor', _utilization_factor),
+        ('calc_two_regression_lines', _two_regression_lines),
+        ('calc_two_regression_lines_limit', _two_regression_lines_limit),
+        ('calc_regression_line', _regression_line),
+        ('pvsyst_celltemp', _pvsyst_celltemp),
+        ('calcparams_pvsyst', _calcparams_pvsyst),
+        ('singlediode', _singlediode),
+        ('singlediode_fast', _singlediode_fast),
+        ('get_aoi', _aoi)])
+
+
+def is_skipped(case, data):
+    return len(data['airmass']) > _MAX_ROWS.get(case, np.inf)
+
+
+def peak_bytes(func):
+    """
+    Peak of the memory allocated by a call, through tracemalloc.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class HotPaths(object):
+    params = (list(CASES), list(DATASETS))
+    param_names = ['case', 'dataset']
+    timeout = 300
+
+    def setup(self, case, dataset):
+        data = load_dataset(dataset)
+        if is_skipped(case, data):
+            raise NotImplementedError
+        self.func = CASES[case](data)
+
+    def time_case(self, case, dataset):
+        self.func()
+
+    def track_peak_bytes(self, case, dataset):
+        return peak_bytes(self.func)
+
+    track_peak_bytes.unit = 'bytes'
+
+
+def run_case(case, data, repeat=3):
+    """
+    Times a case on a dataset.
+
+    Returns
+    -------
+    result : dict
+        Best time in s, throughput in rows/s and peak of the allocated memory
+        in bytes, or the error of the case, e.g. when the function does not
+        exist at the commit under test.
+    """
+    n = len(data['airmass'])
+    if is_skipped(case, data):
+        return {'n': n, 'skipped': True}
+
+    try:
+        func = CASES[case](data)
+        # The first call is not timed, so that lazy imports are left out.
+        func()
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        peak = peak_bytes(func)
+    except Exception as exc:
+        return {'n': n, 'error': '{}: {}'.format(type(exc).__name__, exc)}
+
+    return {'n': n, 'time': best, 'rows_per_s': n / best,
+            'peak_bytes': peak}
+
+
+def run_suite(datasets=DATASETS, cases=None, repeat=3, log=None):
+    """
+    Times the cases on the datasets.
+
+    Returns
+    -------
+    report : dict
+        Commit and machine of the run and the results by case and dataset.
+    """
+    cases = list(CASES) if cases is None else cases
+    results = OrderedDict((case, OrderedDict()) for case in cases)
+
+    for dataset in datasets:
+        data = load_dataset(dataset)
+        for case in cases:
+            results[case][dataset] = run_case(case, data, repeat)
+            if log is not None:
+                log('{:32} {:14} {}'.format(
+                        case, dataset,
+                        _format_result(results[case][dataset])))
+
+    return {'commit': _git_commit(ROOT),
+            'date': datetime.datetime.now().isoformat(),
+            'machine': platform.node(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'results': results}
+
+
+def compare_reports(base, head, threshold=0.1):
+    """
+    Ratios of the times of the cases run in both reports.
+
+    Returns
+    -------
+    rows : list of tuple
+        (case, dataset, base time, head time, head / base time, regression),
+        where regression is True when the case is slower by more than the
+        threshold.
+    """
+    rows = []
+    for case, by_dataset in head['results'].items():
+        for dataset, result in by_dataset.items():
+            base_result = base['results'].get(case, {}).get(dataset, {})
+            if 'time' not in result or 'time' not in base_result:
+                continue
+            ratio = result['time'] / base_result['time']
+            rows.append((case, dataset, base_result['time'], result['time'],
+                         ratio, ratio > 1 + threshold))
+    return rows
+
+
+def run_commit(commit, args):
+    """
+    Runs this script on a commit checked out in a temporary git worktree.
+    """
+    tmp = tempfile.mkdtemp(prefix='cpv_bench_')
+    worktree = os.path.join(tmp, 'tree')
+    output = os.path.join(tmp, 'report.json')
+    root = os.path.dirname(HERE)
+    subprocess.run(['git', 'worktree', 'add', '--detach', worktree, commit],
+                   cwd=root, check=True, stdout=subprocess.DEVNULL)
+    try:
+        env = dict(os.environ, CPV_BENCH_ROOT=worktree)
+        command = [sys.executable, os.path.abspath(__file__),
+                   '--output', output, '--repeat', str(args.repeat),
+                   '--datasets'] + args.datasets
+        if args.cases:
+            command += ['--cases'] + args.cases
+        subprocess.run(command, env=env, check=True)
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        subprocess.run(['git', 'worktree', 'remove', '--force', worktree],
+                       cwd=root, check=True)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _git_commit(path):
+    try:
+        return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=path, check=True,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format_result(result):
+    if result.get('skipped'):
+        return 'n={:<9} skipped'.format(result['n'])
+    if 'error' in result:
+        return 'n={:<9} {}'.format(result['n'], result['error'])
+    return 'n={:<9} {:10.6f} s {:12.4g} rows/s {:10.1f} MB'.format(
+            result['n'], result['time'], result['rows_per_s'],
+            result['peak_bytes'] / 2.**20)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--datasets', nargs='+', default=list(DATASETS))
+    parser.add_argument('--cases', nargs='+', choices=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file of the report')
+    parser.add_argument('--compare',
+                        help='JSON report or git commit to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if args.compare is not None and os.path.isfile(args.compare):
+        with open(args.compare) as f:
+            base = json.load(f)
+    elif args.compare is not None:
+        print('Benchmarking {}'.format(args.compare))
+        base = run_commit(args.compare, args)
+        print('\nBenchmarking the working tree')
+
+    report = run_suite(args.datasets, args.cases, args.repeat, log=print)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    if args.compare is None:
+        return 0
+
+    rows = compare_reports(base, report, args.threshold)
+    print('\n{:32} {:14} {:>10} {:>10} {:>7}'.format(
+            'case', 'dataset', 'base [s]', 'head [s]', 'ratio'))
+    for case, dataset, base_time, head_time, ratio, regression in rows:
+        print('{:32} {:14} {:10.6f} {:10.6f} {:7.2f}{}'.format(
+                case, dataset, base_time, head_time, ratio,
+                '  REGRESSION' if regression else ''))
+
+    return int(any(row[-1] for row in rows))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
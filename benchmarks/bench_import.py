@@ -0,0 +1,81 @@
+"""
+Cold start benchmarks of ``import cpvsystem``.
+
+Run with asv, or directly with ``python benchmarks/bench_import.py`` to print
+a ``python -X importtime`` report of the modules loaded by the import, sorted
+by cumulative time.
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that only the code paths which need them should import.
+HEAVY_MODULES = ('pandas', 'pvlib', 'scipy', 'sklearn', 'matplotlib')
+
+
+def import_time_report(module='cpvsystem'):
+    """
+    Imports the module in a new interpreter with ``-X importtime``.
+    
+    Returns
+    -------
+    report : list of tuple
+        (module name, self time in us, cumulative time in us) of every 
+        imported module, sorted by cumulative time.
+    """
+    result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 
+             'import {}'.format(module)],
+            cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True, 
+            check=True)
+    
+    report = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        report.append((name.strip(), int(self_us), int(cumulative_us)))
+    
+    return sorted(report, key=lambda row: row[2], reverse=True)
+
+
+def loaded_heavy_modules(module='cpvsystem'):
+    """
+    Heavy dependencies loaded by importing the module in a new interpreter.
+    """
+    code = ('import sys, {}; print(" ".join(m for m in {!r} '
+            'if m in sys.modules))'.format(module, HEAVY_MODULES))
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, 
+                            stdout=subprocess.PIPE, universal_newlines=True,
+                            check=True)
+    return result.stdout.split()
+
+
+def timeraw_import_cpvsystem():
+    return 'import cpvsystem', 'import sys; sys.path.insert(0, {!r})'.format(
+            ROOT)
+
+
+def track_import_cpvsystem_us():
+    return import_time_report()[0][2]
+
+
+track_import_cpvsystem_us.unit = 'us'
+
+
+def track_heavy_modules_loaded():
+    return len(loaded_heavy_modules())
+
+
+if __name__ == '__main__':
+    report = import_time_report()
+    print('{:>12} {:>12}  module'.format('self [us]', 'cumul [us]'))
+    for name, self_us, cumulative_us in report[:25]:
+        print('{:>12} {:>12}  {}'.format(self_us, cumulative_us, name))
+    
+    print('\nimport cpvsystem: {:.1f} ms'.format(report[0][2] / 1000.))
+    print('heavy modules loaded: {}'.format(
+            ', '.join(loaded_heavy_modules()) or 'none'))
@@ -0,0 +1,179 @@
+"""
+Benchmarks of the PVsyst model chain of the CPV systems.
+
+Run with asv, or directly with ``python benchmarks/bench_pvsyst.py`` to 
+compare a fleet simulation with a loop over its systems, and the fast single
+diode solver with the exact one on the shipped data.
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cpvsystem  # noqa: E402
+
+# Module parameters of the M300 and Insolight modules in the F5 scripts.
+M300_PARAMS = {'gamma_ref' : 5.389, 'mu_gamma' : 0.002, 'I_L_ref' : 3.058, 
+               'I_o_ref' : 0.00000000045, 'R_sh_ref' : 18194, 
+               'R_sh_0': 73000, 'R_sh_exp' : 5.50, 'R_s' : 0.01, 
+               'alpha_sc' : 0.00, 'EgRef' : 3.91, 'irrad_ref' : 1000, 
+               'temp_ref' : 25, 'cells_in_series' : 42, 'eta_m' : 0.29, 
+               'alpha_absorption' : 0.9}
+
+INSOLIGHT_PARAMS = {'gamma_ref' : 5.524, 'mu_gamma' : 0.003, 'I_L_ref' : 0.96,
+                    'I_o_ref' : 0.00000000017, 'R_sh_ref' : 5226, 
+                    'R_sh_0': 21000, 'R_sh_exp' : 5.50, 'R_s' : 0.01, 
+                    'alpha_sc' : 0.00, 'EgRef' : 3.91, 'irrad_ref' : 1000, 
+                    'temp_ref' : 25, 'cells_in_series' : 12, 'eta_m' : 0.32, 
+                    'alpha_absorption' : 0.9}
+
+
+def synthetic_weather(n, seed=0):
+    rng = np.random.RandomState(seed)
+    dni = rng.uniform(600, 1000, n)
+    return dni, dni * 1.1, rng.uniform(10, 35, n), rng.uniform(0, 5, n)
+
+
+def synthetic_fleet(n_systems, seed=0):
+    """
+    Fleet of M300 trackers with scattered module parameters and stringing.
+    """
+    rng = np.random.RandomState(seed)
+    systems = []
+    for i in range(n_systems):
+        params = dict(M300_PARAMS)
+        params['I_L_ref'] *= rng.uniform(0.95, 1.05)
+        params['R_sh_ref'] *= rng.uniform(0.9, 1.1)
+        systems.append(cpvsystem.CPVSystem(
+                module_parameters=params, racking_model='freestanding',
+                modules_per_string=rng.randint(1, 4), 
+                strings_per_inverter=rng.randint(1, 3)))
+    return systems
+
+
+def loop_fleet_dc(systems, dni, gni, temp_air, wind_speed):
+    """
+    Simulation of the fleet system by system, as in the F5 scripts.
+    """
+    results = []
+    for system in systems:
+        celltemp = system.pvsyst_celltemp(gni, temp_air, wind_speed)
+        results.append(system.singlediode(
+                *system.calcparams_pvsyst(dni, celltemp)))
+    return results
+
+
+class PVsystChain(object):
+    params = [10**3, 10**5]
+    param_names = ['n']
+    
+    def setup(self, n):
+        self.system = cpvsystem.CPVSystem(module_parameters=M300_PARAMS, 
+                                          racking_model='freestanding')
+        self.dni, self.gni, self.temp_air, self.wind = synthetic_weather(n)
+        self.celltemp = self.system.pvsyst_celltemp(self.gni, self.temp_air,
+                                                    self.wind)
+        self.diode_params = self.system.calcparams_pvsyst(self.dni, 
+                                                          self.celltemp)
+    
+    def time_pvsyst_celltemp(self, n):
+        self.system.pvsyst_celltemp(self.gni, self.temp_air, self.wind)
+    
+    def time_calcparams_pvsyst(self, n):
+        self.system.calcparams_pvsyst(self.dni, self.celltemp)
+    
+    def time_singlediode(self, n):
+        self.system.singlediode(*self.diode_params)
+    
+    def time_singlediode_fast(self, n):
+        self.system.singlediode(*self.diode_params, method='fast')
+
+
+class FleetDC(object):
+    params = ([10, 50], [1440, 10**4])
+    param_names = ['n_systems', 'n']
+    
+    def setup(self, n_systems, n):
+        self.systems = synthetic_fleet(n_systems)
+        self.weather = synthetic_weather(n)
+    
+    def time_fleet_dc(self, n_systems, n):
+        cpvsystem.calc_fleet_dc(self.systems, *self.weather)
+    
+    def time_fleet_dc_fast(self, n_systems, n):
+        cpvsystem.calc_fleet_dc(self.systems, *self.weather, method='fast')
+    
+    def time_loop(self, n_systems, n):
+        loop_fleet_dc(self.systems, *self.weather)
+
+
+def shipped_diode_params():
+    """
+    Diode parameters of the M300 and Insolight systems of the F5 scripts for
+    the shipped measurements.
+    """
+    m300 = np.loadtxt(os.path.join(ROOT, 'Data Files', 
+                                   'm300_data_filtered.txt'), delimiter=',')
+    insolight = np.loadtxt(os.path.join(
+            ROOT, 'Data Files', 'insolight_data_filtered_complete_may.txt'), 
+            delimiter=',')
+    
+    csys = cpvsystem.CPVSystem(module_parameters=M300_PARAMS, 
+                               racking_model='freestanding')
+    scsys = cpvsystem.StaticCPVSystem(surface_tilt=30, surface_azimuth=180,
+                                      module_parameters=INSOLIGHT_PARAMS, 
+                                      racking_model='insulated')
+    
+    celltemp = csys.pvsyst_celltemp(m300[:, 17], m300[:, 10], m300[:, 8])
+    yield 'M300', csys, csys.calcparams_pvsyst(m300[:, 16], celltemp)
+    
+    celltemp = scsys.pvsyst_celltemp(insolight[:, 10], insolight[:, 6], 
+                                     insolight[:, 7])
+    yield 'Insolight May 2019', scsys, scsys.calcparams_pvsyst(
+            insolight[:, 9], celltemp)
+
+
+def accuracy_report():
+    """
+    Timing and maximum errors of the fast single diode solver against the 
+    exact Lambert W solution.
+    """
+    for name, system, diode_params in shipped_diode_params():
+        exact_time = _best_of(lambda: system.singlediode(*diode_params))
+        fast_time = _best_of(lambda: system.singlediode(*diode_params, 
+                                                        method='fast'))
+        exact = system.singlediode(*diode_params)
+        fast = system.singlediode(*diode_params, method='fast')
+        
+        print('{} (n={}): lambertw {:.4f} s, fast {:.4f} s, '
+              'speedup x{:.1f}'.format(name, len(fast['p_mp']), exact_time,
+                                       fast_time, exact_time / fast_time))
+        for key in fast:
+            error = np.abs(fast[key] - exact[key])
+            relative = error / np.maximum(np.abs(exact[key]), 1e-9)
+            print('  {:5}  max abs error {:.3e}  max rel error {:.3e}'.format(
+                    key, np.nanmax(error), np.nanmax(relative)))
+
+
+def _best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+if __name__ == '__main__':
+    accuracy_report()
+    
+    bench = FleetDC()
+    for n_systems in FleetDC.params[0]:
+        for n in FleetDC.params[1]:
+            bench.setup(n_systems, n)
+            loop = _best_of(lambda: bench.time_loop(n_systems, n))
+            fleet = _best_of(lambda: bench.time_fleet_dc(n_systems, n))
+            fast = _best_of(lambda: bench.time_fleet_dc_fast(n_systems, n))
+            print('{} systems x {} times: loop {:.3f} s, fleet {:.3f} s, '
+                  'fast fleet {:.3f} s'.format(n_systems, n, loop, fleet, 
+                                               fast))
@@ -0,0 +1,138 @@
+"""
+Benchmarks of the regression line calcs of the utilization factors against 
+the former brute force search of the limit between the lines.
+
+Run with asv, or directly with ``python benchmarks/bench_regression.py`` to 
+print the speedup and the fitted lines for the shipped Insolight data.
+"""
+
+import math
+import os
+import sys
+import timeit
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cpvsystem  # noqa: E402
+
+
+def brute_force_two_regression_lines(x, y):
+    """
+    Former search of ``cpvsystem.calc_two_regression_lines``, which fits two
+    regression lines at every 0.1 step, kept as the reference of the 
+    benchmarks.
+    """
+    from sklearn import linear_model
+    from sklearn.metrics import mean_squared_error
+    
+    def regression_line(x, y):
+        x = np.array(x)[:, np.newaxis]
+        y = np.array(y)[:, np.newaxis]
+        model = linear_model.LinearRegression()
+        model.fit(x, y)
+        rmsd = math.sqrt(mean_squared_error(y, model.predict(x)))
+        return model.coef_[0][0], model.intercept_[0], rmsd
+    
+    m_low, n_low, m_high, n_high = 0, 0, 0, 0
+    rmsd = 10000
+    
+    for i in np.arange(x[0], x[-2], 0.1):
+        is_low = x <= i
+        m_low_temp, n_low_temp, rmsd_low_temp = regression_line(
+                x[is_low], y[is_low])
+        m_high_temp, n_high_temp, rmsd_high_temp = regression_line(
+                x[~is_low], y[~is_low])
+        
+        if rmsd_low_temp + rmsd_high_temp < rmsd:
+            m_low, n_low = m_low_temp, n_low_temp
+            m_high, n_high = m_high_temp, n_high_temp
+            rmsd = rmsd_low_temp + rmsd_high_temp
+    
+    thld = (n_high - n_low) / (m_low - m_high)
+    return m_low, n_low, m_high, n_high, thld
+
+
+def synthetic_uf_data(n, seed=0):
+    """
+    Isc/DNI-like measurements around two lines which cross at airmass 2.
+    """
+    rng = np.random.RandomState(seed)
+    x = np.sort(rng.uniform(1, 5, n))
+    y = np.where(x <= 2, 3.3e-3 + 1e-5 * (x - 2), 3.3e-3 - 8e-5 * (x - 2))
+    return x, y + rng.normal(0, 2e-5, n)
+
+
+class TwoRegressionLines(object):
+    params = [10**2, 10**4, 10**6]
+    param_names = ['n']
+    
+    def setup(self, n):
+        self.x, self.y = synthetic_uf_data(n)
+    
+    def time_search(self, n):
+        cpvsystem.calc_two_regression_lines(self.x, self.y, None)
+    
+    def time_limit(self, n):
+        cpvsystem.calc_two_regression_lines(self.x, self.y, 2.0)
+
+
+class RegressionLine(object):
+    params = (['numpy', 'sklearn'], [10**2, 10**4, 10**6])
+    param_names = ['method', 'n']
+    
+    def setup(self, method, n):
+        self.x, self.y = synthetic_uf_data(n)
+        self.groups = np.floor(self.x * 10)
+    
+    def time_regression_line(self, method, n):
+        cpvsystem.calc_regression_line(self.x, self.y, method)
+    
+    def time_regression_lines(self, method, n):
+        if method != 'numpy':
+            raise NotImplementedError
+        cpvsystem.calc_regression_lines(self.x, self.y, self.groups)
+
+
+class BinnedStat(object):
+    params = (['median', 'mean', 'count'], [10**4, 10**6])
+    param_names = ['statistic', 'n']
+    
+    def setup(self, statistic, n):
+        self.x, self.y = synthetic_uf_data(n)
+    
+    def time_binned_stat(self, statistic, n):
+        cpvsystem.calc_binned_stat(self.x, self.y, 0.1, 1, 5, statistic)
+
+
+def _best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+if __name__ == '__main__':
+    for n in (100, 1000, 20000):
+        x, y = synthetic_uf_data(n)
+        old = _best_of(lambda: brute_force_two_regression_lines(x, y), 1)
+        new = _best_of(lambda: cpvsystem.calc_two_regression_lines(x, y, 
+                                                                   None))
+        print('n={}: brute force {:.3f} s, cumulative sums {:.5f} s, '
+              'speedup x{:.0f}'.format(n, old, new, old / new))
+    
+    x, y = synthetic_uf_data(1000)
+    for method in ('sklearn', 'numpy'):
+        print('calc_regression_line n=1000, {}: {:.6f} s'.format(
+                method, _best_of(lambda: cpvsystem.calc_regression_line(
+                        x, y, method))))
+    
+    data = np.loadtxt(os.path.join(ROOT, 'Data Files', 
+                                   'insolight_nontemp_measurements.txt'), 
+                      delimiter=',')
+    order = np.argsort(data[:, 24])
+    x = data[order, 24]
+    y = data[order, 5] / data[order, 14]
+    print('Insolight raw points (n={})'.format(len(x)))
+    print('  brute force:      ', brute_force_two_regression_lines(x, y))
+    print('  cumulative sums:  ', 
+          cpvsystem.calc_two_regression_lines(x, y, None))
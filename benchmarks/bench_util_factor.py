@@ -0,0 +1,117 @@
+"""
+Benchmarks of the utilization factor calcs against the former element by 
+element loop.
+
+Run with asv, or directly with ``python benchmarks/bench_util_factor.py`` to 
+print the speedup for several input sizes.
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cpvsystem  # noqa: E402
+
+
+def loop_simple_util_factor(x, thld, m_low, m_high):
+    """
+    Former implementation of ``cpvsystem.get_simple_util_factor``, kept as the
+    reference of the benchmarks.
+    """
+    if not isinstance(x, np.ndarray):
+        x = np.array(x, ndmin=1)
+    
+    suf = []
+    
+    for i in range(len(x)):
+        if x[i] <= thld:
+            simple_uf = 1 + (x[i] - thld) * m_low
+        else:
+            simple_uf = 1 + (x[i] - thld) * m_high
+        
+        suf.append(simple_uf)
+    
+    return suf
+
+
+class SimpleUtilFactor(object):
+    params = [10**3, 10**5, 525600]
+    param_names = ['n']
+    
+    def setup(self, n):
+        rng = np.random.RandomState(0)
+        self.airmass = rng.uniform(1, 6, n)
+        self.out = np.empty(n)
+    
+    def time_vectorized(self, n):
+        cpvsystem.get_simple_util_factor(self.airmass, 2.1, 0.0039, -0.0303)
+    
+    def time_vectorized_out(self, n):
+        cpvsystem.get_simple_util_factor(self.airmass, 2.1, 0.0039, -0.0303,
+                                         out=self.out)
+    
+    def time_loop(self, n):
+        loop_simple_util_factor(self.airmass, 2.1, 0.0039, -0.0303)
+
+
+class UtilizationFactor(object):
+    params = [10**3, 10**5, 525600]
+    param_names = ['n']
+    
+    def setup(self, n):
+        rng = np.random.RandomState(0)
+        self.system = cpvsystem.CPVSystem()
+        self.airmass = rng.uniform(1, 6, n)
+        self.temp_air = rng.uniform(0, 40, n)
+        self.dni = rng.uniform(600, 1000, n)
+    
+    def time_utilization_factor(self, n):
+        self.system.get_utilization_factor(
+            self.airmass, 2.1, 0.0039, -0.0303, 0.4,
+            self.temp_air, 50, 0.0047, 0, 0.4,
+            self.dni, 800, 0.0001, -0.0002, 0.2)
+    
+    def time_loop(self, n):
+        am_uf = loop_simple_util_factor(self.airmass, 2.1, 0.0039, -0.0303)
+        ta_uf = loop_simple_util_factor(self.temp_air, 50, 0.0047, 0)
+        dni_uf = loop_simple_util_factor(self.dni, 800, 0.0001, -0.0002)
+        (np.multiply(am_uf, 0.4) + np.multiply(ta_uf, 0.4) 
+         + np.multiply(dni_uf, 0.2))
+
+
+class UFWeights(object):
+    params = ([2, 4], [10**4, 525600])
+    param_names = ['n_ufs', 'n']
+    
+    def setup(self, n_ufs, n):
+        rng = np.random.RandomState(0)
+        self.estimation = rng.uniform(10, 20, n)
+        self.ufs = rng.uniform(0.8, 1.1, (n_ufs, n))
+        self.real_power = self.estimation * self.ufs.mean(axis=0)
+    
+    def time_uf_weights(self, n_ufs, n):
+        cpvsystem.calc_uf_weights(self.real_power, self.estimation, self.ufs)
+
+
+def _best_of(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+if __name__ == '__main__':
+    for bench_class in (SimpleUtilFactor, UtilizationFactor):
+        bench = bench_class()
+        for n in bench_class.params:
+            bench.setup(n)
+            loop = _best_of(lambda: bench.time_loop(n))
+            for name in sorted(dir(bench)):
+                if not name.startswith('time_') or name == 'time_loop':
+                    continue
+                vectorized = _best_of(lambda: getattr(bench, name)(n))
+                print('{}.{} n={}: loop {:.4f} s, vectorized {:.6f} s, '
+                      'speedup x{:.0f}'.format(bench_class.__name__, name, n, 
+                                               loop, vectorized, 
+                                               loop / vectorized))
@@ -0,0 +1,1250 @@
+"""
+The ``cpvdata`` module contains functions for reading and preparing the
+measurements of CPV modules and meteorological stations.
+"""
+
+import datetime
+import hashlib
+import itertools
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Formats of the dates written by MATLAB datestr.
+DATESTR_FORMATS = ('%d-%b-%Y %H:%M:%S', '%d-%b-%Y %H:%M', '%d-%b-%Y')
+
+# MATLAB datenum of 1970-01-01.
+_DATENUM_UNIX_EPOCH = 719529
+
+# Columns of the measurement sources, in the order of the Data Files.
+# Columns without a known meaning are named by their index.
+
+# Meteorological station, after its date and hh:mm columns.
+GEONICA_COLUMNS = ('wind_speed', 'wind_direction', 'temp_air', 'dni', 
+                   'solar_elevation', 'solar_azimuth', 'dni_top', 'dni_mid', 
+                   'dni_bot', 'cal_top', 'cal_mid', 'cal_bot', 'pressure')
+
+# insolight_data.txt: Insolight preseries monitoring joined with Geonica.
+INSOLIGHT_COLUMNS = (('date', 'time', 'p_mp', 'v_mp', 'i_mp', 'i_sc', 'v_oc', 
+                      'ff', 'temp_air', 'temp_lens', 'gni') 
+                     + tuple('geonica_' + name if name == 'temp_air' else name
+                             for name in GEONICA_COLUMNS))
+
+# insolight_data_may.txt: InsolightMay2019.csv.
+INSOLIGHT_MAY_COLUMNS = ('date', 'dni', 'dni_top', 'dni_mid', 'gni', 'g41', 
+                         'temp_air', 'wind_speed', 'wind_direction', 'dii', 
+                         'gii', 'smr_top_mid', 'i_sc', 'i_sc_si', 
+                         'temp_backplane', 'p_mp', 'p_mp_si')
+
+# m300_data_filtered.txt: M300 measurements of M300_data.mat.
+M300_COLUMNS = tuple({0: 'v_oc', 1: 'i_sc', 2: 'v_mp', 3: 'i_mp', 4: 'p_mp', 
+                      7: 'wind_direction', 8: 'wind_speed', 9: 'pressure', 
+                      10: 'temp_air', 16: 'dni', 17: 'gni', 
+                      20: 'smr_top_mid', 23: 'datenum', 25: 'i_sc_dni', 
+                      28: 'tracking_error'}.get(i, str(i)) for i in range(33))
+
+# Columns derived from the measurements, in the order they are appended to
+# the Data Files by the F2 scripts.
+DERIVED_COLUMNS = ('airmass', 'zenith', 'azimuth', 'aoi', 'temp_cell')
+
+MEASUREMENT_SCHEMAS = {'geonica': GEONICA_COLUMNS, 
+                       'insolight': INSOLIGHT_COLUMNS,
+                       'insolight_may': INSOLIGHT_MAY_COLUMNS, 
+                       'm300': M300_COLUMNS}
+
+# Comparison operators of the filter rules.
+FILTER_OPERATORS = {'<': np.less, '<=': np.less_equal, '>': np.greater, 
+                    '>=': np.greater_equal, '==': np.equal, 
+                    '!=': np.not_equal}
+
+# Filters of the measurements of every source, as (column, operator, 
+# threshold) rules. Columns 'a/b' are the ratio of two columns and the 
+# thresholds 'mean' and 'median' are statistics of the unfiltered column.
+FILTER_PRESETS = {
+    # F1_M300_Data_filtering.m
+    'm300': (('tracking_error', '<', 'mean'),
+             ('smr_top_mid', '<', 1.10), ('smr_top_mid', '>', 0.70),
+             ('dni', '>', 600), ('wind_speed', '<', 10)),
+    # F3_microCPV_Data_filtering.m
+    'insolight': (('dni_top/dni_mid', '<', 2.0), ('dni_top/dni_mid', '>', 0.7),
+                  ('dni', '>', 600), ('wind_speed', '<', 10), 
+                  ('temp_air', '>', 10), ('airmass', '<', 10), 
+                  ('i_sc', '>', 0.3)),
+    # F3_microCPV_Data_filtering2.m
+    'insolight_may': (('smr_top_mid', '<', 1.3), ('smr_top_mid', '>', 0.96),
+                      ('dni', '>', 600), ('wind_speed', '<', 10), 
+                      ('airmass', '<', 10), ('i_sc', '>', 0.1), 
+                      ('azimuth', '>', 150))}
+
+_FILTER_STATISTICS = {'mean': np.nanmean, 'median': np.nanmedian}
+
+# Subsets of the filtered measurements that hold a variable within a band, 
+# as {column: (center, low, high)} with the band center + low < x < 
+# center + high. The center is a number or a statistic of FILTER_PRESETS; a 
+# None offset leaves that side open.
+STRATUM_PRESETS = {
+    # F3_M300_Separation_Variables_Interest.m
+    'm300': {'nontemp': {'temp_air': ('mean', -5, 1)},
+             'nonairmass': {'airmass': ('mean', None, 0.25)}},
+    # F3_microCPV_Data_filtering.m
+    'insolight': {'nontemp': {'temp_air': ('mean', -3, 2)},
+                  'nonairmass': {'airmass': ('mean', -0.8, 0.5)}}}
+
+# Version of the layout of the DataStore entries, stored in every schema.
+_STORE_VERSION = 1
+
+# Rows of the text archives parsed at once by the DataStore.
+_CONVERT_ROWS = 2 ** 16
+
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 
+           'Oct', 'Nov', 'Dec')
+
+
+def parse_datestr(datestr, tz=None, format=None):
+    """
+    Converts dates written by MATLAB ``datestr`` (e.g. '21-Nov-2018 10:05' or
+    '30-May-2019 08:44:18') into a DatetimeIndex in one vectorized call.
+
+    Parameters
+    ----------
+    datestr : array-like of str
+        dates in one of DATESTR_FORMATS.
+
+    tz : None, str, int, float or tzinfo, default None
+        time zone of the dates, as in ``pvlib.location.Location``: a name, an
+        offset in hours or a tzinfo. If None, the dates are kept naive, which
+        pvlib takes as UTC.
+
+    format : None or str, default None
+        strptime format of the dates. If None, the fixed width fields of 
+        DATESTR_FORMATS are decoded directly from the characters, falling 
+        back to the format of the first date if they do not match.
+
+    Returns
+    -------
+    times : DatetimeIndex
+    """
+
+    datestr = np.char.strip(np.asarray(datestr, dtype=str).ravel())
+
+    times = None
+    if format is None:
+        times = _decode_datestr(datestr)
+        if times is None:
+            first = datestr[0] if len(datestr) else ''
+            format = DATESTR_FORMATS[2 - min(first.count(':'), 2)]
+
+    if times is None:
+        times = pd.DatetimeIndex(pd.to_datetime(datestr, format=format))
+
+    return _localize(times, tz)
+
+
+def datenum_to_datetime(datenum, tz=None, resolution='s'):
+    """
+    Converts MATLAB ``datenum`` values (days since year 0) into a
+    DatetimeIndex in one vectorized call.
+
+    Parameters
+    ----------
+    datenum : array-like of float
+
+    tz : None, str, int, float or tzinfo, default None
+        time zone of the dates, see parse_datestr.
+
+    resolution : None or str, default 's'
+        frequency to which the dates are rounded, removing the floating point
+        noise of datenum. 's' matches MATLAB datestr.
+
+    Returns
+    -------
+    times : DatetimeIndex
+    """
+
+    days = np.asarray(datenum, dtype=np.float64).ravel() - _DATENUM_UNIX_EPOCH
+    times = pd.DatetimeIndex(np.round(days * 86400e9).astype('datetime64[ns]'))
+
+    if resolution is not None:
+        times = times.round(resolution)
+
+    return _localize(times, tz)
+
+
+def read_datestr(filename, tz=None, format=None):
+    """
+    Reads a file of MATLAB ``datestr`` dates, one per line, such as
+    ``insolight_datestr.txt``.
+
+    Parameters
+    ----------
+    filename : str
+
+    tz : None, str, int, float or tzinfo, default None
+        time zone of the dates, see parse_datestr.
+
+    format : None or str, default None
+        strptime format of the dates, see parse_datestr.
+
+    Returns
+    -------
+    times : DatetimeIndex
+    """
+
+    with open(filename) as f:
+        lines = [line for line in f.read().splitlines() if line.strip()]
+
+    return parse_datestr(lines, tz=tz, format=format)
+
+
+def read_geonica(filename, tz='UTC'):
+    """
+    Reads the minute records of the Geonica meteorological station, such as
+    ``geonica2018.txt``.
+
+    Parameters
+    ----------
+    filename : string
+    tz : None, str, int, float or tzinfo, default 'UTC'
+        time zone of the station clock, see parse_datestr.
+
+    Returns
+    -------
+    geonica : DataFrame
+        GEONICA_COLUMNS indexed by time.
+    """
+
+    return _read_tab_records(filename, '%Y-%m-%d %H:%M', GEONICA_COLUMNS, tz)
+
+
+def read_insolight_preseries(filename, tz=1):
+    """
+    Reads the outdoor monitoring of the Insolight preseries, such as 
+    ``Insolight Preseries outdoor monitoring - IES rooftop - UPM.txt``.
+
+    Parameters
+    ----------
+    filename : string
+    tz : None, str, int, float or tzinfo, default 1
+        time zone of the monitoring clock, CET, see parse_datestr.
+
+    Returns
+    -------
+    insolight : DataFrame
+        Measured columns of INSOLIGHT_COLUMNS indexed by time.
+    """
+
+    return _read_tab_records(filename, '%d/%m/%Y %H:%M', 
+                             INSOLIGHT_COLUMNS[2:11], tz)
+
+
+def join_measurements(left, right, tolerance='0s', direction='nearest',
+                      suffixes=('', '_right')):
+    """
+    Aligns two time indexed DataFrames with one sorted merge: every row of 
+    left is joined with the row of right closest in time within tolerance, 
+    and the rows of left without a match are dropped.
+
+    Times with a time zone are compared in UTC, so that both sources may be
+    logged in different time zones.
+
+    Parameters
+    ----------
+    left, right : DataFrame
+        Sorted by their DatetimeIndex.
+    tolerance : str or Timedelta, default '0s'
+        Maximum time between joined rows. '0s' only joins equal times.
+    direction : string, default 'nearest'
+        See pd.merge_asof.
+    suffixes : tuple of strings, default ('', '_right')
+        Suffixes of the columns of left and right with the same name.
+
+    Returns
+    -------
+    joined : DataFrame
+        Columns of left and right, indexed by the times of left.
+    """
+
+    times = left.index
+    left = left.reset_index(drop=True).assign(_time=_utc_times(times))
+    right = right.reset_index(drop=True).assign(_time=_utc_times(right.index),
+                                                _matched=True)
+
+    joined = pd.merge_asof(left, right, on='_time', 
+                           tolerance=pd.Timedelta(tolerance), 
+                           direction=direction, suffixes=suffixes)
+
+    matched = joined['_matched'].notna().to_numpy()
+    joined = joined.drop(columns=['_time', '_matched'])[matched]
+    joined.index = times[matched]
+
+    return joined
+
+
+def join_insolight_geonica(insolight, geonica, tolerance='0s'):
+    """
+    Joins the Insolight preseries monitoring with the Geonica station into 
+    the layout of ``insolight_data.txt``, replacing the nested loop of 
+    F1_microCPV_Data_preprocessing.m.
+
+    Parameters
+    ----------
+    insolight : DataFrame
+        See read_insolight_preseries.
+    geonica : DataFrame
+        See read_geonica.
+    tolerance : str or Timedelta, default '0s'
+        See join_measurements.
+
+    Returns
+    -------
+    table : MeasurementTable
+        INSOLIGHT_COLUMNS, with zero date and time columns as in the 
+        Data Files, and the times of insolight.
+    """
+
+    joined = join_measurements(
+        insolight, geonica.rename(columns={'temp_air': 'geonica_temp_air'}),
+        tolerance=tolerance)
+
+    table = MeasurementTable(n_rows=len(joined), 
+                             extra_columns=len(INSOLIGHT_COLUMNS) + len(
+                                 DERIVED_COLUMNS), times=joined.index)
+    for name in INSOLIGHT_COLUMNS:
+        table.add_column(name, joined[name].to_numpy() if name in joined 
+                         else 0)
+
+    return table
+
+
+def write_measurements(table, filename, datestr_filename=None, 
+                       datestr_format='%d-%b-%Y %H:%M', mode='w'):
+    """
+    Writes a MeasurementTable as the Data Files: a comma separated numeric 
+    archive and, optionally, the ``datestr`` of its times, one per line.
+
+    Parameters
+    ----------
+    table : MeasurementTable
+    filename : string
+    datestr_filename : None or string, default None
+    datestr_format : string, default '%d-%b-%Y %H:%M'
+        strftime format of the dates, in the time zone of the times.
+    mode : string, default 'w'
+        'a' appends the table to the files, e.g. to write the chunks of 
+        iter_measurements one after another.
+    """
+
+    with open(filename, mode) as f:
+        np.savetxt(f, X=table.values, delimiter=',', fmt='%.10f')
+
+    if datestr_filename is not None:
+        with open(datestr_filename, mode) as f:
+            if len(table):
+                f.write('\n'.join(table.times.strftime(datestr_format)) 
+                        + '\n')
+
+
+def iter_measurements(filename, schema=None, datestr_filename=None, tz=None,
+                      chunk_rows=2**16, delimiter=',', skiprows=0, 
+                      extra_columns=len(DERIVED_COLUMNS), store=None):
+    """
+    Iterates over a numeric archive of the Data Files in chunks of rows, so 
+    that archives larger than the memory can be processed with a constant 
+    memory use.
+
+    The archive is read from the memory map of its DataStore entry, which is
+    converted in blocks the first time, and every chunk is copied into its
+    own MeasurementTable with room for the derived columns.
+
+    Parameters
+    ----------
+    filename : string
+    schema : None, string or sequence of strings, default None
+        Key of MEASUREMENT_SCHEMAS or names of the columns.
+    datestr_filename : None or string, default None
+        Dates of the rows, one per line, as read by read_datestr.
+    tz : None, str, int, float or tzinfo, default None
+        Time zone of the dates, see parse_datestr.
+    chunk_rows : int, default 65536
+        Rows of every chunk.
+    delimiter, skiprows, store
+        See load_data.
+    extra_columns : int, default len(DERIVED_COLUMNS)
+        See MeasurementTable.
+
+    Yields
+    ------
+    chunk : MeasurementTable
+        Consecutive rows of the archive, with their times if 
+        datestr_filename is given.
+    """
+
+    data = load_data(filename, delimiter=delimiter, skiprows=skiprows, 
+                     store=store)
+    names = _schema_names(schema, data.shape[1])
+
+    dates = None
+    if datestr_filename is not None:
+        dates = open(datestr_filename)
+
+    try:
+        for start in range(0, len(data), chunk_rows):
+            rows = data[start:start + chunk_rows]
+
+            times = None
+            if dates is not None:
+                lines = list(itertools.islice(
+                    (line for line in dates if line.strip()), len(rows)))
+                if len(lines) != len(rows):
+                    raise ValueError('{} has fewer dates than rows'.format(
+                        datestr_filename))
+                times = parse_datestr(lines, tz=tz)
+
+            yield MeasurementTable(rows, names=names, 
+                                   extra_columns=extra_columns, times=times)
+    finally:
+        if dates is not None:
+            dates.close()
+
+
+class MeasurementTable(object):
+    """
+    The MeasurementTable class keeps the measurements of a source as named
+    float columns of a preallocated Fortran ordered buffer.
+
+    Every column is a contiguous block of the buffer, so it is read and 
+    written as a view, and new columns are written in the free space of the 
+    buffer. When the buffer is full its capacity is doubled, so adding a 
+    column costs O(rows) on average instead of copying the whole table as 
+    np.append does.
+
+    Parameters
+    ----------
+    data : None or array-like, default None
+        Initial (rows, columns) values, copied into the buffer.
+
+    names : None or sequence of strings, default None
+        Names of the initial columns, or a key of MEASUREMENT_SCHEMAS. If 
+        data has more columns than names, they are named by DERIVED_COLUMNS.
+
+    extra_columns : int, default len(DERIVED_COLUMNS)
+        Free columns allocated after the initial ones.
+
+    n_rows : None or int, default None
+        Number of rows of a table created without data.
+
+    times : None or DatetimeIndex, default None
+        Time stamp of every row.
+
+    copy : bool, default True
+        If False and data is a float array, the table is a view of data, 
+        without free columns; the first added column copies it.
+    """
+
+    def __init__(self, data=None, names=None, 
+                 extra_columns=len(DERIVED_COLUMNS), n_rows=None, times=None,
+                 copy=True):
+
+        if data is None:
+            data = np.empty((0 if n_rows is None else n_rows, 0))
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim == 1:
+            data = data[:, np.newaxis]
+
+        names = _schema_names(names, data.shape[1])
+
+        if copy:
+            self._buffer = np.empty((data.shape[0], 
+                                     data.shape[1] + extra_columns),
+                                    dtype=np.float64, order='F')
+            self._buffer[:, :data.shape[1]] = data
+        else:
+            self._buffer = data
+        self._names = list(names)
+        self._index = {name: i for i, name in enumerate(self._names)}
+
+        if times is not None:
+            times = pd.DatetimeIndex(times)
+            if len(times) != len(self):
+                raise ValueError('{} times given for {} rows'.format(
+                    len(times), len(self)))
+        self.times = times
+
+    def __repr__(self):
+        return 'MeasurementTable: \n  rows: {}\n  columns: {}'.format(
+            len(self), ', '.join(self._names))
+
+    def __len__(self):
+        return self._buffer.shape[0]
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._buffer[:, self._index[key]]
+        # Positional indexing, as on the arrays of the Data Files.
+        return self.values[key]
+
+    def __setitem__(self, name, values):
+        self.add_column(name, values)
+
+    @property
+    def names(self):
+        return list(self._names)
+
+    @property
+    def shape(self):
+        return (len(self), len(self._names))
+
+    @property
+    def capacity(self):
+        return self._buffer.shape[1]
+
+    @property
+    def values(self):
+        """
+        (rows, columns) view of the table, with the column order of the 
+        Data Files.
+        """
+        return self._buffer[:, :len(self._names)]
+
+    @classmethod
+    def from_file(cls, filename, schema=None, delimiter=',', skiprows=0, 
+                  extra_columns=len(DERIVED_COLUMNS), store=None, times=None):
+        """
+        Loads a numeric archive of the Data Files through a DataStore.
+
+        Parameters
+        ----------
+        filename : string
+        schema : None, string or sequence of strings, default None
+            Key of MEASUREMENT_SCHEMAS or names of the columns.
+        delimiter, skiprows, store
+            See load_data.
+        extra_columns : int, default len(DERIVED_COLUMNS)
+        times : None or DatetimeIndex, default None
+            Time stamp of every row, e.g. from read_datestr.
+
+        Returns
+        -------
+        table : MeasurementTable
+        """
+
+        data = load_data(filename, delimiter=delimiter, skiprows=skiprows,
+                         store=store)
+
+        return cls(data, names=schema, extra_columns=extra_columns, 
+                   times=times)
+
+    def add_column(self, name, values=np.nan):
+        """
+        Writes a column in place, adding it after the existing ones if the 
+        name is new.
+
+        Parameters
+        ----------
+        name : string
+        values : float or array-like, default np.nan
+            Broadcast to the rows of the table.
+
+        Returns
+        -------
+        column : ndarray
+            View of the column in the table.
+        """
+
+        i = self._index.get(name)
+        if i is None:
+            i = len(self._names)
+            if i == self.capacity:
+                self._reserve(max(2 * self.capacity, 1))
+            self._names.append(name)
+            self._index[name] = i
+
+        self._buffer[:, i] = values
+
+        return self._buffer[:, i]
+
+    def add_columns(self, columns, names=None):
+        """
+        Writes several columns in place.
+
+        Parameters
+        ----------
+        columns : dict or DataFrame
+            Columns by name, such as the result of get_solar_geometry.
+        names : None or dict, default None
+            New names of the columns, e.g. 
+            {'airmass_relative': 'airmass'}.
+        """
+
+        if names is None:
+            names = {}
+
+        needed = len(self._names) + sum(
+            names.get(name, name) not in self._index for name in columns)
+        if needed > self.capacity:
+            self._reserve(max(2 * self.capacity, needed))
+
+        for name in columns:
+            self.add_column(names.get(name, name), np.asarray(columns[name]))
+
+    def select(self, mask):
+        """
+        Returns a new table with the rows of a boolean mask or index array.
+        """
+
+        table = type(self)(self._buffer[mask, :len(self._names)], 
+                           names=self._names, 
+                           extra_columns=self.capacity - len(self._names),
+                           times=None if self.times is None else 
+                           self.times[mask])
+        return table
+
+    def to_dataframe(self, index=None):
+        """
+        Returns the columns as a DataFrame, indexed by index or else by the 
+        times of the table.
+        """
+
+        if index is None:
+            index = self.times
+
+        return pd.DataFrame(self.values.copy(), index=index, 
+                            columns=self._names)
+
+    def _reserve(self, capacity):
+
+        buffer = np.empty((len(self), capacity), dtype=np.float64, order='F')
+        buffer[:, :len(self._names)] = self.values
+        self._buffer = buffer
+
+
+def get_filter_mask(data, rules):
+    """
+    Evaluates filter rules on the columns of the measurements as one boolean
+    mask, keeping the rows that meet every rule.
+
+    Parameters
+    ----------
+    data : MeasurementTable, DataFrame or dict
+        Columns by name.
+    rules : string or sequence of (column, operator, threshold)
+        Key of FILTER_PRESETS or rules. column is a name or the ratio 'a/b' 
+        of two names, operator a key of FILTER_OPERATORS and threshold a 
+        number or the statistic 'mean' or 'median' of the column. Rows with 
+        NaN values do not meet the rule.
+
+    Returns
+    -------
+    mask : ndarray of bool
+        True for the rows kept.
+    rejections : OrderedDict
+        Number of rows that do not meet every rule, by 'column operator 
+        threshold'. A row rejected by several rules is counted in each.
+    """
+
+    if isinstance(rules, str):
+        rules = FILTER_PRESETS[rules]
+
+    columns = {}
+    mask = None
+    passed = None
+    rejections = OrderedDict()
+
+    for column, operator, threshold in rules:
+        if column not in columns:
+            columns[column] = get_column(data, column)
+        values = columns[column]
+
+        if mask is None:
+            mask = np.ones(values.shape, dtype=bool)
+            passed = np.empty(values.shape, dtype=bool)
+
+        label = '{} {} {}'.format(column, operator, threshold)
+        if isinstance(threshold, str):
+            threshold = _FILTER_STATISTICS[threshold](values)
+
+        with np.errstate(invalid='ignore'):
+            FILTER_OPERATORS[operator](values, threshold, out=passed)
+        np.logical_and(mask, passed, out=mask)
+
+        rejections[label] = (rejections.get(label, 0) + passed.size 
+                             - np.count_nonzero(passed))
+
+    if mask is None:
+        raise ValueError('no filter rules given')
+
+    return mask, rejections
+
+
+def filter_measurements(table, rules):
+    """
+    Keeps the rows of a MeasurementTable that meet every filter rule.
+
+    Parameters
+    ----------
+    table : MeasurementTable
+    rules : string or sequence of (column, operator, threshold)
+        See get_filter_mask.
+
+    Returns
+    -------
+    filtered : MeasurementTable
+        New table with the rows kept, compacted.
+    rejections : OrderedDict
+        See get_filter_mask.
+    """
+
+    mask, rejections = get_filter_mask(table, rules)
+
+    return table.select(mask), rejections
+
+
+def get_stratum_mask(data, held, n_samples=None, mask=None):
+    """
+    Selects the rows that hold one or several variables within a band, such
+    as the fixed temperature ('nontemp') and fixed airmass ('nonairmass') 
+    subsets used to fit the utilization factors.
+
+    Parameters
+    ----------
+    data : MeasurementTable, DataFrame or dict
+        Columns by name.
+    held : dict
+        Band of every held column, either (center, low, high) as in 
+        STRATUM_PRESETS or only its center, a number or 'mean' or 'median'.
+        The bands given by their center are sized together so that the 
+        stratum has n_samples rows.
+    n_samples : None or int, default None
+        Target size of the stratum, needed if any band is given by its 
+        center. The half widths of those bands are the same multiple of the 
+        standard deviation of each column; rows at the same distance as the
+        last one are also kept.
+    mask : None or array of bool, default None
+        Rows the stratum is taken from, e.g. of get_filter_mask. The 
+        statistics of the centers are also taken over these rows.
+
+    Returns
+    -------
+    stratum : ndarray of bool
+        True for the rows of the stratum.
+    bands : OrderedDict
+        (low, high) bounds of every held column.
+    """
+
+    stratum = None
+    bands = OrderedDict()
+    automatic = OrderedDict()
+
+    for column, band in held.items():
+        values = get_column(data, column)
+        if stratum is None:
+            stratum = (np.ones(values.shape, dtype=bool) if mask is None 
+                       else np.array(mask, dtype=bool))
+
+        if isinstance(band, tuple):
+            center, low, high = band
+        else:
+            center, low, high = band, None, None
+        if isinstance(center, str):
+            center = _FILTER_STATISTICS[center](values[stratum])
+
+        if not isinstance(band, tuple):
+            automatic[column] = (values, center)
+            continue
+
+        low = -np.inf if low is None else center + low
+        high = np.inf if high is None else center + high
+        with np.errstate(invalid='ignore'):
+            stratum &= (values > low) & (values < high)
+        bands[column] = (low, high)
+
+    if stratum is None:
+        raise ValueError('no held variables given')
+
+    if automatic:
+        if n_samples is None:
+            raise ValueError('n_samples is needed for bands given by their '
+                             'center')
+
+        # Distance to the centers in standard deviations of each column; the
+        # stratum keeps the n_samples closest rows.
+        distance = np.zeros(stratum.shape)
+        scales = {}
+        for column, (values, center) in automatic.items():
+            scales[column] = np.nanstd(values[stratum]) or 1.0
+            np.maximum(distance, np.abs(values - center) / scales[column], 
+                       out=distance)
+        distance[~stratum | np.isnan(distance)] = np.inf
+
+        n_samples = min(int(n_samples), np.count_nonzero(np.isfinite(
+            distance)))
+        if n_samples > 0:
+            width = np.partition(distance, n_samples - 1)[n_samples - 1]
+            stratum &= distance <= width
+        else:
+            width = 0.0
+            stratum[:] = False
+
+        for column, (values, center) in automatic.items():
+            bands[column] = (center - width * scales[column], 
+                             center + width * scales[column])
+
+    return stratum, bands
+
+
+def iter_strata(data, column, edges, mask=None):
+    """
+    Iterates over consecutive bands of a column, e.g. to fit the 
+    utilization factors of every stratum without reading the data again.
+
+    Parameters
+    ----------
+    data : MeasurementTable, DataFrame or dict
+    column : string
+    edges : array-like
+        Bounds of the bands; every band is edges[k] <= x < edges[k + 1].
+    mask : None or array of bool, default None
+        Rows the strata are taken from.
+
+    Yields
+    ------
+    low, high : float
+        Bounds of the band.
+    stratum : ndarray of bool
+        True for the rows of the band.
+    """
+
+    values = get_column(data, column)
+    edges = np.asarray(edges, dtype=np.float64)
+
+    # Every row is assigned to its band once.
+    band = np.searchsorted(edges, values, side='right') - 1
+    band[np.isnan(values) | (values >= edges[-1])] = -1
+    if mask is not None:
+        band[~np.asarray(mask, dtype=bool)] = -1
+
+    for k in range(len(edges) - 1):
+        yield edges[k], edges[k + 1], band == k
+
+
+def get_column(data, column):
+    """
+    Values of a column of the measurements, given by its name or as the 
+    ratio 'a/b' of two columns, as in the filter rules.
+
+    Parameters
+    ----------
+    data : MeasurementTable, DataFrame or dict
+    column : string
+
+    Returns
+    -------
+    values : ndarray
+    """
+
+    if column in data:
+        return np.asarray(data[column], dtype=np.float64)
+
+    numerator, _, denominator = column.partition('/')
+    if not denominator:
+        raise KeyError(column)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.divide(get_column(data, numerator.strip()), 
+                         get_column(data, denominator.strip()))
+
+
+class DataStore(object):
+    """
+    The DataStore class keeps numeric text archives, such as those read with
+    ``np.loadtxt`` from the Data Files, converted into binary arrays that are
+    loaded as memory maps.
+
+    Every archive is stored once as a Fortran ordered ``.npy`` array, so each
+    column is a contiguous block of the file, together with a JSON schema 
+    with the shape, the column names and the size, modification time and 
+    SHA-1 of the source text. The entry is rebuilt when the source changes; 
+    if only its modification time changes, the hash is checked first.
+
+    Parameters
+    ----------
+    path : None or string, default None
+        Directory of the store. If None, every archive is stored in a 
+        '.cpvstore' directory next to it.
+    """
+
+    def __init__(self, path=None):
+
+        self.path = path
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def __repr__(self):
+        return 'DataStore: \n  path: {}'.format(self.path)
+
+    def load(self, filename, delimiter=',', skiprows=0, names=None, 
+             mmap_mode='r'):
+        """
+        Loads a numeric text archive, converting it first if its entry is 
+        missing or out of date.
+
+        Parameters
+        ----------
+        filename : string
+        delimiter : None or string, default ','
+            Separator of the values, None for any whitespace.
+        skiprows : int, default 0
+            Number of header lines to skip.
+        names : None or list of strings, default None
+            Names of the columns, kept in the schema. If None, the existing
+            names are kept, or the columns are named by their index.
+        mmap_mode : None or string, default 'r'
+            See np.load. With 'r' the array is a read only view of the file;
+            with None it is read into memory.
+
+        Returns
+        -------
+        data : ndarray
+            Same values and shape as np.loadtxt(filename, delimiter=delimiter,
+            skiprows=skiprows, ndmin=2).
+        """
+
+        entry = self._entry(filename, delimiter, skiprows)
+        schema = self._valid_schema(filename, entry)
+
+        if schema is None:
+            schema = self._convert(filename, entry, delimiter, skiprows, names)
+        elif names is not None and list(names) != schema['names']:
+            schema = self._write_schema(entry, dict(schema, names=list(
+                _column_names(names, schema['shape'][1]))))
+
+        return np.load(os.path.join(entry, 'data.npy'), mmap_mode=mmap_mode)
+
+    def columns(self, filename, delimiter=',', skiprows=0, names=None, 
+                mmap_mode='r'):
+        """
+        Loads a numeric text archive as its named columns.
+
+        Parameters are those of DataStore.load.
+
+        Returns
+        -------
+        columns : OrderedDict
+            Contiguous view of every column, by name.
+        """
+
+        data = self.load(filename, delimiter=delimiter, skiprows=skiprows,
+                         names=names, mmap_mode=mmap_mode)
+        schema = self.schema(filename, delimiter=delimiter, skiprows=skiprows)
+
+        return OrderedDict((name, data[:, i]) 
+                           for i, name in enumerate(schema['names']))
+
+    def schema(self, filename, delimiter=',', skiprows=0):
+        """
+        Returns the schema of a stored archive, or None if its entry is 
+        missing or out of date.
+        """
+
+        return self._valid_schema(filename, 
+                                  self._entry(filename, delimiter, skiprows))
+
+    def _entry(self, filename, delimiter, skiprows):
+
+        source = os.path.abspath(filename)
+        key = hashlib.sha1(repr((source, delimiter, skiprows)).encode())
+        name = '{}-{}'.format(os.path.basename(source), key.hexdigest()[:12])
+
+        if self.path is None:
+            return os.path.join(os.path.dirname(source), '.cpvstore', name)
+        return os.path.join(self.path, name)
+
+    def _valid_schema(self, filename, entry):
+
+        try:
+            with open(os.path.join(entry, 'schema.json')) as f:
+                schema = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if (schema.get('version') != _STORE_VERSION 
+                or not os.path.exists(os.path.join(entry, 'data.npy'))):
+            return None
+
+        stat = os.stat(filename)
+        if stat.st_size != schema['size']:
+            return None
+        if stat.st_mtime_ns == schema['mtime_ns']:
+            return schema
+
+        # The source was touched: it is only converted again if its contents
+        # changed.
+        if _file_sha1(filename) != schema['sha1']:
+            return None
+        return self._write_schema(entry, dict(schema, 
+                                              mtime_ns=stat.st_mtime_ns))
+
+    def _convert(self, filename, entry, delimiter, skiprows, names):
+
+        stat = os.stat(filename)
+        n_rows = _count_rows(filename, skiprows)
+
+        # The text is parsed in blocks of rows written into the memory map 
+        # of the array, so archives larger than the memory can be converted.
+        os.makedirs(entry, exist_ok=True)
+        filename_npy = os.path.join(entry, 'data.npy')
+        data = None
+        start = 0
+        for block in _iter_numeric_text(filename, delimiter, skiprows, 
+                                        _CONVERT_ROWS):
+            if data is None:
+                data = np.lib.format.open_memmap(
+                    filename_npy + '.tmp', mode='w+', dtype=np.float64, 
+                    shape=(n_rows, block.shape[1]), fortran_order=True)
+            data[start:start + len(block)] = block
+            start += len(block)
+
+        data.flush()
+        shape = data.shape
+        del data
+        os.replace(filename_npy + '.tmp', filename_npy)
+
+        schema = OrderedDict([
+            ('version', _STORE_VERSION),
+            ('source', os.path.abspath(filename)),
+            ('size', stat.st_size),
+            ('mtime_ns', stat.st_mtime_ns),
+            ('sha1', _file_sha1(filename)),
+            ('delimiter', delimiter),
+            ('skiprows', skiprows),
+            ('shape', list(shape)),
+            ('dtype', np.dtype(np.float64).str),
+            ('names', _column_names(names, shape[1]))])
+
+        return self._write_schema(entry, schema)
+
+    def _write_schema(self, entry, schema):
+
+        # The schema is written last and replaced at once, so an entry is 
+        # only valid once its data is complete.
+        filename = os.path.join(entry, 'schema.json')
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(schema, f, indent=1)
+        os.replace(filename + '.tmp', filename)
+
+        return schema
+
+
+data_store = DataStore()
+
+
+def load_data(filename, delimiter=',', skiprows=0, names=None, store=None):
+    """
+    Loads a numeric text archive through a DataStore, as a drop-in 
+    replacement of np.loadtxt.
+
+    Parameters
+    ----------
+    filename : string
+    delimiter : None or string, default ','
+    skiprows : int, default 0
+    names : None or list of strings, default None
+        See DataStore.load.
+    store : None or DataStore, default None
+        If None, the shared data_store is used.
+
+    Returns
+    -------
+    data : ndarray
+        Read only memory map of the values.
+    """
+
+    if store is None:
+        store = data_store
+
+    return store.load(filename, delimiter=delimiter, skiprows=skiprows, 
+                      names=names)
+
+
+def _iter_numeric_text(filename, delimiter, skiprows, chunk_rows):
+    """
+    Parses a numeric text archive as np.loadtxt does, with the C parser of 
+    pandas, in blocks of chunk_rows rows.
+    """
+
+    reader = pd.read_csv(filename, sep=r'\s+' if delimiter is None else 
+                         delimiter, header=None, skiprows=skiprows, 
+                         dtype=np.float64, float_precision='round_trip',
+                         skip_blank_lines=True, chunksize=chunk_rows)
+
+    with reader:
+        for table in reader:
+            yield np.atleast_2d(table.to_numpy(dtype=np.float64))
+
+
+def _count_rows(filename, skiprows):
+    """
+    Number of rows of a text archive, without its header and blank lines.
+    """
+
+    with open(filename, 'rb') as f:
+        for _ in range(skiprows):
+            f.readline()
+        return sum(1 for line in f if line.strip())
+
+
+def _schema_names(names, n_columns):
+    """
+    Names of n_columns given a schema key or names, completed with 
+    DERIVED_COLUMNS and then with the column indices.
+    """
+
+    if names is None:
+        return [str(i) for i in range(n_columns)]
+    if isinstance(names, str):
+        names = MEASUREMENT_SCHEMAS[names]
+
+    names = list(names)
+    if len(names) > n_columns:
+        raise ValueError('{} names given for {} columns'.format(len(names), 
+                                                                n_columns))
+
+    derived = [name for name in DERIVED_COLUMNS if name not in names]
+    names += derived[:n_columns - len(names)]
+    names += [str(i) for i in range(len(names), n_columns)]
+
+    if len(set(names)) != len(names):
+        raise ValueError('column names are not unique')
+
+    return names
+
+
+def _column_names(names, n_columns):
+
+    if names is None:
+        return [str(i) for i in range(n_columns)]
+
+    names = [str(name) for name in names]
+    if len(names) != n_columns:
+        raise ValueError('{} names given for {} columns'.format(len(names), 
+                                                                n_columns))
+    return names
+
+
+def _file_sha1(filename):
+
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _decode_datestr(datestr):
+    """
+    Decodes dates of DATESTR_FORMATS with the same length from the bytes of
+    their fixed width fields. Returns None if they do not match the formats.
+    """
+
+    if len(datestr) == 0:
+        return pd.DatetimeIndex([])
+
+    width = len(datestr[0])
+    if width not in (11, 17, 20) or np.any(np.char.str_len(datestr) != width):
+        return None
+
+    try:
+        chars = np.char.encode(datestr, 'ascii')
+    except UnicodeEncodeError:
+        return None
+    chars = chars.view(np.uint8).reshape(len(datestr), width)
+
+    # Separators of 'dd-mmm-yyyy HH:MM:SS'.
+    template = np.frombuffer(b'00-Mmm-0000 00:00:00'[:width], dtype=np.uint8)
+    separators = np.isin(template, np.frombuffer(b'- :', dtype=np.uint8))
+    if np.any(chars[:, separators] != template[separators]):
+        return None
+
+    digits = chars.astype(np.int64) - ord('0')
+    numeric = template == ord('0')
+    if np.any((digits[:, numeric] < 0) | (digits[:, numeric] > 9)):
+        return None
+
+    def field(start, stop):
+        value = np.zeros(len(datestr), dtype=np.int64)
+        for i in range(start, stop):
+            value = value * 10 + digits[:, i]
+        return value
+
+    # Every month name is identified by its three characters.
+    month_keys = np.array([sum(ord(c) << (8 * i) for i, c in 
+                               enumerate(month)) for month in _MONTHS])
+    keys = (chars[:, 3].astype(np.int64) + (chars[:, 4].astype(np.int64) << 8) 
+            + (chars[:, 5].astype(np.int64) << 16))
+    order = np.argsort(month_keys)
+    pos = np.clip(np.searchsorted(month_keys[order], keys), 0, 11)
+    month = order[pos]
+    if np.any(month_keys[month] != keys):
+        return None
+
+    months = (field(7, 11) - 1970) * 12 + month
+    dates = (months.astype('datetime64[M]').astype('datetime64[D]') 
+             + (field(0, 2) - 1))
+
+    seconds = np.zeros(len(datestr), dtype=np.int64)
+    if width >= 17:
+        seconds += field(12, 14) * 3600 + field(15, 17) * 60
+    if width == 20:
+        seconds += field(18, 20)
+
+    return pd.DatetimeIndex(dates.astype('datetime64[ns]') 
+                            + seconds.astype('timedelta64[s]'))
+
+
+def _read_tab_records(filename, format, names, tz):
+    """
+    Reads a tab separated archive with a header, whose first two columns are
+    the date and the time of every record.
+    """
+
+    frame = pd.read_csv(filename, sep='\t', encoding='latin-1')
+
+    times = pd.DatetimeIndex(pd.to_datetime(
+        frame.iloc[:, 0].str.strip() + ' ' + frame.iloc[:, 1].str.strip(), 
+        format=format))
+
+    return pd.DataFrame(frame.iloc[:, 2:].to_numpy(dtype=np.float64), 
+                        index=_localize(times, tz), columns=list(names))
+
+
+def _utc_times(times):
+    """
+    Naive times, converted to UTC if they have a time zone.
+    """
+
+    times = pd.DatetimeIndex(times)
+    if times.tz is not None:
+        times = times.tz_convert('UTC').tz_localize(None)
+    return times
+
+
+def _localize(times, tz):
+    """
+    Sets the time zone of naive times, with tz given as in Location.
+    """
+
+    if tz is None:
+        return times
+
+    if isinstance(tz, (int, float)):
+        tz = datetime.timezone(datetime.timedelta(hours=tz))
+
+    return times.tz_localize(tz)
@@ -0,0 +1,516 @@
+"""
+The ``cpvlocation`` module contains the CPV system classes bound to a 
+:py:class:`pvlib.location.Location`.
+
+They are kept apart from ``cpvsystem`` so that pvlib is only imported when a 
+located system is used; ``cpvsystem`` still exposes them on first access.
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from pvlib.location import Location
+
+from cpvsystem import CPVSystem, StaticCPVSystem
+
+
+SOLAR_GEOMETRY_COLUMNS = ('apparent_zenith', 'zenith', 'apparent_elevation', 
+                          'elevation', 'azimuth', 'equation_of_time', 
+                          'airmass_relative', 'airmass_absolute')
+
+_NS_PER_DAY = 86400 * 10**9
+
+# Outputs of run_model, in the order of the model chain.
+DIODE_PARAM_NAMES = ('photocurrent', 'saturation_current', 
+                     'resistance_series', 'resistance_shunt', 'nNsVth')
+
+MODEL_OUTPUTS = (('temp_cell',) + DIODE_PARAM_NAMES 
+                 + ('i_sc', 'v_oc', 'i_mp', 'v_mp', 'p_mp', 'uf', 'p_mp_uf',
+                    'airmass', 'zenith', 'azimuth', 'aoi'))
+
+_GEOMETRY_OUTPUTS = {'airmass': 'airmass_relative', 'zenith': 'zenith', 
+                     'azimuth': 'azimuth', 'aoi': 'aoi'}
+
+
+class SolarGeometryCache(object):
+    """
+    The SolarGeometryCache class keeps the solar position and airmass 
+    calculated for a site, so that every timestamp is only calculated once 
+    for a site and model.
+
+    The results are stored in blocks of one UTC day per site and model. The 
+    blocks are kept in memory up to max_blocks, discarding the least recently
+    used ones, and also written to path if given, from where they are read 
+    back by later runs.
+
+    Parameters
+    ----------
+    path : None or string, default None
+        Directory of the on-disk store. If None, the cache is only kept in 
+        memory.
+
+    max_blocks : int, default 366
+        Maximum number of site-day blocks kept in memory.
+    """
+
+    def __init__(self, path=None, max_blocks=366):
+
+        self.path = path
+        self.max_blocks = max_blocks
+        self._blocks = OrderedDict()
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def __repr__(self):
+        return 'SolarGeometryCache: \n  path: {}\n  blocks: {}/{}'.format(
+            self.path, len(self._blocks), self.max_blocks)
+
+    def get(self, location, times, airmass_model='kastenyoung1989', 
+            pressure=None, temperature=12, method='nrel_numpy'):
+        """
+        Retrieves the solar position and airmass of a location, calculating 
+        only the timestamps not cached yet.
+
+        Parameters
+        ----------
+        location : Location
+        times : DatetimeIndex or array-like of datetimes
+            Naive times are taken as UTC, as in pvlib.solarposition.
+        airmass_model : string, default 'kastenyoung1989'
+            See atmosphere.get_relative_airmass.
+        pressure : None or float, default None
+            See Location.get_solarposition.
+        temperature : float, default 12
+            See Location.get_solarposition.
+        method : string, default 'nrel_numpy'
+            See solarposition.get_solarposition.
+
+        Returns
+        -------
+        solar_geometry : DataFrame
+            Columns are SOLAR_GEOMETRY_COLUMNS, with times as index.
+        """
+
+        times = pd.DatetimeIndex(times)
+        stamps = times.asi8
+        key = (location.latitude, location.longitude, location.altitude,
+               airmass_model, pressure, temperature, method)
+
+        # The distinct timestamps are split by UTC day.
+        unique_stamps = np.unique(stamps)
+        day_starts = np.flatnonzero(np.diff(unique_stamps // _NS_PER_DAY)) + 1
+
+        blocks = [self._get_block(location, key, day_stamps)
+                  for day_stamps in np.split(unique_stamps, day_starts)
+                  if len(day_stamps)]
+
+        if not blocks:
+            return pd.DataFrame(columns=SOLAR_GEOMETRY_COLUMNS, index=times,
+                                dtype=np.float64)
+
+        cached = {name: np.concatenate([block[name] for block in blocks])
+                  for name in ('time',) + SOLAR_GEOMETRY_COLUMNS}
+        idx = np.searchsorted(cached['time'], stamps)
+
+        return pd.DataFrame(OrderedDict(
+            (name, cached[name][idx]) for name in SOLAR_GEOMETRY_COLUMNS),
+            index=times)
+
+    def clear(self):
+        """
+        Empties the in-memory blocks. The on-disk store is kept.
+        """
+
+        self._blocks.clear()
+
+    def _get_block(self, location, key, stamps):
+
+        block_key = key + (int(stamps[0] // _NS_PER_DAY),)
+
+        block = self._blocks.pop(block_key, None)
+        if block is None:
+            block = self._read(block_key)
+
+        if block is None:
+            missing = stamps
+        else:
+            missing = stamps[~np.isin(stamps, block['time'], 
+                                      assume_unique=True)]
+
+        if len(missing):
+            computed = _calc_solar_geometry(location, missing, *key[3:])
+            if block is not None:
+                order = np.argsort(np.concatenate((block['time'], missing)))
+                computed = {name: np.concatenate((block[name], 
+                                                  computed[name]))[order]
+                            for name in computed}
+            block = computed
+            self._write(block_key, block)
+
+        # The block becomes the most recently used one.
+        self._blocks[block_key] = block
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+
+        return block
+
+    def _block_file(self, block_key):
+
+        site_model = hashlib.sha1(repr(block_key[:-1]).encode()).hexdigest()
+        return os.path.join(self.path, '{}_{}.npz'.format(site_model[:16],
+                                                          block_key[-1]))
+
+    def _read(self, block_key):
+
+        if self.path is None or not os.path.exists(self._block_file(
+                block_key)):
+            return None
+
+        with np.load(self._block_file(block_key)) as data:
+            return {name: data[name] for name in data.files}
+
+    def _write(self, block_key, block):
+
+        if self.path is None:
+            return
+
+        # The file is replaced at once so that readers never see it partially
+        # written.
+        filename = self._block_file(block_key)
+        with open(filename + '.tmp', 'wb') as f:
+            np.savez(f, **block)
+        os.replace(filename + '.tmp', filename)
+
+
+def _calc_solar_geometry(location, stamps, airmass_model='kastenyoung1989', 
+                         pressure=None, temperature=12, method='nrel_numpy'):
+    """
+    Solar position and airmass of a location for UTC timestamps in ns.
+    """
+
+    times = pd.DatetimeIndex(stamps, tz='UTC')
+
+    solar_position = location.get_solarposition(times, pressure=pressure,
+                                                temperature=temperature,
+                                                method=method)
+    airmass = location.get_airmass(solar_position=solar_position,
+                                   model=airmass_model)
+
+    geometry = {'time': np.asarray(stamps, dtype=np.int64)}
+    for name in SOLAR_GEOMETRY_COLUMNS:
+        if name in airmass:
+            geometry[name] = airmass[name].values
+        else:
+            geometry[name] = solar_position[name].values
+
+    return geometry
+
+
+# Cache shared by the located systems that are not given their own.
+solar_geometry_cache = SolarGeometryCache()
+
+
+class _LocalizedModelMixin(object):
+    """
+    Solar geometry and model chain shared by the located systems, which 
+    define the default weather columns in ``_WEATHER_COLUMNS``.
+    """
+
+    def get_solar_geometry(self, times, airmass_model='kastenyoung1989',
+                           pressure=None, temperature=12, 
+                           method='nrel_numpy'):
+        """
+        Retrieves the solar position and airmass of the system location 
+        from ``self.solar_cache``, calculating only the timestamps not 
+        cached yet.
+
+        Parameters
+        ----------
+        times : DatetimeIndex or array-like of datetimes
+        airmass_model : string, default 'kastenyoung1989'
+        pressure : None, float or array-like, default None
+        temperature : float or array-like, default 12
+        method : string, default 'nrel_numpy'
+
+        Returns
+        -------
+        solar_geometry : DataFrame
+            Columns are SOLAR_GEOMETRY_COLUMNS, and ``aoi`` for static 
+            systems. Arrays of pressure or temperature are calculated 
+            without the cache.
+        """
+
+        if np.ndim(pressure) or np.ndim(temperature):
+            times = pd.DatetimeIndex(times)
+            geometry = pd.DataFrame(_calc_solar_geometry(
+                self, times.asi8, airmass_model, pressure, temperature, 
+                method), index=times).drop(columns='time')
+        else:
+            geometry = self.solar_cache.get(self, times, airmass_model, 
+                                            pressure, temperature, method)
+
+        if isinstance(self, StaticCPVSystem):
+            geometry['aoi'] = self.get_aoi(geometry['zenith'], 
+                                           geometry['azimuth'])
+
+        return geometry
+
+    def run_model(self, weather, uf=None, outputs=None, columns=None, 
+                  method='lambertw', block_size=2**16):
+        """
+        Runs the model chain of the system on the weather: cell temperature, 
+        diode parameters, single diode solution and the correction by the 
+        utilization factors.
+
+        The chain is run in blocks of block_size samples, which are written 
+        into a single preallocated array, so the memory used does not grow 
+        with intermediate results. Only the requested outputs and the steps 
+        they depend on are calculated.
+
+        Parameters
+        ----------
+        weather : DataFrame or MeasurementTable
+            Weather of every time step, with the poa_global and 
+            effective_irradiance irradiances ('gni' and 'dni' for tracked 
+            systems, 'gii' and 'dii' for static ones), 'temp_air' and 
+            optionally 'wind_speed' (1 m/s if missing). The utilization 
+            factor inputs not found in weather are taken from the solar 
+            geometry at its times.
+
+        uf : None, dict or UFEvaluator, default None
+            Utilization factors, as {column: (thld, m_low, m_high, 
+            weight)} or compiled by cpvpipeline.make_uf_evaluator. In static 
+            systems the 'aoi' one multiplies the weighted sum of the others,
+            see StaticCPVSystem.get_static_utilization_factor.
+
+        outputs : None or sequence of str, default None
+            Names in MODEL_OUTPUTS to return. If None, 'temp_cell' and 
+            'p_mp', and also 'uf' and 'p_mp_uf' if uf is given.
+
+        columns : None or dict, default None
+            Names of the 'poa_global', 'effective_irradiance', 'temp_air' 
+            and 'wind_speed' columns of weather, and of the utilization 
+            factor inputs, if they differ from the defaults.
+
+        method : string, default 'lambertw'
+            Single diode method, see CPVSystem.singlediode. 'fast' is 
+            quicker, but approximate.
+
+        block_size : int, default 65536
+            Time steps calculated at once.
+
+        Returns
+        -------
+        results : DataFrame
+            The outputs, indexed by the times of weather.
+        """
+
+        return _run_model(self, weather, uf, outputs, columns, method, 
+                          block_size)
+
+
+class LocalizedCPVSystem(_LocalizedModelMixin, CPVSystem, Location):
+    """
+    The LocalizedCPVSystem class defines a standard set of installed CPV
+    system attributes and modeling functions. This class combines the
+    attributes and methods of the CPVSystem and Location classes.
+
+    The LocalizedCPVSystem may have bugs due to the difficulty of
+    robustly implementing multiple inheritance. See
+    :py:class:`~pvlib.modelchain.ModelChain` for an alternative paradigm
+    for modeling PV systems at specific locations.
+    """
+    def __init__(self, cpvsystem=None, location=None, **kwargs):
+
+        # get and combine attributes from the cpvsystem and/or location
+        # with the rest of the kwargs
+
+        if cpvsystem is not None:
+            cpv_dict = cpvsystem.__dict__
+        else:
+            cpv_dict = {}
+
+        if location is not None:
+            loc_dict = location.__dict__
+        else:
+            loc_dict = {}
+
+        new_kwargs = dict(list(cpv_dict.items()) +
+                          list(loc_dict.items()) +
+                          list(kwargs.items()))
+
+        CPVSystem.__init__(self, **new_kwargs)
+        Location.__init__(self, **new_kwargs)
+
+        self.solar_cache = new_kwargs.get('solar_cache')
+        if self.solar_cache is None:
+            self.solar_cache = solar_geometry_cache
+
+    def __repr__(self):
+        attrs = ['name', 'latitude', 'longitude', 'altitude', 'tz', 'module', 
+                 'inverter', 'albedo', 'racking_model']
+        return ('LocalizedCPVSystem: \n  ' + '\n  '.join(
+            ('{}: {}'.format(attr, getattr(self, attr)) for attr in attrs)))
+
+    _WEATHER_COLUMNS = {'poa_global': 'gni', 'effective_irradiance': 'dni', 
+                        'temp_air': 'temp_air', 'wind_speed': 'wind_speed'}
+
+
+class LocalizedStaticCPVSystem(_LocalizedModelMixin, StaticCPVSystem, 
+                               Location):
+    """
+    The LocalizedStaticCPVSystem class defines a standard set of installed 
+    Static CPV system attributes and modeling functions. This class combines 
+    the attributes and methods of the StaticCPVSystem and Location classes.
+
+    The LocalizedStaticCPVSystem may have bugs due to the difficulty of
+    robustly implementing multiple inheritance. See
+    :py:class:`~pvlib.modelchain.ModelChain` for an alternative paradigm
+    for modeling PV systems at specific locations.
+    """
+    def __init__(self, staticcpvsystem=None, location=None, **kwargs):
+
+        # get and combine attributes from the staticcpvsystem and/or location
+        # with the rest of the kwargs
+
+        if staticcpvsystem is not None:
+            staticcpv_dict = staticcpvsystem.__dict__
+        else:
+            staticcpv_dict = {}
+
+        if location is not None:
+            loc_dict = location.__dict__
+        else:
+            loc_dict = {}
+
+        new_kwargs = dict(list(staticcpv_dict.items()) +
+                          list(loc_dict.items()) +
+                          list(kwargs.items()))
+
+        StaticCPVSystem.__init__(self, **new_kwargs)
+        Location.__init__(self, **new_kwargs)
+
+        self.solar_cache = new_kwargs.get('solar_cache')
+        if self.solar_cache is None:
+            self.solar_cache = solar_geometry_cache
+
+    def __repr__(self):
+        attrs = ['name', 'latitude', 'longitude', 'altitude', 'tz',
+                 'surface_tilt', 'surface_azimuth', 'module', 'inverter',
+                 'albedo', 'racking_model']
+        return ('LocalizedStaticCPVSystem: \n  ' + '\n  '.join(
+            ('{}: {}'.format(attr, getattr(self, attr)) for attr in attrs)))
+
+    _WEATHER_COLUMNS = {'poa_global': 'gii', 'effective_irradiance': 'dii', 
+                        'temp_air': 'temp_air', 'wind_speed': 'wind_speed'}
+
+
+def _run_model(system, weather, uf, outputs, columns, method, block_size):
+    """
+    Model chain of a located system, see LocalizedCPVSystem.run_model.
+    """
+
+    if uf is not None:
+        uf = system._get_uf_evaluator(uf)
+
+    if outputs is None:
+        outputs = ('temp_cell', 'p_mp')
+        if uf is not None:
+            outputs += ('uf', 'p_mp_uf')
+    outputs = tuple(outputs)
+
+    unknown = [name for name in outputs if name not in MODEL_OUTPUTS]
+    if unknown:
+        raise ValueError('Unknown model outputs: {}'.format(unknown))
+    if uf is None and ('uf' in outputs or 'p_mp_uf' in outputs):
+        raise ValueError('The utilization factors are needed for the uf '
+                         'outputs')
+
+    columns = dict(system._WEATHER_COLUMNS, **(columns or {}))
+    times = getattr(weather, 'times', None)
+    if times is None and isinstance(weather, pd.DataFrame):
+        times = weather.index
+
+    def get_weather(name, default=None):
+        if columns[name] not in weather and default is not None:
+            return np.full(len(weather), default)
+        return np.asarray(weather[columns[name]], dtype=np.float64)
+
+    # The steps needed by the outputs.
+    need_uf = 'uf' in outputs or 'p_mp_uf' in outputs
+    uf_columns = uf.columns if need_uf else []
+    # The utilization factor inputs are renamed by columns too.
+    uf_inputs = {name: np.asarray(weather[columns.get(name, name)], 
+                                  dtype=np.float64)
+                 for name in uf_columns if columns.get(name, name) in weather}
+    geometry_names = [name for name in _GEOMETRY_OUTPUTS 
+                      if name in outputs 
+                      or (name in uf_columns and name not in uf_inputs)]
+    need_dc = 'p_mp_uf' in outputs or any(
+        name in outputs for name in ('i_sc', 'v_oc', 'i_mp', 'v_mp', 'p_mp'))
+    need_params = need_dc or any(name in outputs 
+                                 for name in DIODE_PARAM_NAMES)
+    need_temp = need_params or 'temp_cell' in outputs
+
+    if geometry_names and times is None:
+        raise ValueError('The solar geometry needs the times of weather')
+
+    if need_temp:
+        poa_global = get_weather('poa_global')
+        temp_air = get_weather('temp_air')
+        wind_speed = get_weather('wind_speed', 1.0)
+    if need_params:
+        effective_irradiance = get_weather('effective_irradiance')
+
+    n = len(weather)
+    results = np.empty((len(outputs), n))
+    rows = {name: results[i] for i, name in enumerate(outputs)}
+
+    for start in range(0, n, block_size):
+        block = slice(start, min(start + block_size, n))
+        values = {}
+
+        if geometry_names:
+            geometry = system.get_solar_geometry(times[block])
+            for name in geometry_names:
+                if _GEOMETRY_OUTPUTS[name] in geometry:
+                    values[name] = geometry[_GEOMETRY_OUTPUTS[name]].values
+                else:
+                    # Dual axis trackers keep the modules at normal 
+                    # incidence.
+                    values[name] = np.zeros(len(geometry))
+
+        if need_temp:
+            values['temp_cell'] = np.asarray(system.pvsyst_celltemp(
+                poa_global[block], temp_air[block], wind_speed[block]))
+
+        if need_params:
+            values.update(zip(DIODE_PARAM_NAMES, system.calcparams_pvsyst(
+                effective_irradiance[block], values['temp_cell'])))
+
+        if need_dc:
+            values.update(system.singlediode(
+                *(values[name] for name in DIODE_PARAM_NAMES), 
+                method=method))
+
+        if need_uf:
+            uf_block = rows['uf'][block] if 'uf' in rows else None
+            values['uf'] = uf({name: uf_inputs[name][block] 
+                               if name in uf_inputs else values[name]
+                               for name in uf_columns}, out=uf_block)
+
+        if 'p_mp_uf' in outputs:
+            np.multiply(values['p_mp'], values['uf'], 
+                        out=rows['p_mp_uf'][block])
+
+        for name in outputs:
+            if name not in ('uf', 'p_mp_uf'):
+                rows[name][block] = values[name]
+
+    # The frame is a view of the results, without copying them.
+    return pd.DataFrame(results.T, index=times, columns=list(outputs), 
+                        copy=False)
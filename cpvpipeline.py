@@ -0,0 +1,1229 @@
+"""
+The ``cpvpipeline`` module contains a runner that chains the stages of the
+CPV modeling workflow in memory, from the measurement archives to the
+PVsyst prediction corrected by the utilization factors.
+
+Every stage is identified by a key computed from its function, parameters
+and the keys of its inputs, so a change of one input or parameter only
+runs again the stages that depend on it.
+
+The utilization factors of many modules and time windows are calibrated in
+parallel by calibrate_uf.
+
+Archives larger than the memory are processed chunk by chunk by 
+calibrate_chunked and predict_chunked, through generator stages that read,
+complete, filter and predict blocks of rows, and accumulators of the binned 
+medians, regression sums and deviations that are merged across the chunks.
+"""
+
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import cpvdata
+from cpvsystem import (BinnedStatAccumulator, OnlineUFFitter, 
+                       RegressionAccumulator, RMSDAccumulator, UFEvaluator,
+                       UFWeightsAccumulator, calc_binned_stat, calc_uf_lines,
+                       calc_uf_weights, get_simple_util_factor)
+
+
+class Pipeline(object):
+    """
+    The Pipeline class runs named stages that pass their results in memory.
+
+    Stages are functions whose positional arguments are the results of
+    other stages or the values of inputs given with set_input, and whose
+    keyword arguments are the stage parameters. The result of every stage is
+    kept with its key, in memory and, if cache_path is given, on disk.
+
+    Parameters
+    ----------
+    cache_path : None or string, default None
+        Directory where the results of the cached stages are stored between
+        runs. If None, they are only kept in memory.
+    """
+
+    def __init__(self, cache_path=None):
+
+        self.cache_path = cache_path
+        self.executed = []
+
+        self._stages = OrderedDict()
+        self._inputs = {}
+        self._results = {}
+
+        if cache_path is not None:
+            os.makedirs(cache_path, exist_ok=True)
+
+    def __repr__(self):
+        return 'Pipeline: \n  inputs: {}\n  stages: {}'.format(
+            ', '.join(self._inputs), ', '.join(self._stages))
+
+    def __getitem__(self, name):
+        return self._results[name][1]
+
+    def __contains__(self, name):
+        return name in self._results
+
+    def add_stage(self, name, func, inputs=(), params=None, cache=True):
+        """
+        Adds a stage, replacing any stage of the same name.
+
+        Parameters
+        ----------
+        name : string
+        func : callable
+            Called as func(*inputs, **params).
+        inputs : sequence of strings, default ()
+            Names of the stages or inputs whose values are passed to func.
+        params : None or dict, default None
+            Keyword arguments of func.
+        cache : bool, default True
+            If False, the result is not kept and the stage runs on every
+            run that needs it.
+        """
+
+        if name in self._inputs:
+            raise ValueError('{!r} is already an input'.format(name))
+
+        self._stages[name] = {'func': func, 'inputs': tuple(inputs),
+                              'params': dict(params or {}), 'cache': cache}
+
+    def set_input(self, name, value):
+        """
+        Sets the value of an input of the stages, such as a file name or an
+        array.
+        """
+
+        if name in self._stages:
+            raise ValueError('{!r} is already a stage'.format(name))
+
+        self._inputs[name] = (_fingerprint(value), value)
+
+    def set_params(self, name, **params):
+        """
+        Updates the parameters of a stage.
+        """
+
+        self._stages[name]['params'].update(params)
+
+    def invalidate(self, name=None):
+        """
+        Discards the in-memory result of a stage, or of every stage if name
+        is None. Results stored on disk are kept.
+        """
+
+        if name is None:
+            self._results.clear()
+        else:
+            self._results.pop(name, None)
+
+    def run(self, targets=None):
+        """
+        Runs the stages needed to get the targets whose result is missing or
+        out of date.
+
+        Parameters
+        ----------
+        targets : None, string or sequence of strings, default None
+            Stages to get. If None, every stage.
+
+        Returns
+        -------
+        results : OrderedDict
+            Result of every target stage. The names of the stages that were
+            run are kept in the executed attribute.
+        """
+
+        if targets is None:
+            targets = list(self._stages)
+        elif isinstance(targets, str):
+            targets = [targets]
+
+        self.executed = []
+        keys = {}
+        values = {}
+        for name in targets:
+            self._evaluate(name, keys, values, ())
+
+        return OrderedDict((name, values[name]) for name in targets)
+
+    def _evaluate(self, name, keys, values, path):
+
+        if name in keys:
+            return
+        if name in self._inputs:
+            keys[name], values[name] = self._inputs[name]
+            return
+        if name in path:
+            raise ValueError('cycle of stages: {}'.format(
+                ' -> '.join(path + (name,))))
+        if name not in self._stages:
+            raise KeyError('no stage or input named {!r}'.format(name))
+
+        stage = self._stages[name]
+        for input_name in stage['inputs']:
+            self._evaluate(input_name, keys, values, path + (name,))
+
+        key = _fingerprint((name, _function_id(stage['func']),
+                            sorted(stage['params'].items()),
+                            [keys[input_name]
+                             for input_name in stage['inputs']]))
+        keys[name] = key
+
+        cached = self._results.get(name)
+        if cached is not None and cached[0] == key:
+            values[name] = cached[1]
+            return
+
+        found, result = self._read(name, key) if stage['cache'] else (False,
+                                                                      None)
+        if not found:
+            result = stage['func'](*[values[input_name]
+                                     for input_name in stage['inputs']],
+                                   **stage['params'])
+            self.executed.append(name)
+            if stage['cache']:
+                self._write(name, key, result)
+
+        values[name] = result
+        if stage['cache']:
+            self._results[name] = (key, result)
+
+    def _result_file(self, name, key):
+
+        return os.path.join(self.cache_path, '{}-{}.pkl'.format(name, key))
+
+    def _read(self, name, key):
+
+        if self.cache_path is None or not os.path.exists(
+                self._result_file(name, key)):
+            return False, None
+
+        with open(self._result_file(name, key), 'rb') as f:
+            return True, pickle.load(f)
+
+    def _write(self, name, key, result):
+
+        if self.cache_path is None:
+            return
+
+        filename = self._result_file(name, key)
+        with open(filename + '.tmp', 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(filename + '.tmp', filename)
+
+
+# Stage parameters of the utilization factor workflow of every source, from
+# the F4 and F5 scripts.
+WORKFLOW_PRESETS = {
+    'insolight': {
+        'filter': {'rules': 'insolight'},
+        'uf_airmass': {'held': cpvdata.STRATUM_PRESETS['insolight'][
+                           'nontemp'],
+                       'ratio': 'i_sc/dni', 'start': 2, 'stop': 5.0,
+                       'limit': 4.0, 'ratio_ref': 0.96 / 1000},
+        'uf_temp_air': {'held': cpvdata.STRATUM_PRESETS['insolight'][
+                            'nonairmass'],
+                        'ratio': 'i_sc/dni', 'ratio_ref': 0.96 / 1000},
+        'dc': {'poa_global': 'gni', 'effective_irradiance': 'dni',
+               'wind_speed': 'wind_speed'}},
+    'm300': {
+        'filter': {'rules': 'm300'},
+        'uf_airmass': {'held': cpvdata.STRATUM_PRESETS['m300']['nontemp'],
+                       'ratio': 'i_sc_dni', 'start': 1, 'stop': 2.8,
+                       'limit': None, 'ratio_ref': 3.346 / 1000},
+        'uf_temp_air': {'held': cpvdata.STRATUM_PRESETS['m300'][
+                            'nonairmass'],
+                        'ratio': 'i_sc_dni', 'ratio_ref': 3.346 / 1000},
+        'dc': {'poa_global': 'gni', 'effective_irradiance': 'dni',
+               'wind_speed': 'wind_speed'}},
+    'insolight_may': {
+        'filter': {'rules': 'insolight_may'},
+        'uf_aoi': {'ratio': 'i_sc/dii', 'limit': 60, 
+                   'ratio_ref': 0.96 / 1000},
+        'dc': {'poa_global': 'gii', 'effective_irradiance': 'dii',
+               'wind_speed': 'wind_speed'}}}
+
+# Candidate limits of the angle of incidence utilization factor fitted 
+# chunk by chunk when the preset does not force one.
+_AOI_CANDIDATES = np.arange(1.0, 90.0, 0.5)
+
+# Utilization factor fits of calibrate_uf, with the prefix of their 
+# parameters in the calibration table and the column they depend on.
+_CALIBRATION_FITS = (('uf_airmass', 'am', 'airmass'), 
+                     ('uf_temp_air', 'ta', 'temp_air'), 
+                     ('uf_aoi', 'aoi', 'aoi'))
+
+
+def make_uf_pipeline(data_file, datestr_file, system, location,
+                     source='insolight', cache_path=None):
+    """
+    Builds the pipeline of the utilization factor workflow: measurements,
+    solar geometry, filtering, airmass and ambient temperature utilization
+    factors, PVsyst model, weights of the utilization factors and corrected
+    prediction.
+
+    Parameters
+    ----------
+    data_file : string
+        Numeric archive of the measurements, e.g. insolight_data.txt.
+    datestr_file : string
+        Dates of the measurements, e.g. insolight_datestr.txt.
+    system : CPVSystem
+        System with the PVsyst module parameters.
+    location : Location
+        Location of the system. The dates are taken as UTC, as in the F2 
+        scripts.
+    source : string, default 'insolight'
+        Key of WORKFLOW_PRESETS and MEASUREMENT_SCHEMAS, of a preset with 
+        the airmass and ambient temperature fits.
+    cache_path : None or string, default None
+        See Pipeline.
+
+    Returns
+    -------
+    pipeline : Pipeline
+        Stages 'measurements', 'solar_geometry', 'filtered', 'uf_airmass',
+        'uf_temp_air', 'dc', 'uf_weights' and 'prediction'.
+    """
+
+    preset = WORKFLOW_PRESETS[source]
+    missing = [stage for stage in ('uf_airmass', 'uf_temp_air', 'dc') 
+               if stage not in preset]
+    if missing:
+        raise ValueError('The workflow preset {!r} has no {} stages, see '
+                         'calibrate_uf and calibrate_chunked'.format(
+                             source, ', '.join(missing)))
+
+    pipeline = Pipeline(cache_path=cache_path)
+    pipeline.set_input('data_file', data_file)
+    pipeline.set_input('datestr_file', datestr_file)
+    pipeline.set_input('system', system)
+    pipeline.set_input('location', location)
+
+    pipeline.add_stage('measurements', load_measurements,
+                       ('data_file', 'datestr_file'),
+                       {'schema': source}, cache=False)
+    pipeline.add_stage('solar_geometry', get_measurement_geometry,
+                       ('measurements', 'location'))
+    pipeline.add_stage('filtered', filter_complete_measurements,
+                       ('measurements', 'solar_geometry'), preset['filter'])
+    pipeline.add_stage('uf_airmass', fit_airmass_uf, ('filtered',),
+                       preset['uf_airmass'])
+    pipeline.add_stage('uf_temp_air', fit_temp_air_uf, ('filtered',),
+                       preset['uf_temp_air'])
+    pipeline.add_stage('dc', calc_measurement_dc, ('filtered', 'system'),
+                       preset['dc'])
+    pipeline.add_stage('uf_weights', fit_uf_weights,
+                       ('filtered', 'dc', 'uf_airmass', 'uf_temp_air'))
+    pipeline.add_stage('prediction', predict_power,
+                       ('filtered', 'dc', 'uf_airmass', 'uf_temp_air',
+                        'uf_weights'))
+
+    return pipeline
+
+
+def load_measurements(data_file, datestr_file, schema=None):
+    """
+    Loads the measurements with their dates, which are taken as UTC.
+    """
+
+    times = cpvdata.read_datestr(datestr_file, tz='UTC')
+
+    return cpvdata.MeasurementTable.from_file(data_file, schema=schema,
+                                              times=times)
+
+
+def get_measurement_geometry(measurements, location):
+    """
+    Solar position and airmass at the dates of the measurements, through the
+    shared solar geometry cache.
+    """
+
+    from cpvlocation import solar_geometry_cache
+
+    return solar_geometry_cache.get(location, measurements.times)
+
+
+def filter_complete_measurements(measurements, solar_geometry, rules):
+    """
+    Attaches the airmass, zenith and azimuth to the measurements and keeps
+    the rows that meet the filter rules.
+
+    Returns
+    -------
+    filtered : MeasurementTable
+    rejections : OrderedDict
+        See cpvdata.get_filter_mask.
+    """
+
+    complete = measurements.select(slice(None))
+    complete.add_columns(solar_geometry[['airmass_relative', 'zenith',
+                                         'azimuth']],
+                         names={'airmass_relative': 'airmass'})
+
+    return cpvdata.filter_measurements(complete, rules)
+
+
+def fit_airmass_uf(filtered, held, ratio, start, stop, limit, ratio_ref):
+    """
+    Fits the airmass utilization factor on the medians of ratio by airmass
+    bin, within the stratum of the held variables.
+
+    Returns
+    -------
+    uf : dict
+        'thld', 'm_low' and 'm_high' of get_simple_util_factor.
+    """
+
+    table = filtered[0]
+    stratum, _ = cpvdata.get_stratum_mask(table, held)
+
+    bins, medians = calc_binned_stat(table['airmass'][stratum],
+                                     cpvdata.get_column(table, ratio)[
+                                         stratum],
+                                     bin_width=0.1, start=start, stop=stop)
+    m_low, n_low, m_high, n_high, thld = calc_uf_lines(bins, medians,
+                                                       limit=limit)
+
+    return {'thld': thld, 'm_low': m_low / ratio_ref,
+            'm_high': m_high / ratio_ref}
+
+
+def fit_temp_air_uf(filtered, held, ratio, ratio_ref):
+    """
+    Fits the ambient temperature utilization factor within the stratum of
+    the held variables.
+
+    Returns
+    -------
+    uf : dict
+        'thld', 'm_low' and 'm_high' of get_simple_util_factor.
+    """
+
+    table = filtered[0]
+    stratum, _ = cpvdata.get_stratum_mask(table, held)
+
+    m_low, n_low, m_high, n_high, thld = calc_uf_lines(
+        table['temp_air'][stratum],
+        cpvdata.get_column(table, ratio)[stratum], 'temp_air')
+
+    return {'thld': thld, 'm_low': m_low / ratio_ref,
+            'm_high': m_high / ratio_ref}
+
+
+def fit_aoi_uf(filtered, ratio, limit, ratio_ref):
+    """
+    Fits the angle of incidence utilization factor of a static system.
+
+    Returns
+    -------
+    uf : dict
+        'thld', 'm_low' and 'm_high' of get_simple_util_factor.
+    """
+
+    table = filtered[0]
+
+    m_low, n_low, m_high, n_high, thld = calc_uf_lines(
+        table['aoi'], cpvdata.get_column(table, ratio), 'aoi', limit=limit)
+
+    return {'thld': thld, 'm_low': m_low / ratio_ref,
+            'm_high': m_high / ratio_ref}
+
+
+def calc_measurement_dc(filtered, system, poa_global, effective_irradiance,
+                        wind_speed, method='lambertw'):
+    """
+    Applies the PVsyst model of system to the filtered measurements.
+
+    Returns
+    -------
+    dc : OrderedDict
+        'temp_cell' and the results of CPVSystem.singlediode.
+    """
+
+    table = filtered[0]
+
+    temp_cell = system.pvsyst_celltemp(table[poa_global], table['temp_air'],
+                                       table[wind_speed])
+    diode_params = system.calcparams_pvsyst(table[effective_irradiance],
+                                            temp_cell)
+
+    dc = OrderedDict(temp_cell=np.asarray(temp_cell))
+    dc.update(system.singlediode(*diode_params, method=method))
+
+    return dc
+
+
+def fit_uf_weights(filtered, dc, uf_airmass, uf_temp_air):
+    """
+    Weights of the airmass and ambient temperature utilization factors.
+
+    Returns
+    -------
+    weights : ndarray
+    rmsd : float
+        See cpvsystem.calc_uf_weights.
+    """
+
+    table = filtered[0]
+    ufs = _get_ufs(table, uf_airmass, uf_temp_air)
+
+    return calc_uf_weights(table['p_mp'], dc['p_mp'], ufs)
+
+
+def predict_power(filtered, dc, uf_airmass, uf_temp_air, uf_weights):
+    """
+    PVsyst prediction corrected by the weighted utilization factors.
+
+    Returns
+    -------
+    prediction : DataFrame
+        'p_mp' of the PVsyst model, 'uf', corrected 'p_mp_uf' and
+        'residuals' to the measured power, indexed by the dates.
+    """
+
+    table = filtered[0]
+    weights, _ = uf_weights
+
+    uf = np.zeros(len(table))
+    for weight, simple_uf in zip(weights, _get_ufs(table, uf_airmass,
+                                                   uf_temp_air)):
+        uf += weight * simple_uf
+
+    p_mp = np.asarray(dc['p_mp'])
+    p_mp_uf = p_mp * uf
+
+    return pd.DataFrame(OrderedDict([('p_mp', p_mp), ('uf', uf),
+                                     ('p_mp_uf', p_mp_uf),
+                                     ('residuals', p_mp_uf - table['p_mp'])]),
+                        index=table.times)
+
+
+def calibrate_uf(tables, jobs, max_workers=None):
+    """
+    Calibrates the utilization factors of many modules and time windows in
+    parallel worker processes.
+
+    Every table is copied once into shared memory, where the workers read 
+    the rows of their window without pickling the measurements. Each job 
+    fits the airmass, ambient temperature and angle of incidence 
+    utilization factors of its preset, and their weights when a system is 
+    given.
+
+    Parameters
+    ----------
+    tables : dict
+        Filtered MeasurementTable by name, with the derived columns the 
+        fits need (airmass, aoi).
+    jobs : sequence of dict
+        'table': name of the table; 'source': key of WORKFLOW_PRESETS; 
+        optional 'start' and 'stop' times of the window, with the times of 
+        the table sorted; optional 'system': CPVSystem for the weights; 
+        optional 'name' of the job. See make_calibration_jobs.
+    max_workers : None or int, default None
+        Number of worker processes, see ProcessPoolExecutor. With 1 the jobs
+        run in this process.
+
+    Returns
+    -------
+    calibration : DataFrame
+        One row per job: name, table, start, stop, n_rows, the 'thld', 
+        'm_low' and 'm_high' of every fitted utilization factor prefixed by
+        'am_', 'ta_' or 'aoi_', the weights 'am_weight' and 'ta_weight', 
+        'rmsd' and the 'error' of the windows that could not be fitted. A 
+        KeyError is raised before any job runs if a table lacks a column of
+        its preset.
+    """
+
+    for job in jobs:
+        _check_calibration_columns(tables[job['table']], job['source'], 
+                                   job.get('system'))
+
+    windows = [_window_rows(tables[job['table']], job.get('start'), 
+                            job.get('stop')) for job in jobs]
+
+    if max_workers == 1:
+        results = [_calibrate_rows(tables[job['table']].values, 
+                                   tables[job['table']].names, start, stop, 
+                                   job['source'], job.get('system'))
+                   for job, (start, stop) in zip(jobs, windows)]
+    else:
+        blocks = {}
+        try:
+            specs = []
+            for job, (start, stop) in zip(jobs, windows):
+                if job['table'] not in blocks:
+                    blocks[job['table']] = _share_table(tables[job['table']])
+                specs.append(dict(blocks[job['table']][1], start=start, 
+                                  stop=stop, source=job['source'],
+                                  system=job.get('system')))
+
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(_calibrate_shared, specs))
+        finally:
+            for block, _ in blocks.values():
+                block.close()
+                block.unlink()
+
+    rows = []
+    for job, result in zip(jobs, results):
+        row = OrderedDict([('name', job.get('name')), 
+                           ('table', job['table']),
+                           ('start', job.get('start')), 
+                           ('stop', job.get('stop'))])
+        row.update(result)
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def make_calibration_jobs(tables, sources, systems=None, freq=None):
+    """
+    Builds the jobs of calibrate_uf for every table and, optionally, every
+    calendar window of its times.
+
+    Parameters
+    ----------
+    tables : dict
+        MeasurementTable by name.
+    sources : dict or string
+        Key of WORKFLOW_PRESETS of every table, or the same for all.
+    systems : None or dict, default None
+        CPVSystem of the tables whose weights are calibrated.
+    freq : None or string, default None
+        Frequency of the windows, e.g. 'MS' for calendar months. If None, 
+        every table is calibrated as a whole.
+
+    Returns
+    -------
+    jobs : list of dict
+    """
+
+    if systems is None:
+        systems = {}
+
+    jobs = []
+    for name, table in tables.items():
+        source = sources if isinstance(sources, str) else sources[name]
+        job = {'table': name, 'source': source, 
+               'system': systems.get(name), 'name': name}
+
+        if freq is None or len(table) == 0:
+            jobs.append(job)
+            continue
+
+        times = table.times
+        edges = pd.date_range(times[0].floor('D'), times[-1], freq=freq, 
+                              tz=times.tz)
+        if len(edges) == 0 or edges[0] > times[0]:
+            edges = edges.insert(0, times[0].floor('D'))
+        edges = edges.append(pd.DatetimeIndex([times[-1] + pd.Timedelta(
+            1, 'ns')]))
+
+        for start, stop in zip(edges[:-1], edges[1:]):
+            jobs.append(dict(job, start=start, stop=stop, 
+                             name='{} {}'.format(name, start.date())))
+
+    return jobs
+
+
+def calibrate_table(table, source, system=None):
+    """
+    Fits the utilization factors of the preset of source on a table and, if
+    system is given, their weights.
+
+    Returns
+    -------
+    calibration : OrderedDict
+        See calibrate_uf.
+    """
+
+    preset = WORKFLOW_PRESETS[source]
+    filtered = (table, None)
+    fit_funcs = {'uf_airmass': fit_airmass_uf, 'uf_temp_air': fit_temp_air_uf,
+                 'uf_aoi': fit_aoi_uf}
+
+    calibration = OrderedDict(n_rows=len(table))
+    ufs = {}
+    for fit, prefix, _ in _CALIBRATION_FITS:
+        if fit in preset:
+            ufs[fit] = fit_funcs[fit](filtered, **preset[fit])
+            for key, value in ufs[fit].items():
+                calibration['{}_{}'.format(prefix, key)] = value
+
+    if (system is not None and 'dc' in preset and 'uf_airmass' in ufs 
+            and 'uf_temp_air' in ufs):
+        dc = calc_measurement_dc(filtered, system, **preset['dc'])
+        weights, rmsd = fit_uf_weights(filtered, dc, ufs['uf_airmass'],
+                                       ufs['uf_temp_air'])
+        calibration['am_weight'], calibration['ta_weight'] = weights
+        calibration['rmsd'] = rmsd
+
+    return calibration
+
+
+def make_uf_evaluator(calibration, clip=('aoi',)):
+    """
+    Compiles the utilization factors of a calibration into a UFEvaluator.
+
+    Parameters
+    ----------
+    calibration : dict or Series
+        A result of calibrate_table or a row of calibrate_uf.
+    clip : tuple of str, default ('aoi',)
+        See UFEvaluator.
+
+    Returns
+    -------
+    evaluator : UFEvaluator
+        The utilization factors with a weight are added and the rest, such 
+        as the angle of incidence one, multiply their sum.
+    """
+
+    uf_params = OrderedDict()
+    factors = OrderedDict()
+    for _, prefix, column in _CALIBRATION_FITS:
+        params = [calibration.get('{}_{}'.format(prefix, key), np.nan)
+                  for key in ('thld', 'm_low', 'm_high', 'weight')]
+        if np.isnan(params[0]):
+            continue
+        if np.isnan(params[3]):
+            factors[column] = tuple(params[:3])
+        else:
+            uf_params[column] = tuple(params)
+
+    return UFEvaluator(uf_params, factors, clip=clip)
+
+
+def iter_complete_measurements(data_file, datestr_file, location, 
+                               source='insolight', chunk_rows=2**16, 
+                               system=None, store=None):
+    """
+    Reads the measurements in chunks of rows and attaches their airmass, 
+    zenith and azimuth, and their angle of incidence if system is static.
+
+    Parameters
+    ----------
+    data_file, datestr_file, location, source
+        See make_uf_pipeline.
+    chunk_rows : int, default 65536
+        See cpvdata.iter_measurements.
+    system : None or CPVSystem, default None
+    store : None or DataStore, default None
+        See cpvdata.load_data.
+
+    Yields
+    ------
+    chunk : MeasurementTable
+    """
+
+    from cpvlocation import solar_geometry_cache
+
+    for chunk in cpvdata.iter_measurements(
+            data_file, schema=source, datestr_filename=datestr_file, 
+            tz='UTC', chunk_rows=chunk_rows, store=store):
+        geometry = solar_geometry_cache.get(location, chunk.times)
+        chunk.add_columns(geometry[['airmass_relative', 'zenith', 
+                                    'azimuth']],
+                          names={'airmass_relative': 'airmass'})
+        if hasattr(system, 'get_aoi'):
+            chunk['aoi'] = system.get_aoi(chunk['zenith'], chunk['azimuth'])
+        yield chunk
+
+
+def iter_filtered_measurements(chunks, rules):
+    """
+    Keeps the rows of every chunk that meet the filter rules.
+
+    Parameters
+    ----------
+    chunks : iterable of MeasurementTable
+        E.g. of iter_complete_measurements.
+    rules : string or sequence of (column, operator, threshold)
+        See cpvdata.get_filter_mask. The thresholds must be numbers, see 
+        resolve_filter_rules.
+
+    Yields
+    ------
+    filtered : MeasurementTable
+    rejections : OrderedDict
+        Rejections of the chunk, see cpvdata.get_filter_mask.
+    """
+
+    if isinstance(rules, str):
+        rules = cpvdata.FILTER_PRESETS[rules]
+    if any(isinstance(threshold, str) for _, _, threshold in rules):
+        raise ValueError('The statistics of the thresholds can not be taken '
+                         'chunk by chunk, see resolve_filter_rules')
+
+    for chunk in chunks:
+        yield cpvdata.filter_measurements(chunk, rules)
+
+
+def resolve_filter_rules(chunks, rules):
+    """
+    Replaces the 'mean' thresholds of the filter rules by the means of their
+    columns over all the chunks.
+
+    Parameters
+    ----------
+    chunks : iterable of MeasurementTable
+    rules : string or sequence of (column, operator, threshold)
+
+    Returns
+    -------
+    rules : list of (column, operator, threshold)
+    """
+
+    if isinstance(rules, str):
+        rules = cpvdata.FILTER_PRESETS[rules]
+
+    columns = [column for column, _, threshold in rules 
+               if isinstance(threshold, str)]
+    if not columns:
+        return list(rules)
+    if any(threshold not in ('mean',) for _, _, threshold in rules 
+           if isinstance(threshold, str)):
+        raise ValueError("Only 'mean' thresholds can be merged across "
+                         "chunks")
+
+    means, _ = _calc_chunked_means(((chunk, None) for chunk in chunks), 
+                                   columns)
+
+    return [(column, operator, means[column] 
+             if isinstance(threshold, str) else threshold)
+            for column, operator, threshold in rules]
+
+
+def iter_power_predictions(filtered_chunks, system, evaluator, 
+                           poa_global='gni', effective_irradiance='dni',
+                           wind_speed='wind_speed', method='lambertw'):
+    """
+    Applies the PVsyst model and the utilization factors to every chunk.
+
+    Parameters
+    ----------
+    filtered_chunks : iterable of (MeasurementTable, rejections)
+        See iter_filtered_measurements.
+    system : CPVSystem
+    evaluator : UFEvaluator
+        See make_uf_evaluator.
+    poa_global, effective_irradiance, wind_speed, method
+        See calc_measurement_dc.
+
+    Yields
+    ------
+    chunk : MeasurementTable
+        The filtered chunk with the 'p_mp_model' of the PVsyst model, 'uf' 
+        and 'p_mp_uf' columns.
+    rejections : OrderedDict
+    """
+
+    for table, rejections in filtered_chunks:
+        dc = calc_measurement_dc((table, None), system, poa_global,
+                                 effective_irradiance, wind_speed, 
+                                 method=method)
+        uf = evaluator(table)
+        table.add_columns(OrderedDict([('p_mp_model', dc['p_mp']), 
+                                       ('uf', uf), 
+                                       ('p_mp_uf', dc['p_mp'] * uf)]))
+        yield table, rejections
+
+
+def calibrate_chunked(data_file, datestr_file, location, source='insolight',
+                      system=None, chunk_rows=2**16, y_bins=4096, 
+                      store=None):
+    """
+    Calibrates the utilization factors of the preset of source, as 
+    calibrate_table, reading the measurements in chunks so that the memory 
+    used does not depend on the length of the archive.
+
+    The archive is read once for the statistics of the filter thresholds, 
+    if any, once for the centers of the strata, once to accumulate the 
+    binned medians and the sums of the regression lines, and once more for 
+    the weights if system is given. The medians are taken from histograms 
+    of y_bins bins, see cpvsystem.BinnedStatAccumulator.
+
+    Parameters
+    ----------
+    data_file, datestr_file, location, source
+        See make_uf_pipeline.
+    system : None or CPVSystem, default None
+        System of the weights, and of the angle of incidence if static.
+    chunk_rows : int, default 65536
+    y_bins : int, default 4096
+    store : None or DataStore, default None
+
+    Returns
+    -------
+    calibration : OrderedDict
+        See calibrate_uf.
+    """
+
+    preset = WORKFLOW_PRESETS[source]
+
+    def chunks():
+        return iter_complete_measurements(data_file, datestr_file, location,
+                                          source, chunk_rows, system, store)
+
+    rules = resolve_filter_rules(chunks(), preset['filter']['rules'])
+
+    def filtered():
+        return iter_filtered_measurements(chunks(), rules)
+
+    # The centers of the strata and the range of the ratios are taken over 
+    # the filtered measurements.
+    held = OrderedDict()
+    for fit in ('uf_airmass', 'uf_temp_air'):
+        if fit in preset:
+            for column, band in preset[fit]['held'].items():
+                if not isinstance(band, tuple):
+                    raise ValueError('Bands sized by n_samples can not be '
+                                     'taken chunk by chunk')
+                held[column] = band
+    ratios = [preset[fit]['ratio'] for fit in ('uf_airmass',) 
+              if fit in preset]
+    means, ranges = _calc_chunked_means(filtered(), list(held) + ratios)
+    held = {column: (means[column] if isinstance(center, str) else center,
+                     low, high) for column, (center, low, high) in 
+            held.items()}
+
+    accumulators = OrderedDict()
+    if 'uf_airmass' in preset:
+        params = preset['uf_airmass']
+        low, high = ranges[params['ratio']]
+        accumulators['uf_airmass'] = BinnedStatAccumulator(
+            0.1, params['start'], params['stop'], 
+            np.linspace(low, high, y_bins + 1))
+    if 'uf_temp_air' in preset:
+        accumulators['uf_temp_air'] = RegressionAccumulator()
+    if 'uf_aoi' in preset:
+        limit = preset['uf_aoi']['limit']
+        accumulators['uf_aoi'] = OnlineUFFitter(
+            _AOI_CANDIDATES if limit is None else [limit])
+
+    n_rows = 0
+    for table, _ in filtered():
+        n_rows += len(table)
+        for fit, accumulator in accumulators.items():
+            params = preset[fit]
+            ratio = cpvdata.get_column(table, params['ratio'])
+            if fit == 'uf_aoi':
+                accumulator.update(table['aoi'], ratio)
+                continue
+
+            stratum, _ = cpvdata.get_stratum_mask(
+                table, {column: held[column] for column in params['held']})
+            x = table['airmass' if fit == 'uf_airmass' else 'temp_air']
+            accumulator.update(x[stratum], ratio[stratum])
+
+    calibration = OrderedDict(n_rows=n_rows)
+    ufs = OrderedDict()
+    for fit, prefix, _ in _CALIBRATION_FITS:
+        if fit not in accumulators:
+            continue
+        accumulator = accumulators[fit]
+
+        if fit == 'uf_airmass':
+            bins, medians = accumulator.result()
+            m_low, _, m_high, _, thld = calc_uf_lines(
+                bins, medians, limit=preset[fit]['limit'])
+        elif fit == 'uf_temp_air':
+            # As calc_uf_lines for 'temp_air': a single line up to 50 C.
+            m_low, _, _ = accumulator.line
+            m_high, thld = 0, 50
+        else:
+            m_low, _, m_high, _, thld = accumulator.params
+
+        ratio_ref = preset[fit]['ratio_ref']
+        ufs[fit] = {'thld': thld, 'm_low': m_low / ratio_ref,
+                    'm_high': m_high / ratio_ref}
+        for key, value in ufs[fit].items():
+            calibration['{}_{}'.format(prefix, key)] = value
+
+    if (system is not None and 'dc' in preset and 'uf_airmass' in ufs 
+            and 'uf_temp_air' in ufs):
+        accumulator = UFWeightsAccumulator(2)
+        for table, _ in filtered():
+            dc = calc_measurement_dc((table, None), system, **preset['dc'])
+            accumulator.update(table['p_mp'], dc['p_mp'], 
+                               _get_ufs(table, ufs['uf_airmass'], 
+                                        ufs['uf_temp_air']))
+        weights, rmsd = accumulator.result()
+        calibration['am_weight'], calibration['ta_weight'] = weights
+        calibration['rmsd'] = rmsd
+
+    return calibration
+
+
+def predict_chunked(data_file, datestr_file, system, location, calibration,
+                    source='insolight', output_file=None, 
+                    output_datestr_file=None, chunk_rows=2**16, store=None):
+    """
+    Predicts the power of the filtered measurements with a calibration, 
+    chunk by chunk, optionally writing the predictions.
+
+    Parameters
+    ----------
+    data_file, datestr_file, location, source
+        See make_uf_pipeline.
+    system : CPVSystem
+    calibration : dict or Series
+        See calibrate_chunked and calibrate_uf.
+    output_file : None or string, default None
+        Archive where the filtered chunks are written with their 
+        'p_mp_model', 'uf' and 'p_mp_uf' columns.
+    output_datestr_file : None or string, default None
+        Dates of the written rows.
+    chunk_rows : int, default 65536
+    store : None or DataStore, default None
+
+    Returns
+    -------
+    summary : OrderedDict
+        'n_rows' predicted, 'rmsd' and 'bias' of 'p_mp_uf' to the measured 
+        power and the 'rejections' of the filter rules.
+    """
+
+    preset = WORKFLOW_PRESETS[source]
+    if 'dc' not in preset:
+        raise ValueError('The workflow preset {!r} has no irradiance columns '
+                         'for the PVsyst model'.format(source))
+
+    def chunks():
+        return iter_complete_measurements(data_file, datestr_file, location,
+                                          source, chunk_rows, system, store)
+
+    rules = resolve_filter_rules(chunks(), preset['filter']['rules'])
+    predictions = iter_power_predictions(
+        iter_filtered_measurements(chunks(), rules), system, 
+        make_uf_evaluator(calibration), **preset['dc'])
+
+    accumulator = RMSDAccumulator()
+    rejections = OrderedDict()
+    mode = 'w'
+    for table, chunk_rejections in predictions:
+        accumulator.update(table['p_mp_uf'], table['p_mp'])
+        for label, count in chunk_rejections.items():
+            rejections[label] = rejections.get(label, 0) + count
+
+        if output_file is not None:
+            cpvdata.write_measurements(table, output_file, 
+                                       output_datestr_file, mode=mode)
+            mode = 'a'
+
+    return OrderedDict([('n_rows', accumulator.count), 
+                        ('rmsd', accumulator.rmsd), 
+                        ('bias', accumulator.bias),
+                        ('rejections', rejections)])
+
+
+def _calc_chunked_means(filtered_chunks, columns):
+    """
+    Means and (min, max) ranges of columns over the filtered chunks.
+    """
+
+    sums = OrderedDict((column, [0, 0.0, np.inf, -np.inf]) 
+                       for column in columns)
+
+    for table, _ in filtered_chunks:
+        for column, stats in sums.items():
+            values = cpvdata.get_column(table, column)
+            values = values[np.isfinite(values)]
+            stats[0] += len(values)
+            stats[1] += values.sum()
+            if len(values):
+                stats[2] = min(stats[2], values.min())
+                stats[3] = max(stats[3], values.max())
+
+    means = {column: stats[1] / stats[0] if stats[0] else np.nan 
+             for column, stats in sums.items()}
+    ranges = {column: (stats[2], stats[3]) for column, stats in sums.items()}
+
+    return means, ranges
+
+
+def _share_table(table):
+    """
+    Copies the values of a table into a shared memory block, Fortran 
+    ordered as in the table.
+    """
+
+    values = table.values
+    block = shared_memory.SharedMemory(create=True, 
+                                       size=max(values.nbytes, 1))
+    shared = np.ndarray(values.shape, dtype=np.float64, buffer=block.buf, 
+                        order='F')
+    shared[...] = values
+    del shared
+
+    return block, {'block': block.name, 'shape': values.shape, 
+                   'names': table.names}
+
+
+def _window_rows(table, start, stop):
+    """
+    Rows of a table with sorted times between start, included, and stop.
+    """
+
+    if start is None and stop is None:
+        return 0, len(table)
+
+    stamps = table.times.asi8
+    if np.any(np.diff(stamps) < 0):
+        raise ValueError('the times of the table are not sorted')
+
+    def position(time, default):
+        if time is None:
+            return default
+        time = pd.Timestamp(time)
+        if time.tzinfo is None and table.times.tz is not None:
+            time = time.tz_localize(table.times.tz)
+        return int(np.searchsorted(stamps, time.value))
+
+    return position(start, 0), position(stop, len(table))
+
+
+def _check_calibration_columns(table, source, system):
+    """
+    Raises a KeyError if the table lacks a column that the preset of source
+    needs, so that a wrong source or schema is not taken for windows that 
+    could not be fitted.
+    """
+
+    preset = WORKFLOW_PRESETS[source]
+
+    columns = []
+    for fit, _, column in _CALIBRATION_FITS:
+        if fit in preset:
+            columns.append(column)
+            columns.extend(name.strip() 
+                           for name in preset[fit]['ratio'].split('/'))
+            columns.extend(preset[fit].get('held', ()))
+
+    if (system is not None and 'dc' in preset and 'uf_airmass' in preset 
+            and 'uf_temp_air' in preset):
+        columns.extend(preset['dc'].values())
+        columns.extend(('temp_air', 'p_mp'))
+
+    missing = [column for column in OrderedDict.fromkeys(columns) 
+               if column not in table.names]
+    if missing:
+        raise KeyError('The {!r} calibration needs the missing columns '
+                       '{}'.format(source, missing))
+
+
+def _calibrate_shared(spec):
+    """
+    Calibrates the window of a table in shared memory.
+    """
+
+    # The workers share the resource tracker of the process that created 
+    # the block, which unlinks it.
+    block = shared_memory.SharedMemory(name=spec['block'])
+    values = None
+    try:
+        values = np.ndarray(spec['shape'], dtype=np.float64, 
+                            buffer=block.buf, order='F')
+        return _calibrate_rows(values, spec['names'], spec['start'], 
+                               spec['stop'], spec['source'], spec['system'])
+    finally:
+        values = None
+        try:
+            block.close()
+        except BufferError:
+            # The traceback of an error still holds views of the block, 
+            # which release it when they are collected.
+            pass
+
+
+def _calibrate_rows(values, names, start, stop, source, system):
+    """
+    Calibrates a window of rows of the values of a table, without copying 
+    them. Windows with too few measurements or singular fits are returned 
+    with their error.
+    """
+
+    table = cpvdata.MeasurementTable(values[start:stop], names=names, 
+                                     copy=False)
+
+    try:
+        return calibrate_table(table, source, system)
+    except (ValueError, np.linalg.LinAlgError) as error:
+        return OrderedDict([('n_rows', len(table)), ('error', str(error))])
+
+
+def _get_ufs(table, uf_airmass, uf_temp_air):
+
+    return [get_simple_util_factor(table['airmass'], **uf_airmass),
+            get_simple_util_factor(table['temp_air'], **uf_temp_air)]
+
+
+def _function_id(func):
+    """
+    Identifies a stage function by its name and code, so that editing it
+    also changes the keys of its stage.
+    """
+
+    code = getattr(func, '__code__', None)
+    return (getattr(func, '__module__', None),
+            getattr(func, '__qualname__', repr(func)),
+            None if code is None else _code_id(code))
+
+
+def _code_id(code):
+
+    return (code.co_code, tuple(_code_id(const) if hasattr(const, 'co_code')
+                                else const for const in code.co_consts))
+
+
+def _fingerprint(value):
+    """
+    Short hash of a value: the contents of arrays and tables, the size and
+    modification time of existing files, and the pickle of anything else.
+    """
+
+    sha1 = hashlib.sha1()
+    _update_fingerprint(sha1, value)
+    return sha1.hexdigest()[:16]
+
+
+def _update_fingerprint(sha1, value):
+
+    if isinstance(value, np.ndarray):
+        sha1.update(repr((value.dtype.str, value.shape)).encode())
+        sha1.update(np.ascontiguousarray(value).view(np.uint8).data)
+    elif isinstance(value, cpvdata.MeasurementTable):
+        sha1.update(repr(value.names).encode())
+        _update_fingerprint(sha1, value.values)
+        if value.times is not None:
+            _update_fingerprint(sha1, value.times.asi8)
+            sha1.update(str(value.times.tz).encode())
+    elif isinstance(value, (pd.Series, pd.DataFrame, pd.Index)):
+        sha1.update(pickle.dumps(value, protocol=4))
+    elif isinstance(value, str) and os.path.isfile(value):
+        stat = os.stat(value)
+        sha1.update(repr(('file', os.path.abspath(value), stat.st_size,
+                          stat.st_mtime_ns)).encode())
+    elif isinstance(value, (list, tuple)):
+        sha1.update(repr((type(value).__name__, len(value))).encode())
+        for item in value:
+            _update_fingerprint(sha1, item)
+    elif isinstance(value, dict):
+        sha1.update(repr(('dict', len(value))).encode())
+        for key in sorted(value, key=repr):
+            _update_fingerprint(sha1, key)
+            _update_fingerprint(sha1, value[key])
+    else:
+        try:
+            sha1.update(pickle.dumps(value, protocol=4))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            sha1.update(repr(value).encode())
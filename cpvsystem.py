@@ -1,19 +1,30 @@
 """
 The ``cpvsystem`` module contains functions for modeling the output and
 performance of CPV modules.
+
+pvlib, pandas and scikit-learn are imported by the functions that use them, 
+so that importing this module only loads numpy. The calls of the functions
+and methods can be recorded with Profiler.
 """
 
 import numpy as np
 from collections import OrderedDict
 
-from pvlib import pvsystem
-from pvlib import atmosphere, irradiance
-from pvlib.tools import _build_kwargs
-from pvlib.location import Location
-
+import functools
 import math
-from sklearn import linear_model
-from sklearn.metrics import mean_squared_error
+import sys
+import time
+import types
+
+
+# Module parameters used by the PVsyst models.
+_CALCPARAMS_PVSYST_KEYS = ['gamma_ref', 'mu_gamma', 'I_L_ref', 'I_o_ref',
+                           'R_sh_ref', 'R_sh_0', 'R_sh_exp',
+                           'R_s', 'alpha_sc', 'EgRef',
+                           'irrad_ref', 'temp_ref',
+                           'cells_in_series']
+
+_PVSYST_CELLTEMP_KEYS = ['eta_m', 'alpha_absorption']
 
 
 class CPVSystem(object):
@@ -146,6 +157,8 @@ class CPVSystem(object):
             Column names are: ``total, beam, sky, ground``.
         """
 
+        from pvlib import atmosphere, irradiance
+
         # not needed for all models, but this is easier
         if dni_extra is None:
             dni_extra = irradiance.get_extra_radiation(solar_zenith.index)
@@ -182,12 +195,10 @@ class CPVSystem(object):
         See pvsystem.calcparams_pvsyst for details
         """
 
-        kwargs = _build_kwargs(['gamma_ref', 'mu_gamma', 'I_L_ref', 'I_o_ref',
-                                'R_sh_ref', 'R_sh_0', 'R_sh_exp',
-                                'R_s', 'alpha_sc', 'EgRef',
-                                'irrad_ref', 'temp_ref',
-                                'cells_in_series'],
-                               self.module_parameters)
+        from pvlib import pvsystem
+        from pvlib.tools import _build_kwargs
+
+        kwargs = _build_kwargs(_CALCPARAMS_PVSYST_KEYS, self.module_parameters)
 
         return pvsystem.calcparams_pvsyst(effective_irradiance, 
                                           temp_cell, **kwargs)
@@ -206,8 +217,10 @@ class CPVSystem(object):
         See pvsystem.pvsyst_celltemp for details
         """
         
-        kwargs = _build_kwargs(['eta_m', 'alpha_absorption'],
-                               self.module_parameters)
+        from pvlib import pvsystem
+        from pvlib.tools import _build_kwargs
+        
+        kwargs = _build_kwargs(_PVSYST_CELLTEMP_KEYS, self.module_parameters)
         
         return pvsystem.pvsyst_celltemp(poa_global, temp_air, wind_speed, 
                                         model_params=self.racking_model, 
@@ -215,23 +228,44 @@ class CPVSystem(object):
  
     def singlediode(self, photocurrent, saturation_current,
                     resistance_series, resistance_shunt, nNsVth,
-                    ivcurve_pnts=None):
+                    ivcurve_pnts=None, method='lambertw', tol=1e-6, 
+                    maxiter=20):
         """Wrapper around the :py:func:`pvsystem.singlediode` function.
 
         Parameters
         ----------
         See pvsystem.singlediode for details
 
+        method : string, default 'lambertw'
+            'lambertw', 'newton' or 'brentq' are passed to 
+            pvsystem.singlediode. 'fast' uses :py:func:`singlediode_fast`, 
+            which does not return the IV curve of ivcurve_pnts.
+
+        tol : numeric, default 1e-6
+            Tolerance in volts of method 'fast'.
+
+        maxiter : int, default 20
+            Maximum Newton iterations of method 'fast'.
+
         Returns
         -------
         See pvsystem.singlediode for details
         """
         
+        if method == 'fast':
+            return singlediode_fast(photocurrent, saturation_current, 
+                                    resistance_series, resistance_shunt, 
+                                    nNsVth, tol=tol, maxiter=maxiter)
+        
+        from pvlib import pvsystem
+        
         return pvsystem.singlediode(photocurrent, saturation_current, 
                                     resistance_series, resistance_shunt, 
-                                    nNsVth, ivcurve_pnts=ivcurve_pnts)
+                                    nNsVth, ivcurve_pnts=ivcurve_pnts,
+                                    method=method)
 
-    def get_am_util_factor(self, airmass, am_thld, am_uf_m_low, am_uf_m_high):
+    def get_am_util_factor(self, airmass, am_thld, am_uf_m_low, am_uf_m_high,
+                           out=None):
         """
         Retrieves the utilization factor for airmass.
         
@@ -251,6 +285,9 @@ class CPVSystem(object):
             inclination of the second regression line of the utilization factor 
             for airmass.
         
+        out : numpy.ndarray, optional
+            buffer with the shape of airmass where the result is stored.
+        
         Returns
         -------
         am_uf : numeric
@@ -259,10 +296,10 @@ class CPVSystem(object):
         
         return get_simple_util_factor(x = airmass, thld = am_thld, 
                                       m_low = am_uf_m_low,
-                                      m_high = am_uf_m_high)
+                                      m_high = am_uf_m_high, out = out)
     
     def get_tempair_util_factor(self, temp_air, ta_thld, ta_uf_m_low, 
-                                ta_uf_m_high):
+                                ta_uf_m_high, out=None):
         """
         Retrieves the utilization factor for ambient temperature. 
         
@@ -282,6 +319,9 @@ class CPVSystem(object):
             inclination of the second regression line of the utilization factor 
             for ambient temperature.
         
+        out : numpy.ndarray, optional
+            buffer with the shape of temp_air where the result is stored.
+        
         Returns
         -------
         ta_uf : numeric
@@ -290,9 +330,10 @@ class CPVSystem(object):
         
         return get_simple_util_factor(x = temp_air, thld = ta_thld, 
                                       m_low = ta_uf_m_low,
-                                      m_high = ta_uf_m_high)
+                                      m_high = ta_uf_m_high, out = out)
     
-    def get_dni_util_factor(self, dni, dni_thld, dni_uf_m_low, dni_uf_m_high):
+    def get_dni_util_factor(self, dni, dni_thld, dni_uf_m_low, dni_uf_m_high,
+                            out=None):
         """
         Retrieves the utilization factor for DNI.
         
@@ -312,6 +353,9 @@ class CPVSystem(object):
             inclination of the second regression line of the utilization factor 
             for DNI.
         
+        out : numpy.ndarray, optional
+            buffer with the shape of dni where the result is stored.
+        
         Returns
         -------
         dni_uf : numeric
@@ -320,13 +364,13 @@ class CPVSystem(object):
                 
         return get_simple_util_factor(x = dni, thld = dni_thld, 
                                       m_low = dni_uf_m_low,
-                                      m_high = dni_uf_m_high)
+                                      m_high = dni_uf_m_high, out = out)
     
     def get_utilization_factor(self, airmass, am_thld, am_uf_m_low, 
                                am_uf_m_high, am_weight, temp_air, ta_thld, 
                                ta_uf_m_low, ta_uf_m_high, ta_weight, dni, 
                                dni_thld, dni_uf_m_low, dni_uf_m_high, 
-                               dni_weight):
+                               dni_weight, out=None):
         """
         Retrieves the unified utilization factor for airmass, ambient 
         temperature and dni.
@@ -384,31 +428,40 @@ class CPVSystem(object):
         dni_weight : numeric
             ponderation for the DNI utilization factor.
         
+        out : numpy.ndarray, optional
+            buffer with the broadcast shape of the inputs where the result is 
+            stored.
+        
         Returns
         -------
         uf : numeric
             global utilization factor.
         """
         
-        am_uf = get_simple_util_factor(x = airmass, thld = am_thld, 
-                                       m_low = am_uf_m_low,
-                                       m_high = am_uf_m_high)
+        values = np.broadcast_arrays(np.asarray(airmass), 
+                                     np.asarray(temp_air), np.asarray(dni))
         
-        ta_uf = get_simple_util_factor(x = temp_air, thld = ta_thld, 
-                                       m_low = ta_uf_m_low,
-                                       m_high = ta_uf_m_high)
+        if out is None:
+            out = np.empty(values[0].shape, dtype=_float_dtype(*values))
         
-        dni_uf = get_simple_util_factor(x = dni, thld = dni_thld, 
-                                        m_low = dni_uf_m_low,
-                                        m_high = dni_uf_m_high)
+        # The weighted utilization factors are accumulated in the output 
+        # buffer, using a single auxiliar buffer for every variable.
+        out[...] = 0
+        simple_uf = np.empty_like(out)
         
-        uf = (np.multiply(am_uf, am_weight) + np.multiply(ta_uf, ta_weight) 
-            + np.multiply(dni_uf, dni_weight))
+        for x, thld, m_low, m_high, weight in (
+                (values[0], am_thld, am_uf_m_low, am_uf_m_high, am_weight),
+                (values[1], ta_thld, ta_uf_m_low, ta_uf_m_high, ta_weight),
+                (values[2], dni_thld, dni_uf_m_low, dni_uf_m_high, 
+                 dni_weight)):
+            get_simple_util_factor(x, thld, m_low, m_high, out=simple_uf)
+            np.multiply(simple_uf, weight, out=simple_uf)
+            np.add(out, simple_uf, out=out)
         
-        return uf
+        return _wrap_like(out, airmass, temp_air, dni)
 
     def localize(self, location=None, latitude=None, longitude=None,
-                 **kwargs):
+                 solar_cache=None, **kwargs):
         """
         Creates a LocalizedCPVSystem object using this object
         and location data. Must supply either location object or
@@ -419,6 +472,9 @@ class CPVSystem(object):
         location : None or Location, default None
         latitude : None or float, default None
         longitude : None or float, default None
+        solar_cache : None or SolarGeometryCache, default None
+            Cache of the solar position and airmass. If None, the cache 
+            shared by all the located systems is used.
         **kwargs : see Location
 
         Returns
@@ -426,50 +482,42 @@ class CPVSystem(object):
         localized_system : LocalizedCPVSystem
         """
 
+        from cpvlocation import Location, LocalizedCPVSystem
+
         if location is None:
             location = Location(latitude, longitude, **kwargs)
 
-        return LocalizedCPVSystem(cpvsystem=self, location=location)
-
+        return LocalizedCPVSystem(cpvsystem=self, location=location,
+                                  solar_cache=solar_cache)
 
-class LocalizedCPVSystem(CPVSystem, Location):
-    """
-    The LocalizedCPVSystem class defines a standard set of installed CPV
-    system attributes and modeling functions. This class combines the
-    attributes and methods of the CPVSystem and Location classes.
-
-    The LocalizedCPVSystem may have bugs due to the difficulty of
-    robustly implementing multiple inheritance. See
-    :py:class:`~pvlib.modelchain.ModelChain` for an alternative paradigm
-    for modeling PV systems at specific locations.
-    """
-    def __init__(self, cpvsystem=None, location=None, **kwargs):
+    def get_streaming_predictor(self, uf_params, columns=None, 
+                                method='fast'):
+        """
+        Creates a StreamingPredictor of this system with resident 
+        utilization factor parameters.
 
-        # get and combine attributes from the cpvsystem and/or location
-        # with the rest of the kwargs
+        Parameters
+        ----------
+        See StreamingPredictor.
 
-        if cpvsystem is not None:
-            cpv_dict = cpvsystem.__dict__
-        else:
-            cpv_dict = {}
+        Returns
+        -------
+        predictor : StreamingPredictor
+        """
 
-        if location is not None:
-            loc_dict = location.__dict__
-        else:
-            loc_dict = {}
+        return StreamingPredictor(self, uf_params, columns=columns, 
+                                  method=method)
 
-        new_kwargs = dict(list(cpv_dict.items()) +
-                          list(loc_dict.items()) +
-                          list(kwargs.items()))
+    def _get_uf_evaluator(self, uf_params):
+        """
+        Compiles {column: (thld, m_low, m_high, weight)} into a UFEvaluator
+        whose weighted utilization factors are added.
+        """
 
-        CPVSystem.__init__(self, **new_kwargs)
-        Location.__init__(self, **new_kwargs)
+        if isinstance(uf_params, UFEvaluator):
+            return uf_params
 
-    def __repr__(self):
-        attrs = ['name', 'latitude', 'longitude', 'altitude', 'tz', 'module', 
-                 'inverter', 'albedo', 'racking_model']
-        return ('LocalizedCPVSystem: \n  ' + '\n  '.join(
-            ('{}: {}'.format(attr, getattr(self, attr)) for attr in attrs)))
+        return UFEvaluator(uf_params)
 
 
 class StaticCPVSystem(CPVSystem):
@@ -577,6 +625,8 @@ class StaticCPVSystem(CPVSystem):
             The angle of incidence
         """
 
+        from pvlib import irradiance
+
         aoi = irradiance.aoi(self.surface_tilt, self.surface_azimuth,
                              solar_zenith, solar_azimuth)
         return aoi
@@ -616,6 +666,8 @@ class StaticCPVSystem(CPVSystem):
             Column names are: ``total, beam, sky, ground``.
         """
 
+        from pvlib import atmosphere, irradiance
+
         # not needed for all models, but this is easier
         if dni_extra is None:
             dni_extra = irradiance.get_extra_radiation(solar_zenith.index)
@@ -633,7 +685,8 @@ class StaticCPVSystem(CPVSystem):
                                                albedo=self.albedo,
                                                **kwargs)
 
-    def get_aoi_util_factor(self, aoi, aoi_thld, aoi_uf_m_low, aoi_uf_m_high):
+    def get_aoi_util_factor(self, aoi, aoi_thld, aoi_uf_m_low, aoi_uf_m_high,
+                            normalize=False, out=None):
         """
         Retrieves the utilization factor for the Angle of Incidence.
         
@@ -653,23 +706,110 @@ class StaticCPVSystem(CPVSystem):
             inclination of the second regression line of the utilization factor 
             for AOI.
         
+        normalize : bool, default False
+            divides the utilization factor by its value at normal incidence,
+            so that it is 1 when AOI is 0.
+        
+        out : numpy.ndarray, optional
+            buffer with the shape of aoi where the result is stored.
+        
         Returns
         -------
         aoi_uf : numeric
-            the utilization factor for AOI.
+            the utilization factor for AOI, not lower than 0.
         """
-                
-        aoi_uf = get_simple_util_factor(x = aoi, thld = aoi_thld, 
-                                        m_low = aoi_uf_m_low,
-                                        m_high = aoi_uf_m_high)
         
-        if aoi_uf < 0:
-            return 0
+        values = np.asarray(aoi)
+        
+        if out is None:
+            out = np.empty(values.shape, dtype=_float_dtype(values))
+        
+        get_simple_util_factor(x = values, thld = aoi_thld, 
+                               m_low = aoi_uf_m_low, m_high = aoi_uf_m_high,
+                               out = out)
+        np.maximum(out, 0, out=out)
+        
+        if normalize:
+            np.divide(out, _get_aoi_uf_ref(aoi_thld, aoi_uf_m_low, 
+                                           aoi_uf_m_high), out=out)
+        
+        return _wrap_like(out, aoi)
+    
+    def get_static_utilization_factor(self, airmass, am_thld, am_uf_m_low, 
+                                      am_uf_m_high, am_weight, temp_air, 
+                                      ta_thld, ta_uf_m_low, ta_uf_m_high, 
+                                      ta_weight, aoi, aoi_thld, aoi_uf_m_low,
+                                      aoi_uf_m_high, normalize_aoi=True, 
+                                      out=None):
+        """
+        Retrieves the global utilization factor of a static system: the 
+        weighted utilization factors for airmass and ambient temperature, 
+        times the one for the Angle of Incidence.
+        
+        The three utilization factors are evaluated together by a 
+        UFEvaluator, in a single pass over the measurements.
+        
+        Parameters
+        ----------
+        airmass, am_thld, am_uf_m_low, am_uf_m_high, am_weight : numeric
+            see get_utilization_factor.
+            
+        temp_air, ta_thld, ta_uf_m_low, ta_uf_m_high, ta_weight : numeric
+            see get_utilization_factor.
+            
+        aoi, aoi_thld, aoi_uf_m_low, aoi_uf_m_high : numeric
+            see get_aoi_util_factor.
+        
+        normalize_aoi : bool, default True
+            divides the utilization factor for AOI by its value at normal 
+            incidence.
+        
+        out : numpy.ndarray, optional
+            buffer with the broadcast shape of the inputs where the result is 
+            stored.
+        
+        Returns
+        -------
+        uf : numeric
+            global utilization factor.
+        """
+        
+        scale = 1.0
+        if normalize_aoi:
+            scale = 1.0 / _get_aoi_uf_ref(aoi_thld, aoi_uf_m_low, 
+                                          aoi_uf_m_high)
+        
+        evaluator = UFEvaluator(
+            OrderedDict([('airmass', (am_thld, am_uf_m_low, am_uf_m_high, 
+                                      am_weight)),
+                         ('temp_air', (ta_thld, ta_uf_m_low, ta_uf_m_high, 
+                                       ta_weight))]),
+            factors={'aoi': (aoi_thld, aoi_uf_m_low, aoi_uf_m_high, scale)},
+            clip=('aoi',))
+        
+        return evaluator({'airmass': airmass, 'temp_air': temp_air, 
+                          'aoi': aoi}, out=out)
+    
+    def _get_uf_evaluator(self, uf_params):
+        """
+        Compiles {column: (thld, m_low, m_high, weight)} into a UFEvaluator.
+        As in get_static_utilization_factor, the utilization factor for AOI 
+        is not normalized nor weighted, but multiplies the sum of the others,
+        and is not lower than 0.
+        """
+        
+        if isinstance(uf_params, UFEvaluator):
+            return uf_params
+        
+        uf_params = OrderedDict(uf_params)
+        factors = {}
+        if 'aoi' in uf_params:
+            factors['aoi'] = tuple(uf_params.pop('aoi'))[:3]
         
-        return aoi_uf
+        return UFEvaluator(uf_params, factors, clip=('aoi',))
     
     def localize(self, location=None, latitude=None, longitude=None,
-                 **kwargs):
+                 solar_cache=None, **kwargs):
         """
         Creates a LocalizedStaticCPVSystem object using this object
         and location data. Must supply either location object or
@@ -680,6 +820,9 @@ class StaticCPVSystem(CPVSystem):
         location : None or Location, default None
         latitude : None or float, default None
         longitude : None or float, default None
+        solar_cache : None or SolarGeometryCache, default None
+            Cache of the solar position and airmass. If None, the cache 
+            shared by all the located systems is used.
         **kwargs : see Location
 
         Returns
@@ -687,156 +830,1850 @@ class StaticCPVSystem(CPVSystem):
         localized_system : LocalizedStaticCPVSystem
         """
 
+        from cpvlocation import Location, LocalizedStaticCPVSystem
+
         if location is None:
             location = Location(latitude, longitude, **kwargs)
 
         return LocalizedStaticCPVSystem(staticcpvsystem=self, 
-                                        location=location)
+                                        location=location,
+                                        solar_cache=solar_cache)
 
 
-class LocalizedStaticCPVSystem(CPVSystem, Location):
+class StreamingPredictor(object):
     """
-    The LocalizedStaticCPVSystem class defines a standard set of installed 
-    Static CPV system attributes and modeling functions. This class combines 
-    the attributes and methods of the StaticCPVSystem and Location classes.
+    The StreamingPredictor class predicts the power of a CPV system for 
+    measurements that arrive over time, such as the 1-minute telemetry of a
+    tracker, keeping the fitted utilization factors resident.
+
+    Every micro-batch goes through the PVsyst model of the system (cell 
+    temperature, diode parameters and single diode solution) and is 
+    corrected by the weighted utilization factors. Only one micro-batch is 
+    held at a time, so memory does not grow with the length of the stream.
 
-    The LocalizedStaticCPVSystem may have bugs due to the difficulty of
-    robustly implementing multiple inheritance. See
-    :py:class:`~pvlib.modelchain.ModelChain` for an alternative paradigm
-    for modeling PV systems at specific locations.
+    Parameters
+    ----------
+    system : CPVSystem or StaticCPVSystem
+
+    uf_params : dict or UFEvaluator
+        {column: (thld, m_low, m_high, weight)} of every utilization factor,
+        e.g. {'airmass': (am_thld, am_m_low, am_m_high, am_weight), 
+        'temp_air': (...)}, or the factors compiled by 
+        cpvpipeline.make_uf_evaluator. For a StaticCPVSystem, the 'aoi' one 
+        multiplies the weighted sum of the others, as in 
+        get_static_utilization_factor with normalize_aoi=False, and its 
+        weight is ignored. 'aoi' is calculated from 'zenith' and 'azimuth' 
+        when the measurements do not have it.
+
+    columns : None or dict, default None
+        Names of the 'poa_global', 'effective_irradiance', 'temp_air', 
+        'wind_speed' and measured 'p_mp' columns of the measurements, if 
+        they differ from the defaults 'gni', 'dni', 'temp_air', 
+        'wind_speed' and 'p_mp'.
+
+    method : string, default 'fast'
+        Single diode method, see CPVSystem.singlediode.
     """
-    def __init__(self, staticcpvsystem=None, location=None, **kwargs):
 
-        # get and combine attributes from the staticcpvsystem and/or location
-        # with the rest of the kwargs
+    _DEFAULT_COLUMNS = {'poa_global': 'gni', 'effective_irradiance': 'dni',
+                        'temp_air': 'temp_air', 'wind_speed': 'wind_speed',
+                        'p_mp': 'p_mp'}
 
-        if staticcpvsystem is not None:
-            staticcpv_dict = staticcpvsystem.__dict__
+    def __init__(self, system, uf_params, columns=None, method='fast'):
+
+        self.system = system
+        self.method = method
+        self.columns = dict(self._DEFAULT_COLUMNS, **(columns or {}))
+
+        if isinstance(uf_params, UFEvaluator):
+            self.uf_params = None
         else:
-            staticcpv_dict = {}
+            # The parameters are kept as floats, ready to broadcast.
+            self.uf_params = OrderedDict(
+                (column, tuple(np.float64(value) for value in params))
+                for column, params in uf_params.items())
+        self._uf = system._get_uf_evaluator(
+            uf_params if self.uf_params is None else self.uf_params)
+
+    def __repr__(self):
+        return 'StreamingPredictor: \n  system: {}\n  ufs: {}'.format(
+            self.system.name, ', '.join(self._uf.columns))
+
+    def predict(self, batch):
+        """
+        Predicts the power of a micro-batch of measurements.
+
+        Parameters
+        ----------
+        batch : dict, DataFrame or MeasurementTable
+            Columns of the measurements by name.
+
+        Returns
+        -------
+        prediction : OrderedDict
+            Arrays 'p_mp' of the PVsyst model, global utilization factor 
+            'uf', corrected 'p_mp_uf' and 'residuals' to the measured power,
+            NaN if it is not measured.
+        """
 
-        if location is not None:
-            loc_dict = location.__dict__
+        columns = self.columns
+        values = {name: np.asarray(batch[columns[name]], dtype=np.float64)
+                  for name in ('poa_global', 'effective_irradiance', 
+                               'temp_air', 'wind_speed')}
+
+        temp_cell = self.system.pvsyst_celltemp(values['poa_global'], 
+                                                values['temp_air'],
+                                                values['wind_speed'])
+        diode_params = self.system.calcparams_pvsyst(
+            values['effective_irradiance'], temp_cell)
+        p_mp = np.asarray(self.system.singlediode(*diode_params, 
+                                                  method=self.method)['p_mp'],
+                          dtype=np.float64)
+
+        uf = self._uf({column: self._get_uf_input(batch, column)
+                       for column in self._uf.columns}, 
+                      out=np.empty(p_mp.shape))
+
+        p_mp_uf = p_mp * uf
+
+        if columns['p_mp'] in batch:
+            residuals = p_mp_uf - np.asarray(batch[columns['p_mp']], 
+                                             dtype=np.float64)
         else:
-            loc_dict = {}
+            residuals = np.full(p_mp.shape, np.nan)
 
-        new_kwargs = dict(list(staticcpv_dict.items()) +
-                          list(loc_dict.items()) +
-                          list(kwargs.items()))
+        return OrderedDict([('p_mp', p_mp), ('uf', uf), ('p_mp_uf', p_mp_uf),
+                            ('residuals', residuals)])
 
-        StaticCPVSystem.__init__(self, **new_kwargs)
-        Location.__init__(self, **new_kwargs)
+    def stream(self, records, batch_size=1):
+        """
+        Predicts the power of a stream of measurement records, as they 
+        arrive.
 
-    def __repr__(self):
-        attrs = ['name', 'latitude', 'longitude', 'altitude', 'tz',
-                 'surface_tilt', 'surface_azimuth', 'module', 'inverter',
-                 'albedo', 'racking_model']
-        return ('LocalizedStaticCPVSystem: \n  ' + '\n  '.join(
-            ('{}: {}'.format(attr, getattr(self, attr)) for attr in attrs)))
+        Parameters
+        ----------
+        records : iterable of dict
+            Measurements of every sample, by column.
+        batch_size : int, default 1
+            Number of records predicted together. Larger micro-batches are 
+            cheaper per sample, but every record waits for its batch to be 
+            complete.
+
+        Yields
+        ------
+        sample : OrderedDict
+            The record with the 'p_mp', 'uf', 'p_mp_uf' and 'residuals' of 
+            its prediction.
+        """
+
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == batch_size:
+                for sample in self._predict_records(batch):
+                    yield sample
+                batch = []
+
+        if batch:
+            for sample in self._predict_records(batch):
+                yield sample
+
+    def _predict_records(self, records):
+
+        names = set().union(*records)
+        batch = {name: np.array([record.get(name, np.nan) 
+                                 for record in records], dtype=np.float64)
+                 for name in names}
+        prediction = self.predict(batch)
+
+        for i, record in enumerate(records):
+            sample = OrderedDict(record)
+            for name, values in prediction.items():
+                sample[name] = values[i]
+            yield sample
 
+    def _get_uf_input(self, batch, column):
 
+        if column == 'aoi' and column not in batch and hasattr(self.system, 
+                                                               'get_aoi'):
+            return np.asarray(self.system.get_aoi(
+                np.asarray(batch['zenith'], dtype=np.float64),
+                np.asarray(batch['azimuth'], dtype=np.float64)))
 
-def get_simple_util_factor(x, thld, m_low, m_high):
+        return np.asarray(batch[column], dtype=np.float64)
+
+
+class OnlineUFFitter(object):
     """
-    Retrieves the utilization factor for a variable.
-    
+    The OnlineUFFitter class fits the two regression lines of a utilization 
+    factor incrementally, as new measurements arrive, without revisiting 
+    the previous ones.
+
+    The sums of x, y, x^2, xy and y^2 are kept for the measurements between 
+    every pair of consecutive candidate thresholds. Every update adds the new
+    measurements to these sums and evaluates all the candidate splits from 
+    their cumulative sums, as calc_two_regression_lines does, so absorbing 
+    new measurements costs O(candidates) besides reading them, and the 
+    current lines are available at any time.
+
     Parameters
     ----------
-    x : numeric / array-like
-        variable value(s) for the utilization factor calc.
-    
-    thld : numeric
-        limit between the two regression lines of the utilization factor.
-    
-    m_low : numeric
-        inclination of the first regression line of the utilization factor.
-    
-    m_high : numeric
-        inclination of the second regression line of the utilization factor.
-    
-    Returns
-    -------
-    single_uf : numeric
-        utilization factor for the x variable.
+    candidates : array of numbers
+        Candidate thresholds between the regression lines. Measurements with
+        x lower or equal than a candidate belong to its lower line, as with 
+        the limit of calc_two_regression_lines. A single candidate forces the
+        limit.
+
+    forgetting : numeric, default 1
+        Factor applied to the previous sums before every update. Values 
+        lower than 1 forget old measurements exponentially, e.g. 0.97 with 
+        daily updates halves the weight of the measurements after 23 days.
+
+    min_samples : int, default 2
+        Minimum number of measurements at each side of a candidate threshold
+        for it to be evaluated, at least 2.
     """
-    if not isinstance(x, np.ndarray):
-        x = np.array(x, ndmin=1)
-    
-    suf = []
-    
-    for i in range(len(x)):
-        if x[i] <= thld:
-            simple_uf = 1 + (x[i] - thld) * m_low
+
+    def __init__(self, candidates, forgetting=1.0, min_samples=2):
+
+        self.candidates = np.unique(np.asarray(candidates, dtype=np.float64))
+        self.forgetting = forgetting
+        self.min_samples = min_samples
+
+        if len(self.candidates) == 0:
+            raise ValueError('No candidate thresholds for the regression '
+                             'lines')
+        if min_samples < 2:
+            raise ValueError('Two regression lines need min_samples >= 2, '
+                             'got {}'.format(min_samples))
+
+        # Sums of every interval between candidates, the last one being 
+        # above all of them. The count of measurements is not forgotten, it 
+        # only validates the candidates.
+        self._sums = np.zeros((6, len(self.candidates) + 1))
+        self._counts = np.zeros(len(self.candidates) + 1, dtype=np.int64)
+        self._center = None
+        self._params = None
+        self._rmsd = np.nan
+        self._thld_index = None
+
+    def __repr__(self):
+        return ('OnlineUFFitter: \n  candidates: {}\n  count: {}\n  '
+                'params: {}'.format(len(self.candidates), self.count,
+                                    self._params))
+
+    @property
+    def count(self):
+        """Number of measurements absorbed."""
+        return int(self._counts.sum())
+
+    @property
+    def params(self):
+        """
+        Current (m_low, n_low, m_high, n_high, thld) of the utilization 
+        factor.
+        """
+
+        if self._params is None:
+            raise ValueError('Not enough measurements to fit two regression '
+                             'lines')
+        return self._params
+
+    @property
+    def rmsd(self):
+        """
+        Sum of the root-mean-square deviations of both current lines.
+        """
+        return self._rmsd
+
+    @property
+    def candidate(self):
+        """Candidate threshold of the current split, None if not fitted."""
+
+        if self._thld_index is None:
+            return None
+        return self.candidates[self._thld_index]
+
+    def update(self, x, y):
+        """
+        Absorbs new measurements and refits the regression lines.
+
+        Parameters
+        ----------
+        x : array of numbers
+
+        y : array of numbers
+
+        Returns
+        -------
+        params : tuple or None
+            (m_low, n_low, m_high, n_high, thld) after the update, None while
+            there are not enough measurements.
+        """
+
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+
+        is_valid = np.isfinite(x) & np.isfinite(y)
+        if not is_valid.all():
+            x = x[is_valid]
+            y = y[is_valid]
+
+        if self.forgetting != 1:
+            self._sums *= self.forgetting
+
+        if len(x):
+            # The sums are centered on the first measurements so that they 
+            # do not lose precision.
+            if self._center is None:
+                self._center = (x.mean(), y.mean())
+
+            xc = x - self._center[0]
+            yc = y - self._center[1]
+
+            n_bins = len(self._counts)
+            bins = np.searchsorted(self.candidates, x, side='left')
+            self._counts += np.bincount(bins, minlength=n_bins)
+            self._sums[0] += np.bincount(bins, minlength=n_bins)
+            for row, values in enumerate((xc, yc, xc * xc, xc * yc, yc * yc), 
+                                         1):
+                self._sums[row] += np.bincount(bins, values, n_bins)
+
+            self._fit()
+
+        return self._params
+
+    def merge(self, other):
+        """
+        Adds the measurements absorbed by another fitter with the same 
+        candidates, e.g. of another chunk, and refits the regression lines.
+
+        Returns
+        -------
+        params : tuple or None
+            See update.
+        """
+
+        if not np.array_equal(self.candidates, other.candidates):
+            raise ValueError('Only fitters with the same candidates can be '
+                             'merged')
+        if other._center is None:
+            return self._params
+        if self._center is None:
+            self._center = other._center
+
+        self._sums += _recenter_sums(other._sums, other._center, 
+                                     self._center)
+        self._counts += other._counts
+        self._fit()
+
+        return self._params
+
+    def reset(self):
+        """
+        Forgets all the measurements absorbed.
+        """
+
+        self._sums[:] = 0
+        self._counts[:] = 0
+        self._center = None
+        self._params = None
+        self._rmsd = np.nan
+        self._thld_index = None
+
+    def _fit(self):
+
+        low_sums = np.cumsum(self._sums[:, :-1], axis=1)
+        high_sums = self._sums.sum(axis=1, keepdims=True) - low_sums
+
+        low_counts = np.cumsum(self._counts[:-1])
+        high_counts = self._counts.sum() - low_counts
+        is_valid = ((low_counts >= self.min_samples) 
+                    & (high_counts >= self.min_samples))
+
+        if not is_valid.any():
+            self._params = None
+            self._rmsd = np.nan
+            self._thld_index = None
+            return
+
+        m_low, n_low, rmsd_low = _calc_lines_from_sums(*low_sums)
+        m_high, n_high, rmsd_high = _calc_lines_from_sums(*high_sums)
+
+        # Less suitable regression lines are rejected.
+        rmsd = np.where(is_valid, rmsd_low + rmsd_high, np.inf)
+        best = int(np.argmin(rmsd))
+
+        # The lines are moved back from the centered coordinates.
+        x_mean, y_mean = self._center
+        m_low = float(m_low[best])
+        n_low = float(n_low[best]) + y_mean - m_low * x_mean
+        m_high = float(m_high[best])
+        n_high = float(n_high[best]) + y_mean - m_high * x_mean
+
+        # Parallel lines do not cross, the split is used instead.
+        if np.isclose(m_low, m_high, rtol=1e-9, atol=0):
+            thld = self.candidates[best]
         else:
-            simple_uf = 1 + (x[i] - thld) * m_high
-        
-        suf.append(simple_uf)
-    
-    return suf
+            thld = (n_high - n_low) / (m_low - m_high)
 
+        self._params = (m_low, n_low, m_high, n_high, float(thld))
+        self._rmsd = float(rmsd[best])
+        self._thld_index = best
 
-def calc_uf_lines(x, y, datatype = 'airmass', limit = None):
+
+class UFEvaluator(object):
     """
-    Calculates the parameters of two regression lines for a utilization factor
-    specified by datatype.
-    
+    The UFEvaluator class evaluates a calibrated global utilization factor
+    from precomputed coefficients, for large simulations.
+
+    Every utilization factor is a continuous piecewise linear function of 
+    one variable, so it is compiled once into a constant, a slope and the 
+    breakpoints where the slope changes:
+    ``f(x) = n + m * x + sum(c_j * max(x - t_j, 0))``, with the weight 
+    already applied. The constants of all the weighted terms are added in 
+    advance, and the samples are evaluated in blocks that fit in the cache, 
+    with no temporary arrays. The global utilization factor is the sum of 
+    the weighted terms times the product of the factors, as 
+    ``(am_weight * uf_am + ta_weight * uf_ta) * uf_aoi`` in the static 
+    systems.
+
     Parameters
     ----------
-    x : list or numpy.array of float
-    
-    y : list or numpy.array of float
-    
-    datatype : string
-        indicates the type of parameter contained in x.
-    
-    limit : numeric, optional
-        forces the limit between the regression lines.
-    
-    Returns
-    -------
-    m_low : numeric
-        inclination of the first regression line of the utilization factor.
-    
-    n_low : numeric
-        ordinate at the origin of the first regression line.
-    
-    m_high : numeric
-        inclination of the second regression line of the utilization factor.
-    
-    n_high : numeric
-        ordinate at the origin of the second regression line.
-    
-    thld : numeric
-        limit between the two regression lines of the utilization factor.
+    uf_params : None or dict, default None
+        {column: (thld, m_low, m_high, weight)} of the weighted utilization 
+        factors that are added, as in get_utilization_factor. Terms with 
+        zero weight are not evaluated.
+
+    factors : None or dict, default None
+        {column: (thld, m_low, m_high)} of the utilization factors that 
+        multiply the weighted sum, such as the AOI one. An optional fourth 
+        value scales the factor, e.g. to normalize it.
+
+    clip : tuple of str, default ('aoi',)
+        Columns whose utilization factors are not allowed to be negative, 
+        as StaticCPVSystem.get_aoi_util_factor.
     """
-    
-    if datatype == 'airmass' or datatype == 'aoi':
-        return calc_two_regression_lines(x, y, limit)
-    
-    elif datatype == 'temp_air':
-        m_low, n_low, rmsd_low = calc_regression_line(x, y)
-        
-        if limit is None:
-            limit = 50
+
+    # Samples evaluated at once, so that the buffers stay in the cache.
+    block_size = 2 ** 15
+
+    def __init__(self, uf_params=None, factors=None, clip=('aoi',)):
+
+        self.clip = tuple(clip)
+        self._terms = []
+        self._factors = []
+
+        for column, (thld, m_low, m_high, weight) in (uf_params or {}).items():
+            self._add(column, *self._get_segments(column, thld, m_low, 
+                                                  m_high), weight=weight)
+
+        for column, params in (factors or {}).items():
+            scale = params[3] if len(params) > 3 else 1.0
+            self._add(column, *self._get_segments(column, *params[:3]), 
+                      weight=scale, factor=True)
+
+    def __repr__(self):
+        return 'UFEvaluator: \n  terms: {}\n  factors: {}'.format(
+            ', '.join(term[0] for term in self._terms),
+            ', '.join(factor[0] for factor in self._factors))
+
+    @property
+    def columns(self):
+        """Columns needed by the evaluation, in order."""
+
+        columns = []
+        for term in self._terms + self._factors:
+            if term[0] not in columns:
+                columns.append(term[0])
+        return columns
+
+    def add_function(self, column, func, grid, weight=None):
+        """
+        Adds a utilization factor given by a function, tabulated on a grid 
+        and linearly interpolated between its points.
+
+        Parameters
+        ----------
+        column : string
+
+        func : callable
+            Vectorized utilization factor of the column, e.g. a fitted 
+            polynomial.
+
+        grid : array of numbers
+            Points where func is tabulated. Outside the grid, the values at 
+            its ends are kept, as numpy.interp does.
+
+        weight : None or numeric, default None
+            Weight of the utilization factor in the sum. If None, it 
+            multiplies the weighted sum as a factor.
+        """
+
+        grid = np.unique(np.asarray(grid, dtype=np.float64))
+        if len(grid) < 2:
+            raise ValueError('The grid needs at least two points')
+
+        values = np.asarray(func(grid), dtype=np.float64) * np.ones_like(grid)
+
+        slopes = np.diff(values) / np.diff(grid)
+        slopes = np.concatenate(([0.0], slopes, [0.0]))
+        intercepts = np.concatenate(([values[0]], 
+                                     values[:-1] - slopes[1:-1] * grid[:-1], 
+                                     [values[-1]]))
+
+        if weight is None:
+            self._add(column, grid, slopes, intercepts, factor=True)
+        else:
+            self._add(column, grid, slopes, intercepts, weight=weight)
+
+    def __call__(self, data, out=None):
+        """
+        Evaluates the global utilization factor.
+
+        Parameters
+        ----------
+        data : dict, DataFrame or MeasurementTable
+            Columns of the measurements by name.
+
+        out : numpy.ndarray, optional
+            contiguous buffer with the shape of the columns where the result
+            is stored.
+
+        Returns
+        -------
+        uf : numeric
+            global utilization factor.
+        """
+
+        columns = self.columns
+        if not columns:
+            raise ValueError('No utilization factors to evaluate')
+
+        arrays = np.broadcast_arrays(*(np.asarray(data[column], 
+                                                  dtype=np.float64)
+                                       for column in columns))
+        if out is None:
+            out = np.empty(arrays[0].shape)
+        elif out.shape != arrays[0].shape:
+            raise ValueError('out has shape {}, but the columns have shape '
+                             '{}'.format(out.shape, arrays[0].shape))
+        elif not out.flags.c_contiguous:
+            # Reshaping a copy of the buffer would lose the results.
+            raise ValueError('out must be a C-contiguous array')
+
+        values = dict(zip(columns, (array.reshape(-1) for array in arrays)))
+        result = out.reshape(-1)
+        size = len(result)
         
-        n_high = m_low * limit + n_low
-        return m_low, n_low, 0, n_high, limit
-    
-    else:
-        return 0, 0, 0, 0, 0
+        constant = sum(term[1] for term in self._terms) if self._terms else 1
+        buffer = np.empty(min(self.block_size, size))
+        factor = np.empty_like(buffer) if self._factors else None
+
+        for start in range(0, size, self.block_size):
+            stop = min(start + self.block_size, size)
+            block = result[start:stop]
+            aux = buffer[:stop - start]
+
+            block[...] = constant
+            for column, _, slope, breaks, changes in self._terms:
+                self._accumulate(values[column][start:stop], slope, breaks,
+                                 changes, block, aux)
+
+            for column, n, slope, breaks, changes in self._factors:
+                block_factor = factor[:stop - start]
+                block_factor[...] = n
+                self._accumulate(values[column][start:stop], slope, breaks,
+                                 changes, block_factor, aux)
+                np.multiply(block, block_factor, out=block)
+
+        return _wrap_like(out, *(data[column] for column in columns))
+
+    def _get_segments(self, column, thld, m_low, m_high):
+        """
+        Breakpoints and segment coefficients of a utilization factor.
+        """
 
+        breaks = np.array([thld], dtype=np.float64)
+        slopes = np.array([m_low, m_high], dtype=np.float64)
+        intercepts = 1 - slopes * thld
 
-def calc_two_regression_lines(x, y, limit):
-    """
-    Calculates the parameters of two regression lines for the composed 
-    utilization factors.
-    
-    Parameters
-    ----------
-    x : list or numpy.array of float
+        if column in self.clip:
+            return _clip_segments(breaks, slopes, intercepts)
+
+        return breaks, slopes, intercepts
+
+    def _add(self, column, breaks, slopes, intercepts, weight=1.0, 
+             factor=False):
+        """
+        Compiles the segments of a continuous piecewise linear function into
+        a constant, the slope of the first segment and the changes of slope.
+        """
+
+        scale = float(weight)
+        if scale == 0 and not factor:
+            return
+
+        changes = np.diff(slopes) * scale
+        is_change = changes != 0
+
+        term = (column, float(intercepts[0] * scale), 
+                float(slopes[0] * scale), breaks[is_change], 
+                changes[is_change])
+
+        if factor:
+            self._factors.append(term)
+        else:
+            self._terms.append(term)
+
+    @staticmethod
+    def _accumulate(x, slope, breaks, changes, out, aux):
+
+        if slope != 0:
+            np.multiply(x, slope, out=aux)
+            np.add(out, aux, out=out)
+
+        for brk, change in zip(breaks, changes):
+            np.subtract(x, brk, out=aux)
+            np.maximum(aux, 0, out=aux)
+            np.multiply(aux, change, out=aux)
+            np.add(out, aux, out=out)
+
+
+class BinnedStatAccumulator(object):
+    """
+    The BinnedStatAccumulator class aggregates the y measurements in bins of
+    x, as calc_binned_stat, over chunks of measurements that are never held 
+    together in memory.
+
+    Every bin of x keeps the count and sum of its y values and a histogram 
+    of them on fixed y edges, so chunks, or accumulators of other chunks, 
+    are merged by adding them. Means are exact; medians and percentiles are
+    interpolated inside the histogram bin of their rank, so their error is 
+    bounded by the width of the y bins.
+
+    Parameters
+    ----------
+    bin_width : numeric, default 0.1
+        width of the bins of x.
+
+    start : numeric
+        center of the first bin.
+
+    stop : numeric
+        end of the bin centers, not included.
+
+    y_edges : array of numbers
+        edges of the histogram of y in every bin. Values outside them are 
+        counted in the first or last histogram bin.
+    """
+
+    def __init__(self, bin_width=0.1, start=None, stop=None, y_edges=None):
+
+        if start is None or stop is None or y_edges is None:
+            raise ValueError('start, stop and y_edges are needed to bound the'
+                             ' accumulated bins')
+
+        self.bin_width = bin_width
+        self.start = start
+        self.stop = stop
+        self.y_edges = np.asarray(y_edges, dtype=np.float64)
+
+        n_bins = len(np.arange(start, stop, bin_width))
+        self._hist = np.zeros((n_bins, len(self.y_edges) - 1), 
+                              dtype=np.int64)
+        self._sums = np.zeros(n_bins)
+
+    def __repr__(self):
+        return 'BinnedStatAccumulator: \n  bins: {}\n  count: {}'.format(
+            len(self._sums), self.count)
+
+    @property
+    def count(self):
+        """Number of measurements accumulated."""
+        return int(self._hist.sum())
+
+    def update(self, x, y):
+        """
+        Accumulates a chunk of measurements.
+        """
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        n_bins, n_y = self._hist.shape
+
+        # Every measurement is assigned the index of its nearest bin center, 
+        # as in calc_binned_stat.
+        valid = np.isfinite(x) & np.isfinite(y)
+        bins = np.floor((x[valid] - self.start) / self.bin_width 
+                        + 0.5).astype(np.int64)
+        y = y[valid]
+        keep = (bins >= 0) & (bins < n_bins)
+        bins = bins[keep]
+        y = y[keep]
+
+        y_bins = np.clip(np.searchsorted(self.y_edges, y, side='right') - 1,
+                         0, n_y - 1)
+
+        self._hist += np.bincount(bins * n_y + y_bins, 
+                                  minlength=n_bins * n_y).reshape(n_bins, n_y)
+        self._sums += np.bincount(bins, y, minlength=n_bins)
+
+    def merge(self, other):
+        """
+        Adds the measurements of another accumulator with the same bins.
+        """
+
+        if (self._hist.shape != other._hist.shape 
+                or not np.array_equal(self.y_edges, other.y_edges)
+                or (self.start, self.bin_width) != (other.start, 
+                                                    other.bin_width)):
+            raise ValueError('Only accumulators with the same bins can be '
+                             'merged')
+
+        self._hist += other._hist
+        self._sums += other._sums
+
+    def result(self, statistic='median', q=None, min_samples=1):
+        """
+        Statistic of the y measurements of every bin.
+
+        Parameters
+        ----------
+        statistic : string, default 'median'
+            'median', 'mean', 'percentile' or 'count'.
+
+        q : numeric, optional
+            percentile between 0 and 100 for statistic 'percentile'.
+
+        min_samples : int, default 1
+            minimum number of measurements of the bins returned.
+
+        Returns
+        -------
+        bin_centers : numpy.array
+            centers of the bins with at least min_samples measurements.
+
+        values : numpy.array
+            statistic of the y measurements of every bin.
+        """
+
+        if statistic == 'median':
+            q = 50
+        elif statistic == 'percentile' and q is None:
+            raise ValueError("q is required for statistic 'percentile'")
+        elif statistic not in ('mean', 'count', 'percentile'):
+            raise ValueError('Unknown statistic: {}'.format(statistic))
+
+        counts = self._hist.sum(axis=1)
+        enough = (counts >= min_samples) & (counts > 0)
+        # Centers of numpy.arange, as calc_binned_stat.
+        bin_centers = self.start + np.flatnonzero(enough) * (
+            (self.start + self.bin_width) - self.start)
+
+        if statistic == 'count':
+            return bin_centers, counts[enough]
+        if statistic == 'mean':
+            return bin_centers, self._sums[enough] / counts[enough]
+
+        # Linear interpolation between the closest ranks, as numpy.percentile,
+        # with the values of every histogram bin spread evenly over it.
+        hist = self._hist[enough]
+        cumulative = np.cumsum(hist, axis=1)
+        position = q / 100. * (counts[enough] - 1)
+        lower = np.floor(position)
+
+        def value(rank):
+            y_bin = np.argmax(cumulative > rank[:, np.newaxis], axis=1)
+            rows = np.arange(len(rank))
+            in_bin = hist[rows, y_bin]
+            before = cumulative[rows, y_bin] - in_bin
+            low = self.y_edges[y_bin]
+            width = self.y_edges[y_bin + 1] - low
+            return low + width * (rank - before + 0.5) / in_bin
+
+        upper = np.minimum(lower + 1, counts[enough] - 1)
+        values = value(lower) + (value(upper) - value(lower)) * (position 
+                                                                 - lower)
+
+        return bin_centers, values
+
+
+class RegressionAccumulator(object):
+    """
+    The RegressionAccumulator class keeps the sufficient statistics of a 
+    regression line, the count and the sums of x, y, x^2, xy and y^2, over
+    chunks of measurements.
+
+    The sums are centered on the means of the first chunk so that they do 
+    not lose precision, and accumulators are merged by moving their sums to
+    the same center.
+    """
+
+    def __init__(self):
+
+        self._sums = np.zeros(6)
+        self._center = None
+
+    def __repr__(self):
+        return 'RegressionAccumulator: \n  count: {}'.format(self.count)
+
+    @property
+    def count(self):
+        """Number of measurements accumulated."""
+        return int(self._sums[0])
+
+    def update(self, x, y):
+        """
+        Accumulates a chunk of measurements.
+        """
+
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        valid = np.isfinite(x) & np.isfinite(y)
+        x = x[valid]
+        y = y[valid]
+
+        if len(x) == 0:
+            return
+        if self._center is None:
+            self._center = (x.mean(), y.mean())
+
+        xc = x - self._center[0]
+        yc = y - self._center[1]
+        self._sums += (len(x), xc.sum(), yc.sum(), np.dot(xc, xc), 
+                       np.dot(xc, yc), np.dot(yc, yc))
+
+    def merge(self, other):
+        """
+        Adds the measurements of another accumulator.
+        """
+
+        if other._center is None:
+            return
+        if self._center is None:
+            self._center = other._center
+
+        self._sums += _recenter_sums(other._sums, other._center, 
+                                     self._center)
+
+    @property
+    def line(self):
+        """
+        (m, n, rmsd) of the regression line, as calc_regression_line.
+        """
+
+        if self._center is None:
+            raise ValueError('No measurements to fit the regression line')
+
+        m, n, rmsd = _calc_lines_from_sums(*self._sums)
+        m = float(m)
+        n = float(n) + self._center[1] - m * self._center[0]
+
+        return m, n, float(rmsd)
+
+
+class UFWeightsAccumulator(object):
+    """
+    The UFWeightsAccumulator class keeps the normal equations of 
+    calc_uf_weights over chunks of measurements, so the weights of the 
+    utilization factors are fitted without holding all of them.
+
+    Parameters
+    ----------
+    n_ufs : int
+        Number of utilization factors.
+    """
+
+    def __init__(self, n_ufs):
+
+        self._gram = np.zeros((n_ufs, n_ufs))
+        self._proj = np.zeros(n_ufs)
+        self._pp = 0.0
+        self._count = 0
+
+    def __repr__(self):
+        return 'UFWeightsAccumulator: \n  ufs: {}\n  count: {}'.format(
+            len(self._proj), self._count)
+
+    @property
+    def count(self):
+        """Number of measurements accumulated."""
+        return self._count
+
+    def update(self, real_power, estimation, ufs):
+        """
+        Accumulates a chunk of measurements, see calc_uf_weights.
+        """
+
+        gram, proj, pp, count = _get_uf_normal_equations(real_power, 
+                                                         estimation, ufs)
+        self._gram += gram
+        self._proj += proj
+        self._pp += pp
+        self._count += count
+
+    def merge(self, other):
+        """
+        Adds the measurements of another accumulator.
+        """
+
+        self._gram += other._gram
+        self._proj += other._proj
+        self._pp += other._pp
+        self._count += other._count
+
+    def result(self):
+        """
+        weights and rmsd of the utilization factors, see calc_uf_weights.
+        """
+
+        return _solve_uf_weights(self._gram, self._proj, self._pp, 
+                                 self._count)
+
+
+class RMSDAccumulator(object):
+    """
+    The RMSDAccumulator class keeps the root-mean-square deviation and the 
+    mean bias between estimations and measurements over chunks.
+    """
+
+    def __init__(self):
+
+        self.count = 0
+        self._sum = 0.0
+        self._sum_squares = 0.0
+
+    def __repr__(self):
+        return 'RMSDAccumulator: \n  count: {}\n  rmsd: {}'.format(
+            self.count, self.rmsd)
+
+    def update(self, estimation, measured):
+        """
+        Accumulates the residuals of a chunk, ignoring NaN values.
+        """
+
+        residuals = (np.asarray(estimation, dtype=np.float64) 
+                     - np.asarray(measured, dtype=np.float64))
+        residuals = residuals[np.isfinite(residuals)]
+
+        self.count += len(residuals)
+        self._sum += residuals.sum()
+        self._sum_squares += np.dot(residuals, residuals)
+
+    def merge(self, other):
+        """
+        Adds the residuals of another accumulator.
+        """
+
+        self.count += other.count
+        self._sum += other._sum
+        self._sum_squares += other._sum_squares
+
+    @property
+    def rmsd(self):
+        """Root-mean-square deviation of the residuals."""
+        if self.count == 0:
+            return np.nan
+        return math.sqrt(self._sum_squares / self.count)
+
+    @property
+    def bias(self):
+        """Mean of the residuals."""
+        if self.count == 0:
+            return np.nan
+        return self._sum / self.count
+
+
+class Profiler(object):
+    """
+    The Profiler class records the calls of the public functions and methods
+    of ``cpvsystem``, and optionally of other modules such as 
+    ``cpvlocation``, to find out where the time of a simulation or a 
+    calibration goes.
+
+    While enabled, the functions and methods are replaced by wrappers that
+    record the number of calls, the wall time with and without the
+    instrumented calls made inside, the number of elements of the array
+    inputs and, if memory is True, the peak of the memory allocated by the
+    call. The originals are put back when disabled, so the instrumentation 
+    costs nothing otherwise. Only the calls made by the current process are
+    recorded, and generators are timed until they are created only.
+
+    Parameters
+    ----------
+    modules : None or sequence of modules, default None
+        modules whose functions and classes are instrumented. Functions 
+        imported from one of them by another are instrumented too. None 
+        instruments ``cpvsystem`` only.
+
+    memory : bool, default False
+        traces the allocated memory with tracemalloc, which slows down the
+        instrumented code.
+
+    Examples
+    --------
+    >>> with Profiler(memory=True) as profiler:
+    ...     system.singlediode(*system.calcparams_pvsyst(dni, temp_cell))
+    >>> profiler.to_json('profile.json')
+    """
+
+    # Dunder methods that are instrumented as the public ones.
+    _DUNDER_METHODS = ('__call__',)
+
+    _active = None
+
+    def __init__(self, modules=None, memory=False):
+
+        self.modules = (sys.modules[__name__],) if modules is None else tuple(
+            modules)
+        self.memory = memory
+        self._records = OrderedDict()
+        self._stack = []
+        self._patches = []
+        self._started_tracemalloc = False
+
+    def __repr__(self):
+        return ('Profiler: \n  modules: {}\n  enabled: {}\n  functions: {}'
+                .format([module.__name__ for module in self.modules], 
+                        self.enabled, len(self._records)))
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    @property
+    def enabled(self):
+        """True while the functions are instrumented."""
+        return Profiler._active is self
+
+    def enable(self):
+        """
+        Replaces the functions and methods of the modules by instrumented 
+        wrappers.
+        """
+
+        if Profiler._active is not None:
+            raise RuntimeError('Another Profiler is already enabled')
+
+        if self.memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+
+        wrappers = {}
+        for module in self.modules:
+            for name, value in list(vars(module).items()):
+                if name.startswith('_') or value is Profiler:
+                    continue
+                if getattr(value, '__module__', None) != module.__name__:
+                    continue
+                if isinstance(value, types.FunctionType):
+                    wrappers[value] = self._wrap(value)
+                elif isinstance(value, type):
+                    self._patch_class(value)
+
+        # Functions are patched wherever the modules reference them, so that
+        # calls through ``from cpvsystem import ...`` are recorded too.
+        for module in self.modules:
+            for name, value in list(vars(module).items()):
+                if isinstance(value, types.FunctionType) and value in wrappers:
+                    self._patches.append((module, name, value))
+                    setattr(module, name, wrappers[value])
+
+        Profiler._active = self
+
+    def disable(self):
+        """
+        Puts back the original functions and methods.
+        """
+
+        for owner, name, value in reversed(self._patches):
+            setattr(owner, name, value)
+        self._patches = []
+        self._stack = []
+
+        if self._started_tracemalloc:
+            import tracemalloc
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+        if Profiler._active is self:
+            Profiler._active = None
+
+    def reset(self):
+        """
+        Forgets the recorded calls.
+        """
+
+        self._records = OrderedDict()
+
+    def report(self):
+        """
+        Summary of the recorded calls.
+
+        Returns
+        -------
+        report : dict
+            ``memory`` and ``functions``, a list with the ``name``, 
+            ``calls``, ``time`` and ``self_time`` in s, ``input_elements``, 
+            ``max_input_elements``, ``elements_per_s`` and, if memory was 
+            traced, the ``allocated_bytes`` of all the calls and the 
+            ``peak_bytes`` of the largest one, of every called function, 
+            sorted by self time.
+        """
+
+        functions = []
+        for name, record in self._records.items():
+            calls, time_, self_time, elements, max_elements, allocated, \
+                peak = record
+            row = OrderedDict([
+                ('name', name), ('calls', calls), ('time', time_), 
+                ('self_time', self_time), ('input_elements', elements), 
+                ('max_input_elements', max_elements), 
+                ('elements_per_s', elements / time_ if time_ > 0 else None)])
+            if self.memory:
+                row['allocated_bytes'] = allocated
+                row['peak_bytes'] = peak
+            functions.append(row)
+
+        functions.sort(key=lambda row: row['self_time'], reverse=True)
+
+        return OrderedDict([('memory', self.memory), 
+                            ('functions', functions)])
+
+    def to_json(self, filename=None, indent=1):
+        """
+        Exports the report as JSON.
+
+        Parameters
+        ----------
+        filename : None or str, default None
+            file where the report is written.
+
+        indent : None or int, default 1
+
+        Returns
+        -------
+        text : str
+            the report, when no filename is given.
+        """
+
+        import json
+
+        if filename is None:
+            return json.dumps(self.report(), indent=indent)
+
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=indent)
+
+    def _patch_class(self, cls):
+
+        for name, value in list(vars(cls).items()):
+            if name.startswith('_') and name not in self._DUNDER_METHODS:
+                continue
+            if isinstance(value, (staticmethod, classmethod)):
+                wrapper = type(value)(self._wrap(value.__func__))
+            elif isinstance(value, types.FunctionType):
+                wrapper = self._wrap(value)
+            else:
+                continue
+            self._patches.append((cls, name, value))
+            setattr(cls, name, wrapper)
+
+    def _wrap(self, func):
+
+        name = '{}.{}'.format(func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self._call(name, func, args, kwargs)
+
+        return wrapper
+
+    def _call(self, name, func, args, kwargs):
+
+        elements = 0
+        for value in args + tuple(kwargs.values()):
+            # The columns of dicts are counted as those of DataFrames.
+            for value in (value.values() if isinstance(value, dict) 
+                          else (value,)):
+                size = getattr(value, 'size', None)
+                if isinstance(size, (int, np.integer)):
+                    elements += int(size)
+                elif isinstance(value, (list, tuple)):
+                    elements += len(value)
+
+        # [time of the instrumented calls inside, traced memory at the start,
+        # peak of the traced memory]
+        frame = [0.0, 0, 0]
+        if self.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][2] = max(self._stack[-1][2], peak)
+            tracemalloc.reset_peak()
+            frame[1] = frame[2] = current
+
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][0] += elapsed
+
+            allocated = 0
+            if self.memory:
+                peak = max(frame[2], tracemalloc.get_traced_memory()[1])
+                allocated = peak - frame[1]
+                if self._stack:
+                    self._stack[-1][2] = max(self._stack[-1][2], peak)
+                tracemalloc.reset_peak()
+
+            record = self._records.get(name)
+            if record is None:
+                record = self._records[name] = [0, 0.0, 0.0, 0, 0, 0, 0]
+            record[0] += 1
+            record[1] += elapsed
+            record[2] += elapsed - frame[0]
+            record[3] += elements
+            record[4] = max(record[4], elements)
+            record[5] += allocated
+            record[6] = max(record[6], allocated)
+
+
+def __getattr__(name):
+    """
+    Exposes the located CPV systems of ``cpvlocation`` and the measurement 
+    tables of ``cpvdata``, importing pvlib and pandas on first access only.
+    """
+    
+    if name in ('Location', 'LocalizedCPVSystem', 'LocalizedStaticCPVSystem'):
+        import cpvlocation
+        return getattr(cpvlocation, name)
+    
+    if name in ('MeasurementTable', 'MEASUREMENT_SCHEMAS'):
+        import cpvdata
+        return getattr(cpvdata, name)
+    
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, 
+                                                                    name))
+
+
+def calc_fleet_dc(systems, effective_irradiance, poa_global, temp_air, 
+                  wind_speed=1.0, ivcurve_pnts=None, method='lambertw'):
+    """
+    Applies the PVsyst model to a fleet of CPV systems sharing the same 
+    weather: cell temperature, diode parameters and single diode solution of
+    every system and time step in one broadcasted pass.
+    
+    Parameters
+    ----------
+    systems : sequence of CPVSystem or StaticCPVSystem, DataFrame or dict
+        the systems of the fleet, or a table with one row per system and 
+        columns for the PVsyst module parameters, ``racking_model`` and 
+        optionally ``modules_per_string`` and ``strings_per_inverter``.
+    
+    effective_irradiance : numeric
+        The irradiance (W/m2) that is converted to photocurrent, DNI for 
+        tracked systems or DII for static ones.
+    
+    poa_global : numeric
+        Total incident irradiance (W/m2), GNI or GII.
+    
+    temp_air : numeric
+        Ambient dry bulb temperature in degrees C.
+    
+    wind_speed : numeric, default 1.0
+        Wind speed in m/s.
+    
+    ivcurve_pnts : None or int, default None
+        Number of points in the desired IV curves.
+    
+    method : string, default 'lambertw'
+        single diode solver, see CPVSystem.singlediode.
+    
+    Returns
+    -------
+    dc : OrderedDict
+        ``temp_cell`` and the keys of pvsystem.singlediode, as arrays of 
+        shape (systems, times). Voltages are scaled by modules_per_string, 
+        currents by strings_per_inverter and power by both.
+    """
+    
+    from pvlib import pvsystem
+    
+    table = _get_fleet_table(systems)
+    
+    def column(name):
+        return np.asarray(table[name], dtype=np.float64)[:, np.newaxis]
+    
+    def row(values):
+        return np.asarray(values, dtype=np.float64)[np.newaxis, ...]
+    
+    # Heat loss factors of every system from its racking model.
+    presets = pvsystem.TEMP_MODEL_PARAMS['pvsyst']
+    loss_factors = [presets[racking.lower()] if isinstance(racking, str) 
+                    else racking for racking in table['racking_model']]
+    constant_loss, wind_loss = (np.array(factors, dtype=np.float64)[:, None]
+                                for factors in zip(*loss_factors))
+    
+    temp_cell = pvsystem.pvsyst_celltemp(
+            row(poa_global), row(temp_air), row(wind_speed),
+            model_params=(constant_loss, wind_loss),
+            **{name: column(name) for name in _PVSYST_CELLTEMP_KEYS 
+               if name in table})
+    
+    diode_params = pvsystem.calcparams_pvsyst(
+            row(effective_irradiance), temp_cell,
+            **{name: column(name) for name in _CALCPARAMS_PVSYST_KEYS
+               if name in table})
+    
+    if method == 'fast':
+        dc = singlediode_fast(*diode_params)
+    else:
+        dc = pvsystem.singlediode(*diode_params, ivcurve_pnts=ivcurve_pnts,
+                                  method=method)
+    
+    # The module results are scaled to the strings of every system.
+    modules_per_string = column('modules_per_string')
+    strings_per_inverter = column('strings_per_inverter')
+    
+    fleet_dc = OrderedDict(temp_cell=np.broadcast_to(temp_cell, 
+                                                     dc['p_mp'].shape))
+    for key, value in dc.items():
+        if key.startswith('v'):
+            value = value * modules_per_string
+        elif key.startswith('i'):
+            value = value * strings_per_inverter
+        elif key.startswith('p'):
+            value = value * modules_per_string * strings_per_inverter
+        fleet_dc[key] = value
+    
+    return fleet_dc
+
+
+def singlediode_fast(photocurrent, saturation_current, resistance_series, 
+                     resistance_shunt, nNsVth, tol=1e-6, maxiter=20):
+    """
+    Solves the short circuit, open circuit and maximum power points of the 
+    single diode model with a fixed number of vectorized Newton iterations.
+    
+    The points are found on the diode voltage ``vd``, from which the current
+    and the voltage are explicit [1]:
+    
+        I = IL - I0*[exp(vd/nNsVth)-1] - vd/Rsh
+        V = vd - I*Rs
+    
+    Every iteration updates all the points at once, and the iterations stop 
+    when the largest step is below tol or after maxiter iterations, so the 
+    error is bounded by tol in volts for the converged points.
+    
+    Parameters
+    ----------
+    photocurrent : numeric
+        Light-generated current in amperes.
+    
+    saturation_current : numeric
+        Diode saturation current in amperes.
+    
+    resistance_series : numeric
+        Series resistance in ohms.
+    
+    resistance_shunt : numeric
+        Shunt resistance in ohms.
+    
+    nNsVth : numeric
+        The product of the diode ideality factor, the number of cells in 
+        series and the cell thermal voltage.
+    
+    tol : numeric, default 1e-6
+        Tolerance in volts of the diode voltage.
+    
+    maxiter : int, default 20
+        Maximum number of Newton iterations of every point.
+    
+    Returns
+    -------
+    OrderedDict or DataFrame
+        with the keys/columns ``i_sc, v_oc, i_mp, v_mp, p_mp, i_x, i_xx``, 
+        as pvsystem.singlediode, where ``i_x`` and ``i_xx`` are the currents
+        at ``v_oc/2`` and ``(v_oc + v_mp)/2``. A DataFrame is returned if 
+        photocurrent is a Series.
+    
+    Notes
+    -----
+    Negative photocurrents give the negative open circuit voltage and the 
+    points between it and the short circuit, like pvsystem.singlediode.
+    
+    References
+    ----------
+    [1] "Computer simulation of the effects of electrical mismatches in 
+    photovoltaic cell interconnection circuits" JW Bishop, Solar Cell (1988)
+    """
+    
+    il, i0, rs, rsh, nvth = np.broadcast_arrays(
+            *(np.asarray(value, dtype=np.float64) for value in 
+              (photocurrent, saturation_current, resistance_series, 
+               resistance_shunt, nNsVth)))
+    
+    def current(vd):
+        return il - i0 * np.expm1(vd / nvth) - vd / rsh
+    
+    def newton(vd, step_func):
+        for _ in range(maxiter):
+            step = step_func(vd)
+            vd = vd - step
+            if not np.any(np.abs(step) > tol):
+                break
+        return vd
+    
+    # Open circuit: I(vd) = 0, starting from the open circuit voltage without
+    # shunt losses, on the side where the iterations converge monotonically.
+    # Negative photocurrents start from 0, also on that side.
+    def voc_step(vd):
+        return current(vd) / (-i0 / nvth * np.exp(vd / nvth) - 1 / rsh)
+    
+    vd_oc = newton(nvth * np.log1p(np.maximum(il, 0) / i0), voc_step)
+    
+    # Voltage v: V(vd) = vd - I(vd)*Rs = v.
+    def voltage_step(v):
+        def step(vd):
+            di = -i0 / nvth * np.exp(vd / nvth) - 1 / rsh
+            return (vd - current(vd) * rs - v) / (1 - rs * di)
+        return step
+    
+    vd_sc = newton(il * rs, voltage_step(0))
+    
+    # Maximum power: dP/dvd = 0, kept between short and open circuit.
+    vd_low = np.minimum(vd_sc, vd_oc)
+    vd_high = np.maximum(vd_sc, vd_oc)
+    
+    def mpp_step(vd):
+        exp_vd = np.exp(vd / nvth)
+        i = il - i0 * (exp_vd - 1) - vd / rsh
+        v = vd - i * rs
+        di = -i0 / nvth * exp_vd - 1 / rsh
+        d2i = -i0 / nvth ** 2 * exp_vd
+        dv = 1 - rs * di
+        dp = di * v + i * dv
+        d2p = d2i * v + 2 * di * dv - i * rs * d2i
+        return vd - np.clip(vd - dp / d2p, vd_low, vd_high)
+    
+    vd_mp = newton(vd_oc, mpp_step)
+    
+    i_mp = current(vd_mp)
+    v_mp = vd_mp - i_mp * rs
+    
+    # Points of the curve between the maximum power and open circuit, from
+    # the open circuit side.
+    vd_x = newton(vd_oc, voltage_step(vd_oc / 2))
+    vd_xx = newton(vd_oc, voltage_step((vd_oc + v_mp) / 2))
+    
+    out = OrderedDict()
+    out['i_sc'] = current(vd_sc)
+    out['v_oc'] = vd_oc
+    out['i_mp'] = i_mp
+    out['v_mp'] = v_mp
+    out['p_mp'] = i_mp * v_mp
+    out['i_x'] = current(vd_x)
+    out['i_xx'] = current(vd_xx)
+    
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(photocurrent, pd.Series):
+        out = pd.DataFrame(out, index=photocurrent.index)
+    
+    return out
+
+
+def _get_fleet_table(systems):
+    """
+    Columns of the parameters of a fleet of systems, one value per system.
+    Only the module parameters of the PVsyst models are kept; those that 
+    no system has are left to their pvlib defaults.
+    """
+    
+    if isinstance(systems, dict) or hasattr(systems, 'columns'):
+        table = {name: list(systems[name]) for name in systems}
+    
+    else:
+        table = {}
+        for name in _CALCPARAMS_PVSYST_KEYS + _PVSYST_CELLTEMP_KEYS:
+            missing = [i for i, system in enumerate(systems) 
+                       if name not in system.module_parameters]
+            if len(missing) == len(systems):
+                continue
+            if missing:
+                raise ValueError(
+                    'System {} ({!r}) of the fleet has no module parameter '
+                    '{!r}, which other systems have'.format(
+                        missing[0], systems[missing[0]].name, name))
+            table[name] = [system.module_parameters[name] 
+                           for system in systems]
+        for name in ('racking_model', 'modules_per_string', 
+                     'strings_per_inverter'):
+            table[name] = [getattr(system, name) for system in systems]
+    
+    n_systems = len(table['racking_model'])
+    table.setdefault('modules_per_string', [1] * n_systems)
+    table.setdefault('strings_per_inverter', [1] * n_systems)
+    
+    return table
+
+
+def get_simple_util_factor(x, thld, m_low, m_high, out=None):
+    """
+    Retrieves the utilization factor for a variable.
+    
+    Parameters
+    ----------
+    x : numeric / array-like
+        variable value(s) for the utilization factor calc.
+    
+    thld : numeric
+        limit between the two regression lines of the utilization factor.
+    
+    m_low : numeric
+        inclination of the first regression line of the utilization factor.
+    
+    m_high : numeric
+        inclination of the second regression line of the utilization factor.
+    
+    out : numpy.ndarray, optional
+        buffer with the shape of x where the result is stored.
+    
+    Returns
+    -------
+    single_uf : numeric
+        utilization factor for the x variable. Series inputs keep their index,
+        floating point inputs keep their dtype and scalar inputs return a 
+        scalar.
+    """
+    
+    values = np.asarray(x)
+    
+    if out is None:
+        out = np.empty(values.shape, dtype=_float_dtype(values))
+    
+    # The lines are evaluated in place, selecting the inclination by the side
+    # of the limit in which every value lies.
+    m = np.where(values <= thld, m_low, m_high)
+    np.subtract(values, thld, out=out)
+    np.multiply(out, m, out=out)
+    np.add(out, 1, out=out)
+    
+    return _wrap_like(out, x)
+
+
+def _get_aoi_uf_ref(aoi_thld, aoi_uf_m_low, aoi_uf_m_high):
+    """
+    Utilization factor for AOI at normal incidence, which normalizes it.
+    """
+    
+    return max(get_simple_util_factor(0.0, aoi_thld, aoi_uf_m_low, 
+                                      aoi_uf_m_high), 0.0)
+
+
+def _clip_segments(breaks, slopes, intercepts):
+    """
+    Segment coefficients of max(f, 0) for a piecewise linear function f, 
+    adding the breakpoints where its segments cross zero.
+    """
+
+    bounds = np.concatenate(([-np.inf], breaks, [np.inf]))
+    new_breaks = []
+    new_slopes = []
+    new_intercepts = []
+
+    for i, (m, n) in enumerate(zip(slopes, intercepts)):
+        low, high = bounds[i], bounds[i + 1]
+        points = [low, high]
+        if m != 0 and low < -n / m < high:
+            points.insert(1, -n / m)
+
+        for start, stop in zip(points[:-1], points[1:]):
+            # The sign of the segment is checked at an inner point.
+            if np.isinf(start) and np.isinf(stop):
+                inner = 0.0
+            elif np.isinf(start):
+                inner = stop - 1
+            elif np.isinf(stop):
+                inner = start + 1
+            else:
+                inner = (start + stop) / 2
+
+            if m * inner + n < 0:
+                new_slopes.append(0.0)
+                new_intercepts.append(0.0)
+            else:
+                new_slopes.append(m)
+                new_intercepts.append(n)
+            new_breaks.append(stop)
+
+    return (np.array(new_breaks[:-1]), np.array(new_slopes), 
+            np.array(new_intercepts))
+
+
+def _float_dtype(*values):
+    """
+    Floating point dtype of the result of an operation over the values; 
+    non floating inputs are promoted to float64.
+    """
+    
+    dtypes = [np.asarray(value).dtype for value in values]
+    
+    if all(np.issubdtype(dtype, np.floating) for dtype in dtypes):
+        return np.result_type(*dtypes)
+    
+    return np.dtype(np.float64)
+
+
+def _wrap_like(result, *inputs):
+    """
+    Returns the result array as a Series with the index of the first Series 
+    input, or as a scalar if it has no dimensions.
+    """
+    
+    # A Series can only be given if pandas has already been imported.
+    pd = sys.modules.get('pandas')
+    
+    for value in inputs:
+        if pd is not None and isinstance(value, pd.Series):
+            return pd.Series(result, index=value.index)
+    
+    if result.ndim == 0:
+        return result[()]
+    
+    return result
+
+
+def calc_binned_stat(x, y, bin_width=0.1, start=None, stop=None, 
+                     statistic='median', q=None, min_samples=1):
+    """
+    Aggregates the y measurements in bins of x, as the points used to fit the 
+    regression lines of a utilization factor.
+    
+    The bins are centered on ``numpy.arange(start, stop, bin_width)``, as 
+    the loops of the original scripts, and the measurements are sorted once 
+    and split by bin, so the cost does not grow with the number of bins.
+    
+    Parameters
+    ----------
+    x : list or numpy.array of float
+    
+    y : list or numpy.array of float
+    
+    bin_width : numeric, default 0.1
+        width of the bins of x.
+    
+    start : numeric, optional
+        center of the first bin. If not given, the bins are centered on the 
+        multiples of bin_width.
+    
+    stop : numeric, optional
+        end of the bin centers, not included.
+    
+    statistic : string, default 'median'
+        'median', 'mean', 'percentile' or 'count'.
+    
+    q : numeric, optional
+        percentile between 0 and 100 for statistic 'percentile'.
+    
+    min_samples : int, default 1
+        minimum number of measurements of the bins returned.
+    
+    Returns
+    -------
+    bin_centers : numpy.array
+        centers of the bins with at least min_samples measurements.
+    
+    values : numpy.array
+        statistic of the y measurements of every bin.
+    """
+    
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    
+    if statistic == 'median':
+        q = 50
+    elif statistic == 'percentile' and q is None:
+        raise ValueError("q is required for statistic 'percentile'")
+    elif statistic not in ('mean', 'count', 'percentile'):
+        raise ValueError('Unknown statistic: {}'.format(statistic))
+    
+    origin = 0.0 if start is None else start
+    
+    # Every measurement is assigned the index of its nearest bin center.
+    valid = np.isfinite(x) & np.isfinite(y)
+    bins = np.floor((x[valid] - origin) / bin_width + 0.5).astype(np.int64)
+    y = y[valid]
+    
+    keep = np.ones(len(bins), dtype=bool)
+    if start is not None:
+        keep &= bins >= 0
+    if stop is not None:
+        keep &= bins < len(np.arange(origin, stop, bin_width))
+    bins = bins[keep]
+    y = y[keep]
+    
+    # The measurements are sorted by bin, and by value inside every bin for 
+    # the percentiles.
+    if statistic in ('median', 'percentile'):
+        order = np.lexsort((y, bins))
+    else:
+        order = np.argsort(bins, kind='mergesort')
+    bins = bins[order]
+    y = y[order]
+    
+    first = np.flatnonzero(np.diff(bins, prepend=bins[:1] - 1))
+    counts = np.diff(np.append(first, len(bins)))
+    
+    enough = counts >= min_samples
+    # numpy.arange steps by the rounded difference of its first two values,
+    # so a center can fall on either side of a limit given as a float.
+    bin_centers = origin + bins[first[enough]] * ((origin + bin_width) 
+                                                  - origin)
+    
+    if statistic == 'count':
+        values = counts
+    elif statistic == 'mean':
+        values = np.add.reduceat(y, first) / counts if len(y) else counts
+    else:
+        # Linear interpolation between the closest ranks, as numpy.percentile
+        # and statistics.median.
+        position = first + q / 100. * (counts - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, first + counts - 1)
+        values = y[lower] + (y[upper] - y[lower]) * (position - lower)
+    
+    return bin_centers, values[enough]
+
+
+def calc_uf_weights(real_power, estimation, ufs):
+    """
+    Calculates the weights of the utilization factors that minimize the 
+    RMSD between the measured power and the estimation corrected by the 
+    weighted utilization factors. The weights are non-negative and add up to
+    one.
+    
+    The products of the utilization factors matrix are computed once and the 
+    constrained least squares problem is solved exactly on every subset of 
+    active factors from its KKT system, which is cheap for the few factors of
+    a CPV system.
+    
+    Parameters
+    ----------
+    real_power : array of numbers
+        measured power.
+    
+    estimation : array of numbers
+        estimated power without utilization factors.
+    
+    ufs : sequence of arrays or 2-D array
+        utilization factors (airmass, ambient temperature, DNI, AOI, ...), 
+        one per row.
+    
+    Returns
+    -------
+    weights : numpy.array
+        weight of every utilization factor.
+    
+    rmsd : numeric
+        root-mean-square deviation between the measured power and the 
+        corrected estimation.
+    """
+    
+    return _solve_uf_weights(*_get_uf_normal_equations(real_power, 
+                                                        estimation, ufs))
+
+
+def _get_uf_normal_equations(real_power, estimation, ufs):
+    """
+    Normal equations of the least squares problem of calc_uf_weights: the
+    products of the corrected estimations, their products with the measured
+    power, the squared measured power and the number of measurements.
+    """
+    
+    real_power = np.asarray(real_power, dtype=np.float64)
+    estimation = np.asarray(estimation, dtype=np.float64)
+    ufs = np.atleast_2d(np.asarray(ufs, dtype=np.float64))
+    
+    valid = (np.isfinite(real_power) & np.isfinite(estimation) 
+             & np.isfinite(ufs).all(axis=0))
+    a = ufs[:, valid] * estimation[valid]
+    p = real_power[valid]
+    
+    return np.dot(a, a.T), np.dot(a, p), np.dot(p, p), len(p)
+
+
+def _solve_uf_weights(gram, proj, pp, count):
+    """
+    Weights and rmsd of calc_uf_weights from its normal equations.
+    """
+    
+    if count == 0:
+        raise ValueError('No measurements to fit the utilization factor '
+                         'weights')
+    
+    n_ufs = len(proj)
+    weights = np.zeros(n_ufs)
+    sse = np.inf
+    
+    # The products are scaled to the order of the constraint, so that the 
+    # weights add up to one to the precision of the solver.
+    scale = np.trace(gram) / n_ufs or 1.0
+    
+    for subset in range(1, 2 ** n_ufs):
+        active = np.array([(subset >> i) & 1 for i in range(n_ufs)], 
+                          dtype=bool)
+        n_active = active.sum()
+        
+        # The weights of the active factors minimize the squared error 
+        # subject to adding up to one.
+        kkt = np.ones((n_active + 1, n_active + 1))
+        kkt[:-1, :-1] = gram[np.ix_(active, active)] / scale
+        kkt[-1, -1] = 0
+        rhs = np.append(proj[active] / scale, 1)
+        solution = np.linalg.lstsq(kkt, rhs, rcond=None)[0][:-1]
+        
+        if np.any(solution < -1e-12):
+            continue
+        
+        candidate = np.zeros(n_ufs)
+        candidate[active] = np.maximum(solution, 0)
+        candidate_sse = (np.dot(candidate, np.dot(gram, candidate)) 
+                         - 2 * np.dot(candidate, proj) + pp)
+        
+        if candidate_sse < sse:
+            weights = candidate
+            sse = candidate_sse
+    
+    rmsd = math.sqrt(max(sse, 0) / count)
+    
+    return weights, rmsd
+
+
+def calc_uf_lines(x, y, datatype = 'airmass', limit = None):
+    """
+    Calculates the parameters of two regression lines for a utilization factor
+    specified by datatype.
+    
+    Parameters
+    ----------
+    x : list or numpy.array of float
     
     y : list or numpy.array of float
     
+    datatype : string
+        indicates the type of parameter contained in x.
+    
     limit : numeric, optional
         forces the limit between the regression lines.
     
@@ -858,79 +2695,184 @@ def calc_two_regression_lines(x, y, limit):
         limit between the two regression lines of the utilization factor.
     """
     
-    if limit is None:
-        m_low, n_low, m_high, n_high, thld = 0, 0, 0, 0, 0
-        rmsd = 10000
-        
-        # The x array is traversed in order to find the most fitting 
-        # regression lines.
-        for i in np.arange(x[0], x[-2], 0.1):
-            # Auxiliar variables initialization.
-            x_aux1 = []
-            x_aux2 = []
-    
-            y_aux1 = [] 
-            y_aux2 = [] 
-            
-            # The original measurements are divided into two sets by the limit.
-            for j in range(len(x)):
-                if x[j] <= i:
-                    x_aux1.append(x[j])
-                    y_aux1.append(y[j])
-                else:
-                    x_aux2.append(x[j])
-                    y_aux2.append(y[j])
-                
-            # Regression lines are calculated for the two sets.
-            m_low_temp, n_low_temp, rmsd_low_temp = calc_regression_line(
-                    x_aux1, y_aux1)
-            
-            m_high_temp, n_high_temp, rmsd_high_temp = calc_regression_line(
-                    x_aux2, y_aux2)
+    if datatype == 'airmass' or datatype == 'aoi':
+        return calc_two_regression_lines(x, y, limit)
+    
+    elif datatype == 'temp_air':
+        m_low, n_low, rmsd_low = calc_regression_line(x, y)
         
-            # Less suitable regression lines are rejected.
-            rmsd_temp = rmsd_low_temp + rmsd_high_temp
+        if limit is None:
+            limit = 50
         
-            if rmsd_temp < rmsd:
-                m_low = m_low_temp
-                n_low = n_low_temp
-                m_high = m_high_temp
-                n_high = n_high_temp
-                rmsd = rmsd_temp
-    
-        # The intersection between the two final regression lines is calculated.
-        thld = (n_high - n_low) / (m_low - m_high)
+        n_high = m_low * limit + n_low
+        return m_low, n_low, 0, n_high, limit
     
     else:
-        # Auxiliar variables initialization.
-        x_aux1 = []
-        x_aux2 = []
+        return 0, 0, 0, 0, 0
+
+
+def calc_two_regression_lines(x, y, limit, min_samples=2):
+    """
+    Calculates the parameters of two regression lines for the composed 
+    utilization factors.
+    
+    When no limit is forced, every split point between consecutive sorted 
+    values of x is evaluated at once from cumulative sums of x, y, x^2, xy and
+    y^2, and the split with the lowest sum of the RMSDs of both lines is kept.
+    
+    Parameters
+    ----------
+    x : list or numpy.array of float
+    
+    y : list or numpy.array of float
+    
+    limit : numeric, optional
+        forces the limit between the regression lines.
+    
+    min_samples : int, default 2
+        minimum number of measurements at each side of the split point when 
+        the limit is not forced, at least 2.
+    
+    Returns
+    -------
+    m_low : numeric
+        inclination of the first regression line of the utilization factor.
+    
+    n_low : numeric
+        ordinate at the origin of the first regression line.
+    
+    m_high : numeric
+        inclination of the second regression line of the utilization factor.
+    
+    n_high : numeric
+        ordinate at the origin of the second regression line.
+    
+    thld : numeric
+        limit between the two regression lines of the utilization factor. 
+        If the lines are parallel, the limit forced or the split point.
+    """
     
-        y_aux1 = [] 
-        y_aux2 = [] 
+    if min_samples < 2:
+        raise ValueError('Two regression lines need min_samples >= 2, got '
+                         '{}'.format(min_samples))
+    
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    
+    if limit is None:
+        # The measurements are sorted and centered so that the cumulative 
+        # sums do not lose precision.
+        order = np.argsort(x, kind='mergesort')
+        x_mean = x.mean()
+        y_mean = y.mean()
+        xc = x[order] - x_mean
+        yc = y[order] - y_mean
+        
+        sums = np.cumsum(np.stack((np.ones_like(xc), xc, yc, xc * xc, 
+                                   xc * yc, yc * yc)), axis=1)
+        
+        # Every split leaves the first k sorted measurements in the lower set
+        # and the rest in the upper one. Equal values of x are never split.
+        k = np.arange(min_samples, len(xc) - min_samples + 1)
+        k = k[xc[k - 1] < xc[k]]
+        
+        if len(k) == 0:
+            raise ValueError('Not enough distinct measurements to fit two '
+                             'regression lines')
+        
+        low_sums = sums[:, k - 1]
+        high_sums = sums[:, -1:] - low_sums
+        
+        m_low, n_low, rmsd_low = _calc_lines_from_sums(*low_sums)
+        m_high, n_high, rmsd_high = _calc_lines_from_sums(*high_sums)
+        
+        # Less suitable regression lines are rejected.
+        best = np.argmin(rmsd_low + rmsd_high)
+        
+        # The lines are moved back from the centered coordinates.
+        m_low = m_low[best]
+        n_low = n_low[best] + y_mean - m_low * x_mean
+        m_high = m_high[best]
+        n_high = n_high[best] + y_mean - m_high * x_mean
+        split = (xc[k[best] - 1] + xc[k[best]]) / 2 + x_mean
     
+    else:
         # The original measurements are divided into two sets by the limit.
-        for j in range(len(x)):
-            if x[j] <= limit:
-                x_aux1.append(x[j])
-                y_aux1.append(y[j])
-            else:
-                x_aux2.append(x[j])
-                y_aux2.append(y[j])
+        is_low = x <= limit
         
         # Regression lines are calculated for the two sets.
-        m_low, n_low, rmsd_low = calc_regression_line(x_aux1, y_aux1)
+        m_low, n_low, rmsd_low = calc_regression_line(x[is_low], y[is_low])
             
-        m_high, n_high, rmsd_high = calc_regression_line(x_aux2, y_aux2)
-        
-        # The intersection between the two final regression lines is 
-        # calculated as it can not be exactly the limit forced.
+        m_high, n_high, rmsd_high = calc_regression_line(x[~is_low], 
+                                                         y[~is_low])
+        split = limit
+    
+    # The intersection between the two final regression lines is calculated, 
+    # as it can not be exactly the limit forced or the split point. Parallel
+    # lines, such as those of collinear measurements, do not cross.
+    if np.isclose(m_low, m_high, rtol=1e-9, atol=0):
+        thld = split
+    else:
         thld = (n_high - n_low) / (m_low - m_high)
     
     return m_low, n_low, m_high, n_high, thld
 
 
-def calc_regression_line(x, y):
+def _calc_lines_from_sums(count, sum_x, sum_y, sum_xx, sum_xy, sum_yy):
+    """
+    Least squares regression lines from the sufficient statistics of one or 
+    more sets of measurements.
+    
+    Parameters
+    ----------
+    count, sum_x, sum_y, sum_xx, sum_xy, sum_yy : numeric or numpy.array
+        number of measurements and sums of x, y, x^2, xy and y^2 of every set.
+    
+    Returns
+    -------
+    m : numeric or numpy.array
+        inclination of the regression lines.
+        
+    n : numeric or numpy.array
+        ordinate at the origin of the regression lines.
+        
+    rmsd : numeric or numpy.array
+        root-mean-square deviation between the regression lines and the 
+        measurements.
+    """
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sxx = sum_xx - sum_x * sum_x / count
+        sxy = sum_xy - sum_x * sum_y / count
+        syy = sum_yy - sum_y * sum_y / count
+        
+        # Sets without variation in x get a horizontal line, as in a least 
+        # squares solution of minimum norm.
+        m = np.where(sxx > 1e-12 * sum_xx, sxy / sxx, 0.0)
+        n = (sum_y - m * sum_x) / count
+        sse = np.maximum(syy - m * sxy, 0.0)
+        rmsd = np.sqrt(sse / count)
+    
+    return m, n, rmsd
+
+
+def _recenter_sums(sums, center, new_center):
+    """
+    Moves the sums of count, x, y, x^2, xy and y^2 of measurements centered
+    on center to new_center.
+    """
+    
+    count, sum_x, sum_y, sum_xx, sum_xy, sum_yy = sums
+    dx = center[0] - new_center[0]
+    dy = center[1] - new_center[1]
+    
+    return np.array([count, sum_x + count * dx, sum_y + count * dy,
+                     sum_xx + 2 * dx * sum_x + count * dx * dx,
+                     sum_xy + dx * sum_y + dy * sum_x + count * dx * dy,
+                     sum_yy + 2 * dy * sum_y + count * dy * dy])
+
+
+def calc_regression_line(x, y, method='numpy'):
     """
     Wrapper for regression line calcs.
         
@@ -940,6 +2882,11 @@ def calc_regression_line(x, y):
     
     y : array of numbers
     
+    method : string, default 'numpy'
+        'numpy' solves the least squares line in closed form from the sums of 
+        x, y, x^2, xy and y^2. 'sklearn' fits a 
+        ``sklearn.linear_model.LinearRegression`` model.
+    
     Returns
     -------
     m : numeric
@@ -954,29 +2901,109 @@ def calc_regression_line(x, y):
     """
     
     # Initial input treatment.
-    if not isinstance(x, np.ndarray):
-        x = np.array(x)
-    x = x[:, np.newaxis]
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    
+    if len(x) == 0:
+        raise ValueError('No measurements to fit the regression line')
     
-    if not isinstance(y, np.ndarray):
-        y = np.array(y)
-    y = y[:, np.newaxis]
+    if method == 'numpy':
+        # The measurements are centered so that the sums do not lose 
+        # precision.
+        x_mean = x.mean()
+        y_mean = y.mean()
+        xc = x - x_mean
+        yc = y - y_mean
+        
+        m, n, rmsd = _calc_lines_from_sums(len(x), xc.sum(), yc.sum(), 
+                                           np.dot(xc, xc), np.dot(xc, yc), 
+                                           np.dot(yc, yc))
+        
+        m = float(m)
+        n = float(n) + y_mean - m * x_mean
+        rmsd = float(rmsd)
+    
+    elif method == 'sklearn':
+        from sklearn import linear_model
+        from sklearn.metrics import mean_squared_error
+        
+        x = x[:, np.newaxis]
+        y = y[:, np.newaxis]
+        
+        # The regression line model is executed.
+        model = linear_model.LinearRegression()
+        model.fit(x, y)
+        
+        # Coeficients of the line are obtained.
+        m = model.coef_[0][0]
+        
+        n = model.intercept_[0]
+        
+        # The root-mean-square deviation is calculated.
+        y_pred = model.predict(x)
+        
+        rmsd = math.sqrt(mean_squared_error(y, y_pred))
+    
+    else:
+        raise ValueError('Unknown regression method: {}'.format(method))
+    
+    return m, n, rmsd
+
+
+def calc_regression_lines(x, y, groups):
+    """
+    Calculates the regression lines of several groups of measurements in a 
+    single pass.
+        
+    Parameters
+    ----------
+    x : array of numbers
+    
+    y : array of numbers
+    
+    groups : array
+        label of the group of every measurement.
+    
+    Returns
+    -------
+    labels : numpy.array
+        sorted unique labels of the groups.
+    
+    m : numpy.array
+        inclination of the regression line of every group.
+        
+    n : numpy.array
+        ordinate at the origin of the regression line of every group.
+        
+    rmsd : numpy.array
+        root-mean-square deviation between the regression line and the 
+        measurements of every group.
+    """
     
-    # The regression line model is executed.
-    model = linear_model.LinearRegression()
-    model.fit(x, y)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    labels, group_idx = np.unique(groups, return_inverse=True)
+    group_idx = group_idx.ravel()
     
-    # Coeficients of the line are obtained.
-    m = model.coef_[0][0]
+    count = np.bincount(group_idx, minlength=len(labels))
     
-    n = model.intercept_[0]
+    # Every group is centered on its own means so that the sums do not lose 
+    # precision.
+    x_mean = np.bincount(group_idx, x, len(labels)) / count
+    y_mean = np.bincount(group_idx, y, len(labels)) / count
+    xc = x - x_mean[group_idx]
+    yc = y - y_mean[group_idx]
     
-    # The root-mean-square deviation is calculated.
-    y_pred = model.predict(x)
+    m, n, rmsd = _calc_lines_from_sums(
+            count, np.bincount(group_idx, xc, len(labels)), 
+            np.bincount(group_idx, yc, len(labels)),
+            np.bincount(group_idx, xc * xc, len(labels)),
+            np.bincount(group_idx, xc * yc, len(labels)), 
+            np.bincount(group_idx, yc * yc, len(labels)))
     
-    rmsd = math.sqrt(mean_squared_error(y, y_pred))
+    n = n + y_mean - m * x_mean
     
-    return m, n, rmsd
+    return labels, m, n, rmsd
 
 
 
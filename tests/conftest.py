@@ -0,0 +1,32 @@
+"""
+Shared fixtures of the tests. The modules of the repository are imported
+from its root, as the benchmarks do.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def rng():
+    return np.random.RandomState(0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    """DataStore in a temporary directory, so the Data Files are untouched."""
+    import cpvdata
+    return cpvdata.DataStore(str(tmp_path / 'store'))
+
+
+@pytest.fixture(scope='session')
+def location():
+    """Location of the IES rooftop of the F2 scripts."""
+    from pvlib.location import Location
+    return Location(latitude=40.453, longitude=-3.727, tz=1, altitude=658)
@@ -0,0 +1,343 @@
+"""
+Tests of cpvdata: the readers, joins, filters and strata are compared with
+the Data Files written by the original MATLAB scripts.
+"""
+
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cpvdata
+from cpvdata import DataStore, MeasurementTable
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Data Files')
+
+
+def data_file(name):
+    return os.path.join(DATA_DIR, name)
+
+
+def write_text(path, rows):
+    with open(str(path), 'w') as f:
+        f.write(''.join(','.join(str(value) for value in row) + '\n'
+                        for row in rows))
+    return str(path)
+
+
+@pytest.mark.parametrize('format', cpvdata.DATESTR_FORMATS)
+def test_parse_datestr_matches_strptime(format, rng):
+    stamps = pd.Timestamp('2018-11-21') + pd.to_timedelta(
+        rng.randint(0, 400 * 86400, 500), unit='s')
+    datestr = [stamp.strftime(format) for stamp in stamps]
+
+    times = cpvdata.parse_datestr(datestr)
+
+    expected = [datetime.datetime.strptime(date, format) for date in datestr]
+    assert list(times) == [pd.Timestamp(date) for date in expected]
+
+
+def test_parse_datestr_fallback_and_tz():
+    datestr = ['1-May-2019 08:44:18', '30-May-2019 10:05:00']
+
+    times = cpvdata.parse_datestr(datestr, tz=1)
+    utc = cpvdata.parse_datestr(datestr, tz='UTC')
+
+    assert times[0] == pd.Timestamp('2019-05-01 07:44:18', tz='UTC')
+    assert str(times.tz) == 'UTC+01:00'
+    assert (utc - times).equals(pd.TimedeltaIndex(['1h', '1h']))
+    assert cpvdata.parse_datestr(datestr[1:], format='%d-%b-%Y %H:%M:%S')[
+        0] == pd.Timestamp('2019-05-30 10:05')
+    assert len(cpvdata.parse_datestr([])) == 0
+
+
+def test_datenum_to_datetime():
+    datenum = np.array([737385.5, 737385.0 + 1 / 86400., 735390.606 + 1e-11])
+
+    times = cpvdata.datenum_to_datetime(datenum)
+
+    expected = [datetime.datetime.fromordinal(int(value) - 366)
+                + datetime.timedelta(days=value % 1) for value in datenum]
+    assert list(times) == [pd.Timestamp(date).round('s') for date in expected]
+
+
+def test_read_datestr_shipped():
+    times = cpvdata.read_datestr(data_file('insolight_datestr_may.txt'))
+
+    assert len(times) == 7926
+    assert times.tz is None
+    assert times.is_monotonic_increasing
+
+
+def test_join_insolight_geonica_matches_data_file():
+    insolight = cpvdata.read_insolight_preseries(data_file(
+        'Insolight Preseries outdoor monitoring - IES rooftop - UPM.txt'))
+    geonica = cpvdata.read_geonica(data_file('geonica2018.txt'))
+
+    table = cpvdata.join_insolight_geonica(insolight, geonica)
+
+    # The Data File was written by MATLAB with 5 significant digits.
+    expected = np.loadtxt(data_file('insolight_data.txt'), delimiter=',')
+    np.testing.assert_allclose(table.values, expected, rtol=5e-5)
+    assert table.names == list(cpvdata.INSOLIGHT_COLUMNS)
+    assert table.times.tz_localize(None).equals(
+        cpvdata.read_datestr(data_file('insolight_datestr.txt')))
+
+
+def test_join_measurements_matches_nested_loop(rng):
+    left_times = pd.date_range('2019-05-01', periods=200, freq='min',
+                               tz='Europe/Madrid')
+    right_times = pd.date_range('2019-04-30 21:50', periods=300,
+                                freq='37s', tz='UTC')
+    left = pd.DataFrame({'a': rng.normal(size=200)}, index=left_times)
+    right = pd.DataFrame({'a': rng.normal(size=300),
+                          'b': rng.normal(size=300)}, index=right_times)
+
+    joined = cpvdata.join_measurements(left, right, tolerance='15s')
+
+    rows = []
+    for time, a in zip(left_times, left['a']):
+        distance = np.abs((right_times - time).total_seconds())
+        nearest = np.argmin(distance)
+        if distance[nearest] <= 15:
+            rows.append((time, a, right['a'][nearest], right['b'][nearest]))
+    assert len(joined) == len(rows) > 0
+    assert list(joined.index) == [row[0] for row in rows]
+    np.testing.assert_array_equal(joined.to_numpy(),
+                                  [row[1:] for row in rows])
+    assert list(joined.columns) == ['a', 'a_right', 'b']
+
+
+def test_measurement_table_columns():
+    table = MeasurementTable(np.arange(12.0).reshape(4, 3), names=['a', 'b'],
+                             extra_columns=1)
+
+    assert table.names == ['a', 'b', 'airmass']
+    assert table.capacity == 4
+    assert table['b'].flags.c_contiguous
+    assert table[1, 2] == 5.0
+
+    table['zenith'] = 1.0
+    buffer = table._buffer
+    table['azimuth'] = [1, 2, 3, 4]
+    assert table.capacity == 8
+    table['aoi'] = 0
+    assert table._buffer is not buffer
+    np.testing.assert_array_equal(table['azimuth'], [1, 2, 3, 4])
+    assert table.shape == (4, 6)
+
+    table['a'][:] = -1
+    np.testing.assert_array_equal(table.values[:, 0], -1)
+
+    with pytest.raises(ValueError, match='not unique'):
+        MeasurementTable(np.ones((2, 2)), names=['a', 'a'])
+    with pytest.raises(ValueError, match='3 names'):
+        MeasurementTable(np.ones((2, 2)), names=['a', 'b', 'c'])
+    with pytest.raises(ValueError, match='times'):
+        MeasurementTable(np.ones((2, 2)),
+                         times=pd.date_range('2019', periods=3))
+
+
+def test_measurement_table_select_and_dataframe():
+    times = pd.date_range('2019-05-01', periods=5, freq='min', tz='UTC')
+    table = MeasurementTable(np.arange(10.0).reshape(5, 2),
+                             names=['a', 'b'], times=times)
+    table.add_columns({'airmass_relative': np.ones(5)},
+                      names={'airmass_relative': 'airmass'})
+
+    selected = table.select(table['a'] > 3)
+    frame = selected.to_dataframe()
+
+    assert selected.times.equals(times[2:])
+    assert list(frame.columns) == ['a', 'b', 'airmass']
+    np.testing.assert_array_equal(frame['b'], [5, 7, 9])
+    selected['a'][:] = 0
+    assert table['a'][2] == 4
+
+
+def test_filter_matches_data_file(store):
+    table = MeasurementTable.from_file(
+        data_file('insolight_data_complete_may.txt'),
+        schema='insolight_may', store=store)
+
+    filtered, rejections = cpvdata.filter_measurements(table,
+                                                       'insolight_may')
+
+    expected = np.loadtxt(
+        data_file('insolight_data_filtered_complete_may.txt'), delimiter=',')
+    np.testing.assert_allclose(filtered.values, expected, rtol=1e-4,
+                               atol=1e-2)
+    assert list(rejections) == ['{} {} {}'.format(*rule) for rule in
+                                cpvdata.FILTER_PRESETS['insolight_may']]
+    assert rejections['wind_speed < 10'] == 0
+
+
+def test_get_filter_mask_matches_manual(rng):
+    data = {'a': rng.uniform(0, 2, 500), 'b': rng.uniform(1, 3, 500),
+            'c': rng.normal(size=500)}
+    data['c'][:10] = np.nan
+    rules = (('a/b', '<', 0.5), ('c', '>', 'mean'), ('c', '<=', 'median'),
+             ('a', '!=', 1.0))
+
+    mask, rejections = cpvdata.get_filter_mask(data, rules)
+
+    ratio = data['a'] / data['b']
+    c = data['c']
+    with np.errstate(invalid='ignore'):
+        expected = ((ratio < 0.5) & (c > np.nanmean(c))
+                    & (c <= np.nanmedian(c)) & (data['a'] != 1.0))
+    np.testing.assert_array_equal(mask, expected)
+    assert rejections['a/b < 0.5'] == np.count_nonzero(ratio >= 0.5)
+    assert rejections['c > mean'] >= 10
+
+    with pytest.raises(ValueError):
+        cpvdata.get_filter_mask(data, ())
+    with pytest.raises(KeyError):
+        cpvdata.get_column(data, 'd')
+
+
+@pytest.mark.parametrize('stratum, filename', [
+    ('nontemp', 'insolight_nontemp_measurements.txt'),
+    ('nonairmass', 'insolight_nonairmass_measurements.txt')])
+def test_stratum_matches_data_file(store, stratum, filename):
+    table = MeasurementTable.from_file(
+        data_file('insolight_data_filtered_complete.txt'),
+        schema='insolight', store=store)
+
+    mask, bands = cpvdata.get_stratum_mask(
+        table, cpvdata.STRATUM_PRESETS['insolight'][stratum])
+
+    expected = np.loadtxt(data_file(filename), delimiter=',')
+    np.testing.assert_array_equal(table.values[mask], expected)
+    assert len(bands) == 1
+
+
+def test_get_stratum_mask_n_samples(rng):
+    data = {'x': rng.normal(size=1000), 'y': rng.normal(5, 2, 1000)}
+    mask = data['x'] < 1
+
+    stratum, bands = cpvdata.get_stratum_mask(
+        data, {'x': 'mean', 'y': 5.0}, n_samples=100, mask=mask)
+
+    assert np.count_nonzero(stratum) == 100
+    assert not np.any(stratum & ~mask)
+    for column, (low, high) in bands.items():
+        values = data[column][stratum]
+        assert np.all((values >= low) & (values <= high))
+    assert bands['x'][0] + bands['x'][1] == pytest.approx(
+        2 * data['x'][mask].mean())
+
+    with pytest.raises(ValueError, match='n_samples'):
+        cpvdata.get_stratum_mask(data, {'x': 'mean'})
+
+
+def test_iter_strata_matches_masks(rng):
+    values = rng.uniform(0, 10, 1000)
+    values[:5] = np.nan
+    mask = rng.rand(1000) < 0.8
+    edges = [1, 2.5, 4, 10]
+
+    strata = list(cpvdata.iter_strata({'x': values}, 'x', edges, mask=mask))
+
+    assert len(strata) == 3
+    for (low, high, stratum), expected_low, expected_high in zip(
+            strata, edges[:-1], edges[1:]):
+        with np.errstate(invalid='ignore'):
+            expected = mask & (values >= expected_low) & (values <
+                                                          expected_high)
+        assert (low, high) == (expected_low, expected_high)
+        np.testing.assert_array_equal(stratum, expected)
+
+
+def test_data_store_matches_loadtxt(tmp_path, store, rng):
+    values = rng.normal(size=(300, 4))
+    filename = write_text(tmp_path / 'data.txt', values)
+
+    data = store.load(filename, names=['a', 'b', 'c', 'd'])
+
+    np.testing.assert_array_equal(data, np.loadtxt(filename, delimiter=',',
+                                                   ndmin=2))
+    assert isinstance(data, np.memmap) and np.isfortran(data)
+    columns = store.columns(filename)
+    assert list(columns) == ['a', 'b', 'c', 'd']
+    np.testing.assert_array_equal(columns['c'], values[:, 2])
+    assert store.schema(filename)['shape'] == [300, 4]
+
+
+def test_data_store_reuses_and_rebuilds(tmp_path, store, monkeypatch):
+    filename = write_text(tmp_path / 'data.txt', [[1, 2], [3, 4]])
+    store.load(filename)
+
+    conversions = []
+    convert = DataStore._convert
+    monkeypatch.setattr(DataStore, '_convert', lambda self, *args: (
+        conversions.append(args[0]) or convert(self, *args)))
+
+    store.load(filename)
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    store.load(filename)
+    assert conversions == []
+    assert store.schema(filename)['mtime_ns'] == stat.st_mtime_ns + 10**9
+
+    write_text(tmp_path / 'data.txt', [[1, 2], [3, 5]])
+    np.testing.assert_array_equal(store.load(filename), [[1, 2], [3, 5]])
+    assert conversions == [filename]
+
+
+def test_data_store_default_path(tmp_path):
+    filename = write_text(tmp_path / 'data.txt', [[1, 2, 3]])
+
+    data = cpvdata.load_data(filename, store=DataStore())
+
+    assert data.shape == (1, 3)
+    assert os.path.isdir(str(tmp_path / '.cpvstore'))
+
+
+def test_iter_measurements_matches_table(store):
+    filename = data_file('insolight_data_may.txt')
+    datestr_filename = data_file('insolight_datestr_may.txt')
+
+    chunks = list(cpvdata.iter_measurements(
+        filename, schema='insolight_may', datestr_filename=datestr_filename,
+        tz='UTC', chunk_rows=1000, store=store))
+    table = MeasurementTable.from_file(filename, schema='insolight_may',
+                                       store=store)
+
+    assert [len(chunk) for chunk in chunks] == [1000] * 7 + [926]
+    assert chunks[0].names == table.names
+    np.testing.assert_array_equal(
+        np.concatenate([chunk.values for chunk in chunks]), table.values)
+    times = chunks[0].times.append([chunk.times for chunk in chunks[1:]])
+    assert times.equals(cpvdata.read_datestr(datestr_filename, tz='UTC'))
+
+
+def test_iter_measurements_missing_dates(tmp_path, store):
+    filename = write_text(tmp_path / 'data.txt', [[1.0], [2.0]])
+    datestr_filename = write_text(tmp_path / 'dates.txt',
+                                  [['01-May-2019 10:00']])
+
+    with pytest.raises(ValueError, match='fewer dates'):
+        list(cpvdata.iter_measurements(filename,
+                                       datestr_filename=datestr_filename,
+                                       store=store))
+
+
+def test_write_measurements_round_trip(tmp_path, store):
+    times = pd.date_range('2019-05-01 10:00', periods=6, freq='min')
+    table = MeasurementTable(np.arange(12.0).reshape(6, 2) / 3,
+                             names=['a', 'b'], times=times)
+    filename = str(tmp_path / 'out.txt')
+    datestr_filename = str(tmp_path / 'out_datestr.txt')
+
+    cpvdata.write_measurements(table.select(slice(0, 4)), filename,
+                               datestr_filename)
+    cpvdata.write_measurements(table.select(slice(4, None)), filename,
+                               datestr_filename, mode='a')
+
+    np.testing.assert_allclose(cpvdata.load_data(filename, store=store),
+                               table.values, atol=1e-10)
+    assert cpvdata.read_datestr(datestr_filename).equals(times)
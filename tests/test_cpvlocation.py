@@ -0,0 +1,215 @@
+"""
+Tests of cpvlocation: the solar geometry cache against pvlib, and the block
+model chain of the located systems against the steps run one by one.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cpvdata
+from cpvlocation import SolarGeometryCache, SOLAR_GEOMETRY_COLUMNS
+from cpvsystem import CPVSystem, StaticCPVSystem, get_simple_util_factor
+
+from benchmarks.bench_hot_paths import M300_PARAMS
+
+UF = {'airmass': (2.0, 0.1, -0.1, 0.5), 'temp_air': (20, 0.01, 0.01, 0.5),
+      'aoi': (50, -0.005, -0.02, 0.0)}
+
+
+@pytest.fixture
+def times():
+    return pd.date_range('2019-05-01 04:00', periods=200, freq='5min',
+                         tz='UTC')
+
+
+@pytest.fixture
+def static_system(location):
+    return StaticCPVSystem(
+        surface_tilt=30, surface_azimuth=180, module_parameters=M300_PARAMS,
+        racking_model='insulated').localize(
+            location, solar_cache=SolarGeometryCache())
+
+
+@pytest.fixture
+def weather(times, rng):
+    n = len(times)
+    return pd.DataFrame({'gii': rng.uniform(600, 1000, n),
+                         'dii': rng.uniform(600, 900, n),
+                         'temp_air': rng.uniform(5, 35, n),
+                         'wind_speed': rng.uniform(0, 5, n)}, index=times)
+
+
+def pvlib_geometry(location, times):
+    solar_position = location.get_solarposition(times)
+    airmass = location.get_airmass(solar_position=solar_position)
+    return pd.concat([solar_position, airmass], axis=1)[
+        list(SOLAR_GEOMETRY_COLUMNS)]
+
+
+def test_cache_matches_pvlib(location, times):
+    cache = SolarGeometryCache()
+    # Unsorted and repeated times, over two UTC days.
+    query = times[::-1].append(times[:10]).append(times + pd.Timedelta('1d'))
+
+    geometry = cache.get(location, query)
+
+    pd.testing.assert_frame_equal(geometry, pvlib_geometry(location, query))
+    assert len(cache._blocks) == 2
+
+
+def test_cache_calculates_only_missing_times(location, times, monkeypatch):
+    import cpvlocation
+    calculated = []
+    calc = cpvlocation._calc_solar_geometry
+
+    def counted(location, stamps, *args):
+        calculated.append(len(stamps))
+        return calc(location, stamps, *args)
+
+    monkeypatch.setattr(cpvlocation, '_calc_solar_geometry', counted)
+    cache = SolarGeometryCache()
+
+    cache.get(location, times[:100])
+    geometry = cache.get(location, times)
+    cache.get(location, times[50:150])
+
+    assert calculated == [100, 100]
+    pd.testing.assert_frame_equal(geometry, pvlib_geometry(location, times))
+
+
+def test_cache_on_disk(location, times, tmp_path, monkeypatch):
+    import cpvlocation
+    path = str(tmp_path / 'geometry')
+    expected = SolarGeometryCache(path).get(location, times)
+
+    def fail(*args):
+        raise AssertionError('the stored block is calculated again')
+
+    monkeypatch.setattr(cpvlocation, '_calc_solar_geometry', fail)
+    cache = SolarGeometryCache(path)
+
+    pd.testing.assert_frame_equal(cache.get(location, times), expected)
+    cache.clear()
+    assert not cache._blocks
+    pd.testing.assert_frame_equal(cache.get(location, times), expected)
+
+
+def test_cache_keys_site_and_model(location, times):
+    from pvlib.location import Location
+    cache = SolarGeometryCache()
+    other = Location(latitude=37.0, longitude=-3.727, altitude=658)
+
+    cache.get(location, times)
+    geometry = cache.get(other, times)
+    airmass = cache.get(location, times, airmass_model='simple')
+
+    pd.testing.assert_frame_equal(geometry, pvlib_geometry(other, times))
+    np.testing.assert_allclose(
+        airmass['airmass_relative'],
+        location.get_airmass(times, model='simple')['airmass_relative'])
+    assert len(cache._blocks) == 3
+
+
+def test_cache_max_blocks(location):
+    cache = SolarGeometryCache(max_blocks=2)
+    days = pd.date_range('2019-05-01 12:00', periods=3, freq='1d', tz='UTC')
+
+    for day in days:
+        cache.get(location, [day])
+    cache.get(location, days[1:2])
+
+    assert [key[-1] for key in cache._blocks] == [
+        day.value // (86400 * 10**9) for day in days[[2, 1]]]
+
+
+def test_cache_naive_times_are_utc(location, times):
+    cache = SolarGeometryCache()
+
+    naive = cache.get(location, times.tz_localize(None))
+
+    np.testing.assert_array_equal(naive.values,
+                                  cache.get(location, times).values)
+
+
+def test_run_model_matches_chain(static_system, weather):
+    results = static_system.run_model(
+        weather, UF, outputs=('temp_cell', 'i_sc', 'p_mp', 'uf', 'p_mp_uf',
+                              'airmass', 'aoi'), block_size=70)
+
+    geometry = static_system.get_solar_geometry(weather.index)
+    temp_cell = static_system.pvsyst_celltemp(
+        weather['gii'], weather['temp_air'], weather['wind_speed'])
+    dc = static_system.singlediode(*static_system.calcparams_pvsyst(
+        weather['dii'], temp_cell))
+    uf = static_system.get_static_utilization_factor(
+        geometry['airmass_relative'].values, *UF['airmass'],
+        weather['temp_air'].values, *UF['temp_air'], geometry['aoi'].values,
+        *UF['aoi'][:3], normalize_aoi=False)
+
+    np.testing.assert_allclose(results['temp_cell'], temp_cell)
+    np.testing.assert_allclose(results['i_sc'], dc['i_sc'])
+    np.testing.assert_allclose(results['p_mp'], dc['p_mp'])
+    np.testing.assert_allclose(results['uf'], uf)
+    np.testing.assert_allclose(results['p_mp_uf'], dc['p_mp'] * uf)
+    np.testing.assert_array_equal(results['airmass'],
+                                  geometry['airmass_relative'])
+    np.testing.assert_array_equal(results['aoi'], geometry['aoi'])
+    assert results.index.equals(weather.index)
+
+
+def test_run_model_block_size(static_system, weather):
+    whole = static_system.run_model(weather, UF, block_size=len(weather))
+
+    for block_size in (1, 7, 256):
+        pd.testing.assert_frame_equal(
+            static_system.run_model(weather, UF, block_size=block_size),
+            whole)
+
+
+def test_run_model_columns(static_system, weather):
+    expected = static_system.run_model(weather, UF)
+    renamed = weather.rename(columns={'temp_air': 't_amb', 'gii': 'g'})
+    # The utilization factor inputs can also be given in the weather.
+    renamed['am'] = static_system.get_solar_geometry(
+        weather.index)['airmass_relative']
+
+    results = static_system.run_model(
+        renamed, UF, columns={'temp_air': 't_amb', 'poa_global': 'g',
+                              'airmass': 'am'})
+
+    pd.testing.assert_frame_equal(results, expected)
+
+
+def test_run_model_measurement_table(static_system, weather):
+    table = cpvdata.MeasurementTable(weather.values,
+                                     names=list(weather.columns),
+                                     times=weather.index)
+
+    pd.testing.assert_frame_equal(static_system.run_model(table, UF),
+                                  static_system.run_model(weather, UF))
+
+
+def test_run_model_tracker(location, weather):
+    system = CPVSystem(module_parameters=M300_PARAMS,
+                       racking_model='freestanding').localize(
+                           location, solar_cache=SolarGeometryCache())
+    tracked = weather.rename(columns={'gii': 'gni', 'dii': 'dni'})
+    uf = {'airmass': (2.0, 0.1, -0.1, 1.0)}
+
+    results = system.run_model(tracked, uf, outputs=('uf', 'aoi'))
+
+    geometry = system.get_solar_geometry(weather.index)
+    assert 'aoi' not in geometry
+    np.testing.assert_array_equal(results['aoi'], 0)
+    np.testing.assert_allclose(results['uf'], get_simple_util_factor(
+        geometry['airmass_relative'].values, *uf['airmass'][:3]))
+
+
+def test_run_model_errors(static_system, weather):
+    with pytest.raises(ValueError, match='Unknown model outputs'):
+        static_system.run_model(weather, outputs=('p_max',))
+    with pytest.raises(ValueError, match='utilization factors'):
+        static_system.run_model(weather, outputs=('uf',))
+    with pytest.raises(ValueError, match='times'):
+        static_system.run_model(weather.to_dict('series'), UF)
@@ -0,0 +1,356 @@
+"""
+Tests of cpvpipeline: the stage cache of the Pipeline, and the workflow of
+the shipped Insolight data against the Data Files and the searches of the
+original scripts, in memory, in parallel and chunk by chunk.
+"""
+
+import os
+import statistics
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cpvdata
+import cpvpipeline
+from cpvpipeline import Pipeline
+from cpvsystem import CPVSystem, StaticCPVSystem
+
+from benchmarks.bench_pvsyst import INSOLIGHT_PARAMS
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Data Files')
+
+DATA_FILE = os.path.join(DATA_DIR, 'insolight_data.txt')
+DATESTR_FILE = os.path.join(DATA_DIR, 'insolight_datestr.txt')
+
+
+def data_file(name):
+    return np.loadtxt(os.path.join(DATA_DIR, name), delimiter=',')
+
+
+def sklearn_line(x, y):
+    from sklearn import linear_model
+    model = linear_model.LinearRegression().fit(np.asarray(x)[:, None], y)
+    return model.coef_[0], model.intercept_
+
+
+@pytest.fixture(scope='module')
+def system():
+    return CPVSystem(module_parameters=INSOLIGHT_PARAMS,
+                     racking_model='freestanding')
+
+
+@pytest.fixture(scope='module')
+def workflow(system, location):
+    pipeline = cpvpipeline.make_uf_pipeline(DATA_FILE, DATESTR_FILE, system,
+                                            location)
+    return pipeline.run()
+
+
+@pytest.fixture
+def counted():
+    calls = []
+
+    def stage(name):
+        def func(*args, **params):
+            calls.append(name)
+            return (name, args, sorted(params.items()))
+        return func
+
+    return calls, stage
+
+
+def test_pipeline_runs_only_stale_stages(counted):
+    calls, stage = counted
+    pipeline = Pipeline()
+    pipeline.set_input('x', np.arange(3))
+    pipeline.add_stage('a', stage('a'), ('x',), {'k': 1})
+    pipeline.add_stage('b', stage('b'), ('a',))
+    pipeline.add_stage('c', stage('c'), ('x',))
+
+    pipeline.run()
+    assert calls == ['a', 'b', 'c']
+    assert pipeline.run('b')['b'][1][0][0] == 'a'
+    assert pipeline.executed == []
+
+    pipeline.set_params('a', k=2)
+    pipeline.run()
+    assert pipeline.executed == ['a', 'b']
+
+    pipeline.set_input('x', np.arange(3))
+    pipeline.run()
+    assert pipeline.executed == []
+    pipeline.set_input('x', np.arange(4))
+    pipeline.run(['c'])
+    assert pipeline.executed == ['c']
+
+    pipeline.invalidate('b')
+    pipeline.run()
+    assert pipeline.executed == ['a', 'b']
+    assert 'b' in pipeline and pipeline['a'][2] == [('k', 2)]
+
+
+def test_pipeline_uncached_stage(counted):
+    calls, stage = counted
+    pipeline = Pipeline()
+    pipeline.add_stage('a', stage('a'), cache=False)
+    pipeline.add_stage('b', stage('b'), ('a',))
+
+    pipeline.run()
+    pipeline.run()
+
+    assert calls == ['a', 'b', 'a']
+    assert 'a' not in pipeline
+
+
+def test_pipeline_disk_cache(tmp_path, counted):
+    calls, stage = counted
+
+    def make():
+        pipeline = Pipeline(cache_path=str(tmp_path))
+        pipeline.set_input('x', 1)
+        pipeline.add_stage('a', stage('a'), ('x',))
+        return pipeline
+
+    first = make().run()
+    second_pipeline = make()
+    second = second_pipeline.run()
+
+    assert calls == ['a']
+    assert second_pipeline.executed == []
+    assert first == second
+
+
+def test_pipeline_errors(counted):
+    _, stage = counted
+    pipeline = Pipeline()
+    pipeline.set_input('x', 1)
+    pipeline.add_stage('a', stage('a'), ('b',))
+    pipeline.add_stage('b', stage('b'), ('a',))
+    pipeline.add_stage('c', stage('c'), ('missing',))
+
+    with pytest.raises(ValueError, match='cycle'):
+        pipeline.run('a')
+    with pytest.raises(KeyError):
+        pipeline.run('c')
+    with pytest.raises(ValueError):
+        pipeline.add_stage('x', stage('x'))
+    with pytest.raises(ValueError):
+        pipeline.set_input('a', 1)
+
+
+def test_make_uf_pipeline_needs_fits(location):
+    system = StaticCPVSystem(surface_tilt=30, surface_azimuth=180,
+                             module_parameters=INSOLIGHT_PARAMS,
+                             racking_model='insulated')
+
+    with pytest.raises(ValueError, match="'insolight_may'.*uf_airmass"):
+        cpvpipeline.make_uf_pipeline(DATA_FILE, DATESTR_FILE, system,
+                                     location, source='insolight_may')
+
+
+def test_workflow_filters_as_data_file(workflow):
+    filtered, _ = workflow['filtered']
+
+    # The airmass of the Data File was written with 5 significant digits.
+    np.testing.assert_allclose(
+        filtered.values[:, :25],
+        data_file('insolight_data_filtered_complete.txt'), rtol=5e-5)
+
+
+def test_workflow_matches_original_fits(workflow):
+    # F4: medians of Isc/DNI by airmass bin of the fixed temperature
+    # measurements, and a line over the fixed airmass ones.
+    nontemp = data_file('insolight_nontemp_measurements.txt')
+    ratio = nontemp[:, 5] / nontemp[:, 14]
+    airmass = nontemp[:, 24]
+    centers, medians = [], []
+    for i in np.arange(2, 5.0, 0.1):
+        values = [ratio[j] for j in range(len(ratio))
+                  if airmass[j] > i - 0.05 and airmass[j] < i + 0.05]
+        if len(values) > 0:
+            medians.append(statistics.median(values))
+            centers.append(i)
+    centers = np.array(centers)
+    low = centers <= 4.0
+    m_low, n_low = sklearn_line(centers[low], np.array(medians)[low])
+    m_high, n_high = sklearn_line(centers[~low], np.array(medians)[~low])
+
+    nonairmass = data_file('insolight_nonairmass_measurements.txt')
+    m_temp, _ = sklearn_line(nonairmass[:, 8],
+                             nonairmass[:, 5] / nonairmass[:, 14])
+
+    # The medians move with the rounded airmass of the Data Files.
+    uf_airmass = workflow['uf_airmass']
+    assert uf_airmass['m_low'] == pytest.approx(m_low / 0.96e-3, rel=1e-3)
+    assert uf_airmass['m_high'] == pytest.approx(m_high / 0.96e-3, rel=1e-3)
+    assert uf_airmass['thld'] == pytest.approx(
+        (n_high - n_low) / (m_low - m_high), rel=1e-3)
+    assert workflow['uf_temp_air']['m_low'] == pytest.approx(
+        m_temp / 0.96e-3, rel=1e-3)
+
+
+def test_workflow_weights_match_grid_search(workflow):
+    filtered, _ = workflow['filtered']
+    prediction = workflow['prediction']
+    weights, rmsd = workflow['uf_weights']
+
+    # F5: search of the airmass weight in steps of 0.05.
+    ufs = cpvpipeline._get_ufs(filtered, workflow['uf_airmass'],
+                               workflow['uf_temp_air'])
+    grid = []
+    for weight_am in np.arange(0, 1, 0.05):
+        modeled = prediction['p_mp'] * (weight_am * ufs[0]
+                                        + (1 - weight_am) * ufs[1])
+        grid.append((np.sqrt(np.mean((filtered['p_mp'] - modeled) ** 2)),
+                     weight_am))
+    grid_rmsd, grid_weight = min(grid)
+
+    assert weights.sum() == pytest.approx(1)
+    assert abs(weights[0] - grid_weight) <= 0.05
+    assert rmsd <= grid_rmsd
+    assert rmsd == pytest.approx(
+        np.sqrt(np.mean(prediction['residuals'] ** 2)), rel=1e-6)
+    np.testing.assert_allclose(prediction['p_mp_uf'],
+                               prediction['p_mp'] * prediction['uf'])
+
+
+def test_calibrate_table_matches_workflow(workflow, system):
+    filtered, _ = workflow['filtered']
+
+    calibration = cpvpipeline.calibrate_table(filtered, 'insolight', system)
+
+    assert calibration['n_rows'] == len(filtered)
+    for prefix, fit in (('am', 'uf_airmass'), ('ta', 'uf_temp_air')):
+        for key, value in workflow[fit].items():
+            assert calibration['{}_{}'.format(prefix, key)] == value
+    assert (calibration['am_weight'],
+            calibration['ta_weight']) == tuple(workflow['uf_weights'][0])
+
+
+def test_calibrate_chunked_matches_table(workflow, system, location, store):
+    filtered, _ = workflow['filtered']
+    expected = cpvpipeline.calibrate_table(filtered, 'insolight', system)
+
+    calibration = cpvpipeline.calibrate_chunked(
+        DATA_FILE, DATESTR_FILE, location, system=system, chunk_rows=5000,
+        store=store)
+
+    assert list(calibration) == list(expected)
+    assert calibration['n_rows'] == expected['n_rows']
+    # The medians of the chunks are taken from histograms.
+    for key in ('am_thld', 'am_m_low', 'am_m_high'):
+        assert calibration[key] == pytest.approx(expected[key], rel=1e-2)
+    for key in ('ta_thld', 'ta_m_low', 'ta_m_high'):
+        assert calibration[key] == pytest.approx(expected[key], rel=1e-9)
+    assert calibration['am_weight'] == pytest.approx(expected['am_weight'],
+                                                     abs=1e-3)
+    assert calibration['rmsd'] == pytest.approx(expected['rmsd'], rel=1e-4)
+
+
+def test_predict_chunked_matches_workflow(workflow, system, location, store,
+                                          tmp_path):
+    prediction = workflow['prediction']
+    calibration = cpvpipeline.calibrate_table(workflow['filtered'][0],
+                                              'insolight', system)
+    output_file = str(tmp_path / 'prediction.txt')
+
+    summary = cpvpipeline.predict_chunked(
+        DATA_FILE, DATESTR_FILE, system, location, calibration,
+        output_file=output_file, chunk_rows=5000, store=store)
+
+    assert summary['n_rows'] == len(prediction)
+    assert summary['rmsd'] == pytest.approx(
+        np.sqrt(np.mean(prediction['residuals'] ** 2)), rel=1e-9)
+    assert summary['bias'] == pytest.approx(prediction['residuals'].mean(),
+                                            rel=1e-9)
+    assert summary['rejections'] == workflow['filtered'][1]
+    written = np.loadtxt(output_file, delimiter=',')
+    np.testing.assert_allclose(written[:, -1], prediction['p_mp_uf'],
+                               rtol=1e-9)
+
+
+def test_calibrate_uf_matches_table(workflow, system):
+    filtered, _ = workflow['filtered']
+    tables = {'insolight': filtered}
+    jobs = cpvpipeline.make_calibration_jobs(tables, 'insolight',
+                                             {'insolight': system},
+                                             freq='MS')
+
+    serial = cpvpipeline.calibrate_uf(tables, jobs, max_workers=1)
+    parallel = cpvpipeline.calibrate_uf(tables, jobs, max_workers=2)
+
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert serial['n_rows'].sum() == len(filtered)
+    for job, (_, row) in zip(jobs, serial.iterrows()):
+        assert row['name'] == job['name']
+        window = ((filtered.times >= job['start'])
+                  & (filtered.times < job['stop']))
+        expected = cpvpipeline.calibrate_table(filtered.select(window),
+                                               'insolight', system)
+        for key, value in expected.items():
+            assert row[key] == pytest.approx(value, rel=1e-9), key
+
+
+def test_calibrate_uf_missing_columns():
+    table = cpvdata.MeasurementTable(np.ones((5, 3)),
+                                     names=['airmass', 'temp_air', 'i_sc'])
+
+    with pytest.raises(KeyError, match='dni'):
+        cpvpipeline.calibrate_uf({'a': table},
+                                 [{'table': 'a', 'source': 'insolight'}],
+                                 max_workers=2)
+
+
+def test_make_calibration_jobs_windows():
+    times = pd.date_range('2019-04-28 10:00', '2019-06-02', freq='6h',
+                          tz='UTC')
+    table = cpvdata.MeasurementTable(np.ones((len(times), 1)), names=['a'],
+                                     times=times)
+
+    jobs = cpvpipeline.make_calibration_jobs({'t': table}, 'insolight',
+                                             freq='MS')
+
+    assert [job['name'] for job in jobs] == ['t 2019-04-28', 't 2019-05-01',
+                                             't 2019-06-01']
+    assert jobs[0]['start'] <= times[0] and jobs[-1]['stop'] > times[-1]
+    assert all(a['stop'] == b['start'] for a, b in zip(jobs, jobs[1:]))
+
+
+def test_filter_rules_chunk_by_chunk(store):
+    chunks = list(cpvdata.iter_measurements(
+        os.path.join(DATA_DIR, 'm300_data_filtered.txt'), schema='m300',
+        chunk_rows=3000, store=store))
+    table = cpvdata.MeasurementTable.from_file(
+        os.path.join(DATA_DIR, 'm300_data_filtered.txt'), schema='m300',
+        store=store)
+
+    rules = cpvpipeline.resolve_filter_rules(chunks, 'm300')
+    filtered = list(cpvpipeline.iter_filtered_measurements(chunks, rules))
+
+    expected, _ = cpvdata.filter_measurements(table, 'm300')
+    assert rules[0][2] == pytest.approx(np.nanmean(table['tracking_error']))
+    np.testing.assert_array_equal(
+        np.concatenate([chunk.values for chunk, _ in filtered]),
+        expected.values)
+    with pytest.raises(ValueError, match='resolve_filter_rules'):
+        next(cpvpipeline.iter_filtered_measurements(chunks, 'm300'))
+
+
+def test_make_uf_evaluator_matches_static_factor(rng):
+    system = StaticCPVSystem(surface_tilt=30, surface_azimuth=180)
+    calibration = {'am_thld': 2.0, 'am_m_low': 0.1, 'am_m_high': -0.1,
+                   'am_weight': 0.6, 'ta_thld': 20, 'ta_m_low': 0.01,
+                   'ta_m_high': 0.0, 'ta_weight': 0.4, 'aoi_thld': 50,
+                   'aoi_m_low': -0.005, 'aoi_m_high': -0.02}
+    data = {'airmass': rng.uniform(1, 5, 100),
+            'temp_air': rng.uniform(0, 40, 100),
+            'aoi': rng.uniform(0, 100, 100)}
+
+    uf = cpvpipeline.make_uf_evaluator(calibration)(data)
+
+    expected = system.get_static_utilization_factor(
+        data['airmass'], 2.0, 0.1, -0.1, 0.6, data['temp_air'], 20, 0.01,
+        0.0, 0.4, data['aoi'], 50, -0.005, -0.02, normalize_aoi=False)
+    np.testing.assert_allclose(uf, expected, rtol=1e-12, atol=1e-15)
@@ -0,0 +1,721 @@
+"""
+Tests of cpvsystem: the vectorized and closed-form calcs are compared with
+the loops and searches of the original scripts, and with pvlib.
+"""
+
+import json
+import math
+import statistics
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from pvlib import pvsystem
+
+import cpvsystem
+from cpvsystem import (BinnedStatAccumulator, CPVSystem, OnlineUFFitter,
+                       Profiler, RegressionAccumulator, RMSDAccumulator,
+                       StaticCPVSystem, StreamingPredictor, UFEvaluator,
+                       UFWeightsAccumulator)
+
+from benchmarks.bench_pvsyst import (M300_PARAMS, loop_fleet_dc,
+                                     synthetic_fleet, synthetic_weather)
+from benchmarks.bench_regression import brute_force_two_regression_lines
+from benchmarks.bench_util_factor import loop_simple_util_factor
+
+
+AM_UF = (2.1, 0.0039, -0.0303)
+TA_UF = (20.0, 0.0047, 0.0)
+DNI_UF = (800.0, 0.0001, -0.0002)
+AOI_UF = (50.0, -0.005, -0.02)
+
+
+def two_lines(x, thld, m_low, m_high, n=1.0):
+    return np.where(x <= thld, n + m_low * (x - thld), n + m_high * (x - thld))
+
+
+def exhaustive_two_regression_lines(x, y, min_samples=2):
+    """
+    Lines of the split with the lowest sum of rmsd over every split of the
+    sorted measurements, fitted one by one with sklearn.
+    """
+    best = None
+    for k in range(min_samples, len(x) - min_samples + 1):
+        low = cpvsystem.calc_regression_line(x[:k], y[:k], 'sklearn')
+        high = cpvsystem.calc_regression_line(x[k:], y[k:], 'sklearn')
+        if best is None or low[2] + high[2] < best[0]:
+            best = (low[2] + high[2], low, high)
+    _, (m_low, n_low, _), (m_high, n_high, _) = best
+    return m_low, n_low, m_high, n_high, (n_high - n_low) / (m_low - m_high)
+
+
+def grid_search_uf_weights(real_power, estimation, uf_am, uf_at, step):
+    """
+    Search of the airmass weight of the F5 scripts.
+    """
+    weight_am_final = 1.0
+    rmsd = 10000
+    for weight_am in np.arange(0, 1, step):
+        modeled_power = estimation * (weight_am * uf_am
+                                      + (1.0 - weight_am) * uf_at)
+        rmsd_temp = math.sqrt(np.mean((real_power - modeled_power) ** 2))
+        if rmsd_temp < rmsd:
+            weight_am_final = weight_am
+            rmsd = rmsd_temp
+    return weight_am_final, rmsd
+
+
+def nested_loop_medians(x, y, start, stop, width=0.1):
+    """
+    Medians by bin of the F4 scripts.
+    """
+    centers, medians = [], []
+    for i in np.arange(start, stop, width):
+        values = [y[j] for j in range(len(y))
+                  if x[j] > i - width / 2 and x[j] < i + width / 2]
+        if len(values) > 0:
+            medians.append(statistics.median(values))
+            centers.append(i)
+    return np.array(centers), np.array(medians)
+
+
+@pytest.fixture
+def uf_data(rng):
+    x = np.sort(rng.uniform(1, 5, 300))
+    y = two_lines(x, 2.5, 0.02, -0.1) + rng.normal(0, 0.01, len(x))
+    return x, y
+
+
+@pytest.fixture
+def system():
+    return CPVSystem(module_parameters=M300_PARAMS,
+                     racking_model='freestanding')
+
+
+@pytest.fixture
+def static_system():
+    return StaticCPVSystem(surface_tilt=30, surface_azimuth=180,
+                           module_parameters=M300_PARAMS,
+                           racking_model='insulated')
+
+
+def test_get_simple_util_factor_matches_loop(rng):
+    x = rng.uniform(1, 6, 1000)
+    x[:3] = AM_UF[0]
+
+    uf = cpvsystem.get_simple_util_factor(x, *AM_UF)
+
+    np.testing.assert_allclose(uf, loop_simple_util_factor(x, *AM_UF),
+                               rtol=0, atol=1e-15)
+
+
+def test_get_simple_util_factor_out_and_series(rng):
+    x = rng.uniform(1, 6, 100)
+    out = np.empty(100)
+
+    result = cpvsystem.get_simple_util_factor(x, *AM_UF, out=out)
+    series = cpvsystem.get_simple_util_factor(pd.Series(x), *AM_UF)
+
+    assert result is out
+    assert isinstance(series, pd.Series)
+    np.testing.assert_allclose(series.values, out)
+
+
+def test_get_utilization_factor_matches_loops(system, rng):
+    airmass = rng.uniform(1, 6, 500)
+    temp_air = rng.uniform(0, 40, 500)
+    dni = rng.uniform(600, 1000, 500)
+
+    uf = system.get_utilization_factor(airmass, *AM_UF, 0.4, temp_air,
+                                       *TA_UF, 0.4, dni, *DNI_UF, 0.2)
+
+    expected = (0.4 * np.array(loop_simple_util_factor(airmass, *AM_UF))
+                + 0.4 * np.array(loop_simple_util_factor(temp_air, *TA_UF))
+                + 0.2 * np.array(loop_simple_util_factor(dni, *DNI_UF)))
+    np.testing.assert_allclose(uf, expected, rtol=1e-14)
+
+
+def test_calc_two_regression_lines_matches_brute_force(rng):
+    x = np.sort(rng.uniform(1, 5, 200))
+    y = two_lines(x, 2.0, 1e-5, -8e-5, n=3.3e-3)
+
+    m_low, n_low, m_high, n_high, thld = (
+        cpvsystem.calc_two_regression_lines(x, y, None))
+    old = brute_force_two_regression_lines(x, y)
+
+    assert thld == pytest.approx(2.0, abs=1e-9)
+    assert m_low == pytest.approx(1e-5, rel=1e-6)
+    assert m_high == pytest.approx(-8e-5, rel=1e-6)
+    # The former search only tried splits every 0.1.
+    assert old[4] == pytest.approx(thld, abs=0.01)
+    assert old[2] == pytest.approx(m_high, rel=1e-6)
+
+
+def test_calc_two_regression_lines_matches_exhaustive_search(uf_data):
+    x, y = uf_data
+
+    np.testing.assert_allclose(
+        cpvsystem.calc_two_regression_lines(x, y, None),
+        exhaustive_two_regression_lines(x, y), rtol=1e-9)
+
+
+def test_calc_two_regression_lines_limit(uf_data):
+    x, y = uf_data
+    low = x <= 3.0
+
+    m_low, n_low, m_high, n_high, thld = (
+        cpvsystem.calc_two_regression_lines(x, y, 3.0))
+
+    expected_low = cpvsystem.calc_regression_line(x[low], y[low], 'sklearn')
+    expected_high = cpvsystem.calc_regression_line(x[~low], y[~low],
+                                                   'sklearn')
+    np.testing.assert_allclose((m_low, n_low), expected_low[:2], rtol=1e-9)
+    np.testing.assert_allclose((m_high, n_high), expected_high[:2],
+                               rtol=1e-9)
+    assert thld == pytest.approx((n_high - n_low) / (m_low - m_high))
+
+
+def test_calc_two_regression_lines_unsorted(uf_data):
+    x, y = uf_data
+    order = np.random.RandomState(1).permutation(len(x))
+
+    np.testing.assert_allclose(
+        cpvsystem.calc_two_regression_lines(x[order], y[order], None),
+        cpvsystem.calc_two_regression_lines(x, y, None), rtol=1e-9)
+
+
+@pytest.mark.parametrize('limit, expected', [(5.0, 5.0), (None, 1.5)])
+def test_calc_two_regression_lines_parallel(limit, expected):
+    x = np.arange(10.0)
+    y = 2 * x + 1
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        m_low, n_low, m_high, n_high, thld = (
+            cpvsystem.calc_two_regression_lines(x, y, limit))
+
+    assert m_low == pytest.approx(2) and m_high == pytest.approx(2)
+    assert thld == expected
+
+
+@pytest.mark.parametrize('min_samples', [0, 1])
+def test_calc_two_regression_lines_min_samples(uf_data, min_samples):
+    with pytest.raises(ValueError, match='min_samples'):
+        cpvsystem.calc_two_regression_lines(*uf_data, None,
+                                            min_samples=min_samples)
+
+
+def test_calc_uf_lines_temp_air(uf_data):
+    x, y = uf_data
+
+    m_low, n_low, m_high, n_high, thld = cpvsystem.calc_uf_lines(
+        x, y, 'temp_air')
+
+    m, n, _ = cpvsystem.calc_regression_line(x, y, 'sklearn')
+    assert (m_low, n_low) == pytest.approx((m, n), rel=1e-9)
+    assert (m_high, thld) == (0, 50)
+    assert n_high == pytest.approx(m * 50 + n)
+
+
+def test_calc_regression_line_matches_sklearn(uf_data):
+    np.testing.assert_allclose(
+        cpvsystem.calc_regression_line(*uf_data, 'numpy'),
+        cpvsystem.calc_regression_line(*uf_data, 'sklearn'), rtol=1e-9)
+
+
+def test_calc_regression_lines_matches_groups(uf_data):
+    x, y = uf_data
+    groups = np.floor(x)
+
+    labels, m, n, rmsd = cpvsystem.calc_regression_lines(x, y, groups)
+
+    np.testing.assert_array_equal(labels, np.unique(groups))
+    for label, line in zip(labels, zip(m, n, rmsd)):
+        group = groups == label
+        np.testing.assert_allclose(
+            line, cpvsystem.calc_regression_line(x[group], y[group],
+                                                 'sklearn'),
+            rtol=1e-8, atol=1e-12)
+
+
+def test_calc_binned_stat_matches_nested_loops(rng):
+    x = rng.uniform(1.5, 5.5, 3000)
+    y = rng.normal(3.3e-3, 1e-4, 3000)
+
+    centers, medians = cpvsystem.calc_binned_stat(x, y, 0.1, 2, 5.0)
+    expected_centers, expected_medians = nested_loop_medians(x, y, 2, 5.0)
+
+    np.testing.assert_allclose(centers, expected_centers, atol=1e-12)
+    np.testing.assert_array_equal(medians, expected_medians)
+
+
+@pytest.mark.parametrize('statistic, func', [
+    ('mean', np.mean), ('count', len),
+    ('percentile', lambda values: np.percentile(values, 90))])
+def test_calc_binned_stat_statistics(rng, statistic, func):
+    x = rng.uniform(1, 3, 1000)
+    y = rng.normal(size=1000)
+    x[:5] = np.nan
+
+    centers, values = cpvsystem.calc_binned_stat(
+        x, y, 0.25, statistic=statistic, q=90, min_samples=20)
+
+    bins = np.floor(x / 0.25 + 0.5)
+    for center, value in zip(centers, values):
+        in_bin = bins == round(center / 0.25)
+        assert np.count_nonzero(in_bin) >= 20
+        assert value == pytest.approx(func(y[in_bin]))
+
+
+def test_calc_binned_stat_errors():
+    with pytest.raises(ValueError):
+        cpvsystem.calc_binned_stat([1], [1], statistic='mode')
+    with pytest.raises(ValueError):
+        cpvsystem.calc_binned_stat([1], [1], statistic='percentile')
+
+
+def test_calc_uf_weights_matches_grid_search(system, rng):
+    n = 2000
+    airmass = rng.uniform(1, 4, n)
+    temp_air = rng.uniform(5, 35, n)
+    estimation = rng.uniform(200, 250, n)
+    uf_am = cpvsystem.get_simple_util_factor(airmass, *AM_UF)
+    uf_at = cpvsystem.get_simple_util_factor(temp_air, *TA_UF)
+    real_power = (estimation * (0.37 * uf_am + 0.63 * uf_at)
+                  + rng.normal(0, 1, n))
+
+    weights, rmsd = cpvsystem.calc_uf_weights(real_power, estimation,
+                                              [uf_am, uf_at])
+    coarse = grid_search_uf_weights(real_power, estimation, uf_am, uf_at,
+                                    0.05)
+    fine = grid_search_uf_weights(real_power, estimation, uf_am, uf_at,
+                                  1e-4)
+
+    assert weights.sum() == pytest.approx(1)
+    assert rmsd <= coarse[1]
+    assert abs(weights[0] - coarse[0]) <= 0.05
+    assert weights[0] == pytest.approx(fine[0], abs=1e-4)
+    assert rmsd == pytest.approx(fine[1], rel=1e-6)
+
+
+def test_calc_uf_weights_non_negative(rng):
+    estimation = rng.uniform(200, 250, 500)
+    ufs = rng.uniform(0.8, 1.2, (3, 500))
+    real_power = estimation * ufs[1]
+
+    weights, rmsd = cpvsystem.calc_uf_weights(real_power, estimation, ufs)
+
+    np.testing.assert_allclose(weights, [0, 1, 0], atol=1e-9)
+    # The rmsd of the normal equations is exact to sqrt(eps) of the power.
+    assert rmsd == pytest.approx(0, abs=1e-4)
+
+
+def test_calc_uf_weights_without_measurements():
+    with pytest.raises(ValueError, match='No measurements'):
+        cpvsystem.calc_uf_weights([np.nan], [1.0], [[1.0], [1.0]])
+    with pytest.raises(ValueError, match='No measurements'):
+        UFWeightsAccumulator(2).result()
+
+
+def test_uf_weights_accumulator_matches_calc(rng):
+    estimation = rng.uniform(200, 250, 900)
+    ufs = rng.uniform(0.8, 1.2, (2, 900))
+    real_power = estimation * (0.3 * ufs[0] + 0.7 * ufs[1]) + rng.normal(
+        0, 1, 900)
+
+    accumulator = UFWeightsAccumulator(2)
+    other = UFWeightsAccumulator(2)
+    accumulator.update(real_power[:400], estimation[:400], ufs[:, :400])
+    other.update(real_power[400:], estimation[400:], ufs[:, 400:])
+    accumulator.merge(other)
+
+    weights, rmsd = accumulator.result()
+    expected_weights, expected_rmsd = cpvsystem.calc_uf_weights(
+        real_power, estimation, ufs)
+    assert accumulator.count == 900
+    np.testing.assert_allclose(weights, expected_weights, rtol=1e-9)
+    assert rmsd == pytest.approx(expected_rmsd, rel=1e-9)
+
+
+def test_binned_stat_accumulator_matches_calc(rng):
+    x = rng.uniform(1.5, 5.5, 5000)
+    y = rng.normal(3.3e-3, 1e-4, 5000)
+    edges = np.linspace(y.min(), y.max(), 4097)
+
+    accumulator = BinnedStatAccumulator(0.1, 2, 5.0, edges)
+    other = BinnedStatAccumulator(0.1, 2, 5.0, edges)
+    for chunk in np.array_split(np.arange(3000), 3):
+        accumulator.update(x[chunk], y[chunk])
+    other.update(x[3000:], y[3000:])
+    accumulator.merge(other)
+
+    for statistic, atol in (('count', 0), ('mean', 1e-15),
+                            ('median', edges[1] - edges[0])):
+        centers, values = accumulator.result(statistic)
+        expected_centers, expected = cpvsystem.calc_binned_stat(
+            x, y, 0.1, 2, 5.0, statistic)
+        np.testing.assert_allclose(centers, expected_centers, atol=1e-12)
+        np.testing.assert_allclose(values, expected, rtol=0, atol=atol)
+
+
+def test_binned_stat_accumulator_errors():
+    with pytest.raises(ValueError):
+        BinnedStatAccumulator(0.1, 2, 5.0)
+    with pytest.raises(ValueError, match='same bins'):
+        BinnedStatAccumulator(0.1, 2, 5.0, [0, 1]).merge(
+            BinnedStatAccumulator(0.1, 2, 5.0, [0, 2]))
+
+
+def test_regression_accumulator_matches_calc(uf_data):
+    x, y = uf_data
+    x = x + 1e6
+
+    accumulator = RegressionAccumulator()
+    other = RegressionAccumulator()
+    accumulator.update(x[:100], y[:100])
+    other.update(x[100:], y[100:])
+    other.update([np.nan], [1.0])
+    accumulator.merge(other)
+    accumulator.merge(RegressionAccumulator())
+
+    assert accumulator.count == len(x)
+    np.testing.assert_allclose(
+        accumulator.line, cpvsystem.calc_regression_line(x, y, 'sklearn'),
+        rtol=1e-6)
+
+    with pytest.raises(ValueError, match='No measurements'):
+        RegressionAccumulator().line
+
+
+def test_rmsd_accumulator(rng):
+    estimation = rng.normal(size=100)
+    measured = rng.normal(size=100)
+    measured[0] = np.nan
+
+    accumulator = RMSDAccumulator()
+    other = RMSDAccumulator()
+    accumulator.update(estimation[:50], measured[:50])
+    other.update(estimation[50:], measured[50:])
+    accumulator.merge(other)
+
+    residuals = (estimation - measured)[1:]
+    assert accumulator.count == 99
+    assert accumulator.rmsd == pytest.approx(np.sqrt(np.mean(residuals ** 2)))
+    assert accumulator.bias == pytest.approx(residuals.mean())
+    assert np.isnan(RMSDAccumulator().rmsd)
+    assert np.isnan(RMSDAccumulator().bias)
+
+
+def test_online_uf_fitter_matches_limit(uf_data):
+    x, y = uf_data
+
+    fitter = OnlineUFFitter([3.0])
+    for chunk in np.array_split(np.arange(len(x)), 4):
+        fitter.update(x[chunk], y[chunk])
+
+    assert fitter.count == len(x)
+    assert fitter.candidate == 3.0
+    np.testing.assert_allclose(
+        fitter.params, cpvsystem.calc_two_regression_lines(x, y, 3.0),
+        rtol=1e-9)
+
+
+def test_online_uf_fitter_matches_exhaustive_candidates(uf_data):
+    x, y = uf_data
+    candidates = np.arange(1.5, 4.5, 0.1)
+
+    fitter = OnlineUFFitter(candidates)
+    other = OnlineUFFitter(candidates)
+    fitter.update(x[::2], y[::2])
+    other.update(x[1::2], y[1::2])
+    fitter.merge(other)
+
+    rmsd = [sum(cpvsystem.calc_regression_line(x[part], y[part])[2]
+                for part in (x <= candidate, x > candidate))
+            for candidate in candidates]
+    best = candidates[int(np.argmin(rmsd))]
+    assert fitter.candidate == best
+    assert fitter.rmsd == pytest.approx(min(rmsd), rel=1e-9)
+    np.testing.assert_allclose(
+        fitter.params, cpvsystem.calc_two_regression_lines(x, y, best),
+        rtol=1e-9)
+
+
+def test_online_uf_fitter_parallel_lines():
+    x = np.arange(10.0)
+
+    fitter = OnlineUFFitter([2.5, 4.5])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        params = fitter.update(x, 2 * x + 1)
+
+    assert params[4] == fitter.candidate
+    assert np.isfinite(params).all()
+
+
+def test_online_uf_fitter_errors(uf_data):
+    with pytest.raises(ValueError, match='min_samples'):
+        OnlineUFFitter([1.0], min_samples=1)
+    with pytest.raises(ValueError):
+        OnlineUFFitter([])
+
+    fitter = OnlineUFFitter([3.0])
+    assert fitter.update([1.0], [1.0]) is None
+    with pytest.raises(ValueError):
+        fitter.params
+    with pytest.raises(ValueError, match='same candidates'):
+        fitter.merge(OnlineUFFitter([2.0]))
+
+    fitter.update(*uf_data)
+    fitter.reset()
+    assert fitter.count == 0 and fitter.candidate is None
+
+
+def test_uf_evaluator_matches_utilization_factor(system, rng):
+    airmass = rng.uniform(1, 6, 70000)
+    temp_air = rng.uniform(0, 40, 70000)
+    dni = rng.uniform(600, 1000, 70000)
+
+    evaluator = UFEvaluator({'airmass': AM_UF + (0.4,),
+                             'temp_air': TA_UF + (0.4,),
+                             'dni': DNI_UF + (0.2,)})
+    out = np.empty(70000)
+    result = evaluator({'airmass': airmass, 'temp_air': temp_air,
+                        'dni': dni}, out=out)
+
+    assert result is out
+    np.testing.assert_allclose(out, system.get_utilization_factor(
+        airmass, *AM_UF, 0.4, temp_air, *TA_UF, 0.4, dni, *DNI_UF, 0.2),
+        rtol=1e-12)
+
+
+def test_uf_evaluator_matches_static_utilization_factor(static_system, rng):
+    airmass = rng.uniform(1, 6, 1000)
+    temp_air = rng.uniform(0, 40, 1000)
+    aoi = rng.uniform(0, 110, 1000)
+
+    evaluator = static_system._get_uf_evaluator({
+        'airmass': AM_UF + (0.5,), 'temp_air': TA_UF + (0.5,),
+        'aoi': AOI_UF + (0.0,)})
+    uf = evaluator({'airmass': airmass, 'temp_air': temp_air, 'aoi': aoi})
+
+    expected = static_system.get_static_utilization_factor(
+        airmass, *AM_UF, 0.5, temp_air, *TA_UF, 0.5, aoi, *AOI_UF,
+        normalize_aoi=False)
+    np.testing.assert_allclose(uf, expected, rtol=1e-12, atol=1e-15)
+    assert np.any(expected == 0)
+
+
+def test_uf_evaluator_add_function(rng):
+    x = rng.uniform(-1, 4, 1000)
+    grid = np.linspace(0, 3, 31)
+
+    evaluator = UFEvaluator()
+    evaluator.add_function('x', np.cos, grid, weight=2.0)
+
+    np.testing.assert_allclose(evaluator({'x': x}),
+                               2 * np.interp(x, grid, np.cos(grid)),
+                               atol=1e-12)
+    with pytest.raises(ValueError, match='two points'):
+        evaluator.add_function('x', np.cos, [1.0])
+
+
+def test_uf_evaluator_out_errors(rng):
+    evaluator = UFEvaluator({'airmass': AM_UF + (1.0,)})
+    airmass = rng.uniform(1, 6, (20, 2))
+
+    with pytest.raises(ValueError, match='C-contiguous'):
+        evaluator({'airmass': airmass}, out=np.empty((2, 20)).T)
+    with pytest.raises(ValueError, match='shape'):
+        evaluator({'airmass': airmass}, out=np.empty(40))
+    with pytest.raises(ValueError, match='No utilization factors'):
+        UFEvaluator()({'airmass': airmass})
+
+    out = np.empty((20, 2))
+    evaluator({'airmass': airmass}, out=out)
+    np.testing.assert_allclose(
+        out, cpvsystem.get_simple_util_factor(airmass, *AM_UF))
+
+
+@pytest.mark.parametrize('racking_model', ['freestanding', 'insulated'])
+def test_singlediode_fast_matches_pvlib(racking_model, rng):
+    system = CPVSystem(module_parameters=M300_PARAMS,
+                       racking_model=racking_model)
+    dni = np.concatenate((rng.uniform(0, 1100, 2000), [-50.0, -1.0, 0.0]))
+    temp_cell = system.pvsyst_celltemp(dni * 1.1, rng.uniform(-5, 40, 2003),
+                                       rng.uniform(0, 10, 2003))
+    diode_params = system.calcparams_pvsyst(dni, temp_cell)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        fast = cpvsystem.singlediode_fast(*diode_params)
+    exact = pvsystem.singlediode(*diode_params, method='lambertw')
+
+    assert list(fast) == list(exact)
+    for key, atol in (('i_sc', 1e-9), ('v_oc', 1e-6), ('i_mp', 1e-4),
+                      ('v_mp', 0.05), ('p_mp', 1e-4), ('i_x', 1e-9),
+                      ('i_xx', 1e-3)):
+        np.testing.assert_allclose(fast[key], exact[key], rtol=1e-6,
+                                   atol=atol, err_msg=key)
+
+
+def test_singlediode_fast_series(system):
+    dni = pd.Series([0.0, 500.0, 900.0],
+                    index=pd.date_range('2019-05-01', periods=3, freq='h'))
+    diode_params = system.calcparams_pvsyst(dni, 25.0)
+
+    dc = system.singlediode(*diode_params, method='fast')
+
+    assert isinstance(dc, pd.DataFrame)
+    assert dc.index.equals(dni.index)
+    assert list(dc.columns) == ['i_sc', 'v_oc', 'i_mp', 'v_mp', 'p_mp',
+                                'i_x', 'i_xx']
+
+
+@pytest.mark.parametrize('method, rtol', [('lambertw', 1e-9), 
+                                          ('fast', 1e-3)])
+def test_calc_fleet_dc_matches_loop(method, rtol):
+    systems = synthetic_fleet(4)
+    weather = synthetic_weather(300)
+
+    fleet = cpvsystem.calc_fleet_dc(systems, *weather, method=method)
+    loop = loop_fleet_dc(systems, *weather)
+
+    for i, system in enumerate(systems):
+        scale = {'v': system.modules_per_string,
+                 'i': system.strings_per_inverter,
+                 'p': system.modules_per_string
+                 * system.strings_per_inverter}
+        for key in ('i_sc', 'v_oc', 'i_mp', 'v_mp', 'p_mp'):
+            np.testing.assert_allclose(fleet[key][i],
+                                       loop[i][key] * scale[key[0]],
+                                       rtol=rtol, err_msg=key)
+        np.testing.assert_allclose(
+            fleet['temp_cell'][i],
+            system.pvsyst_celltemp(*np.array(weather)[1:]), rtol=1e-12)
+
+
+def test_calc_fleet_dc_table():
+    systems = synthetic_fleet(3)
+    weather = synthetic_weather(50)
+    table = {name: [system.module_parameters[name] for system in systems]
+             for name in M300_PARAMS}
+    table['racking_model'] = ['freestanding'] * 3
+    table['modules_per_string'] = [s.modules_per_string for s in systems]
+    table['strings_per_inverter'] = [s.strings_per_inverter for s in systems]
+
+    from_table = cpvsystem.calc_fleet_dc(pd.DataFrame(table), *weather)
+    from_systems = cpvsystem.calc_fleet_dc(systems, *weather)
+
+    for key in from_systems:
+        np.testing.assert_allclose(from_table[key], from_systems[key])
+
+
+def test_calc_fleet_dc_missing_parameter():
+    params = dict(M300_PARAMS)
+    del params['R_sh_exp']
+    systems = [CPVSystem(module_parameters=M300_PARAMS,
+                         racking_model='freestanding'),
+               CPVSystem(module_parameters=params,
+                         racking_model='freestanding', name='short')]
+
+    with pytest.raises(ValueError, match="'short'.*'R_sh_exp'"):
+        cpvsystem.calc_fleet_dc(systems, *synthetic_weather(10))
+
+
+def test_streaming_predictor_matches_model(system, rng):
+    n = 50
+    batch = {'gni': rng.uniform(600, 1100, n),
+             'dni': rng.uniform(600, 1000, n),
+             'temp_air': rng.uniform(0, 40, n), 'wind_speed': np.ones(n),
+             'airmass': rng.uniform(1, 5, n), 'p_mp': rng.uniform(0, 300, n)}
+    uf_params = {'airmass': AM_UF + (0.6,), 'temp_air': TA_UF + (0.4,)}
+
+    predictor = system.get_streaming_predictor(uf_params, method='lambertw')
+    prediction = predictor.predict(batch)
+
+    temp_cell = system.pvsyst_celltemp(batch['gni'], batch['temp_air'],
+                                       batch['wind_speed'])
+    p_mp = system.singlediode(*system.calcparams_pvsyst(batch['dni'],
+                                                        temp_cell))['p_mp']
+    uf = (0.6 * cpvsystem.get_simple_util_factor(batch['airmass'], *AM_UF)
+          + 0.4 * cpvsystem.get_simple_util_factor(batch['temp_air'],
+                                                   *TA_UF))
+    np.testing.assert_allclose(prediction['p_mp'], p_mp)
+    np.testing.assert_allclose(prediction['uf'], uf, rtol=1e-12)
+    np.testing.assert_allclose(prediction['residuals'],
+                               p_mp * uf - batch['p_mp'], rtol=1e-9)
+
+    records = [{name: values[i] for name, values in batch.items()}
+               for i in range(n)]
+    streamed = list(predictor.stream(records, batch_size=7))
+    assert len(streamed) == n
+    np.testing.assert_allclose([sample['p_mp_uf'] for sample in streamed],
+                               prediction['p_mp_uf'])
+
+
+def test_streaming_predictor_static_aoi(static_system, rng):
+    n = 30
+    zenith = rng.uniform(10, 80, n)
+    azimuth = rng.uniform(90, 270, n)
+    batch = {'gni': np.full(n, 900.0), 'dni': np.full(n, 850.0),
+             'temp_air': rng.uniform(0, 40, n), 'wind_speed': np.ones(n),
+             'airmass': rng.uniform(1, 5, n), 'zenith': zenith,
+             'azimuth': azimuth}
+    uf_params = {'airmass': AM_UF + (0.5,), 'temp_air': TA_UF + (0.5,),
+                 'aoi': AOI_UF + (0.0,)}
+
+    prediction = StreamingPredictor(static_system, uf_params).predict(batch)
+
+    aoi = static_system.get_aoi(zenith, azimuth)
+    expected = static_system.get_static_utilization_factor(
+        batch['airmass'], *AM_UF, 0.5, batch['temp_air'], *TA_UF, 0.5,
+        np.asarray(aoi), *AOI_UF, normalize_aoi=False)
+    np.testing.assert_allclose(prediction['uf'], expected, rtol=1e-12)
+    assert np.isnan(prediction['residuals']).all()
+
+
+def test_profiler_records_and_restores(system, rng, tmp_path):
+    original = cpvsystem.get_simple_util_factor
+    original_method = CPVSystem.get_utilization_factor
+    x = rng.uniform(1, 6, 1000)
+
+    with Profiler(memory=True) as profiler:
+        assert cpvsystem.get_simple_util_factor is not original
+        cpvsystem.get_simple_util_factor(x, *AM_UF)
+        system.get_utilization_factor(x, *AM_UF, 0.5, x, *TA_UF, 0.5, x,
+                                      *DNI_UF, 0.0)
+        with pytest.raises(RuntimeError):
+            Profiler().enable()
+
+    assert cpvsystem.get_simple_util_factor is original
+    assert CPVSystem.get_utilization_factor is original_method
+    assert not profiler.enabled
+
+    report = profiler.report()
+    functions = {row['name']: row for row in report['functions']}
+    simple = functions['cpvsystem.get_simple_util_factor']
+    method = functions['cpvsystem.CPVSystem.get_utilization_factor']
+    assert simple['calls'] == 4
+    assert simple['input_elements'] >= 4 * 1000
+    assert method['calls'] == 1
+    assert method['self_time'] <= method['time']
+    assert 'peak_bytes' in simple
+
+    profiler.to_json(str(tmp_path / 'profile.json'))
+    with open(str(tmp_path / 'profile.json')) as f:
+        assert json.load(f) == json.loads(profiler.to_json())
+
+    profiler.reset()
+    assert profiler.report()['functions'] == []
+
+
+def test_lazy_attributes():
+    import cpvdata
+    import cpvlocation
+
+    assert cpvsystem.LocalizedCPVSystem is cpvlocation.LocalizedCPVSystem
+    assert cpvsystem.MeasurementTable is cpvdata.MeasurementTable
+    with pytest.raises(AttributeError):
+        cpvsystem.missing_attribute